@@ -0,0 +1,4 @@
+# Benchmarks and fixture tooling for the landcrawler project.
+#
+# Run a benchmark as a module from the project root, e.g.:
+#     python -m benchmarks.bench_serverstate
@@ -0,0 +1,67 @@
+"""Benchmark: adaptive concurrency against fixed concurrency on an overloaded site.
+
+    python -m benchmarks.bench_adaptive [--pages 1500] [--capacity 8] [--latency-ms 100]
+
+Crawls the local mock site, which answers 429 above ``--capacity``
+concurrent requests and fails or blanks a share of pages, with
+PropertyDetailsSpider at fixed concurrencies and with
+AdaptiveConcurrencyMiddleware. Reports items/sec, error responses and
+the concurrency the controller settled on, followed by its adjustments.
+
+"""
+import argparse
+import pathlib
+import tempfile
+
+from benchmarks import crawl, mocksite
+from landcrawler.spiders.land import PROPERTY_DETAILS_FILE, PROPERTY_LINKS_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=1500)
+    parser.add_argument('--capacity', type=int, default=8)
+    parser.add_argument('--latency-ms', type=int, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.005)
+    parser.add_argument('--blank-rate', type=float, default=0.005)
+    parser.add_argument('--fixed', type=int, nargs='+', default=[2, 32])
+    args = parser.parse_args()
+
+    port = crawl.free_port()
+    server = mocksite.start(port, latency_ms=args.latency_ms, capacity=args.capacity,
+                            error_rate=args.error_rate, blank_rate=args.blank_rate)
+    runs = [(f'fixed {concurrency}', {'ADAPTIVE_CONCURRENCY_ENABLED': False,
+                                       'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency})
+            for concurrency in args.fixed]
+    runs.append(('adaptive', {'ADAPTIVE_CONCURRENCY_ENABLED': True, 'ADAPTIVE_INTERVAL': 2}))
+    try:
+        crawl.wait_for_port(port)
+        with tempfile.TemporaryDirectory() as workdir:
+            workdir = pathlib.Path(workdir)
+            print(f'{"run":<12}{"seconds":>9}{"items":>7}{"items/sec":>11}'
+                  f'{"429":>7}{"5xx":>6}{"concurrency":>13}')
+            for label, settings in runs:
+                crawl.write_links(workdir / PROPERTY_LINKS_FILE, 'link',
+                                  (f'/property/{i}' for i in range(args.pages)))
+                (workdir / PROPERTY_DETAILS_FILE).unlink(missing_ok=True)
+                log_file = workdir / 'crawl.log'
+                seconds = crawl.run_spider(
+                    'property-details-spider', workdir, f'http://127.0.0.1:{port}',
+                    settings=dict(settings, LOG_FILE=log_file, FRONTIER_ENABLED=False))
+                stats = crawl.read_stats(log_file)
+                items = crawl.count_rows(workdir / PROPERTY_DETAILS_FILE)
+                settled = stats.get('adaptive/127.0.0.1/concurrency', '-')
+                print(f'{label:<12}{seconds:>9.1f}{items:>7}{items / seconds:>11.1f}'
+                      f'{stats.get("downloader/response_status_count/429", 0):>7.0f}'
+                      f'{stats.get("downloader/response_status_count/503", 0):>6.0f}'
+                      f'{settled:>13}')
+            with open(log_file, encoding='utf-8') as log:
+                for line in log:
+                    if 'concurrency' in line and '->' in line:
+                        print(line.rstrip())
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark: the four spiders one after another against the fused crawl.
+
+    python -m benchmarks.bench_fused [--scale 0.002] [--latency-ms 50]
+
+Crawls the local mock site, whose listings are scaled down by ``--scale``,
+with listing-pages-spider, landwatch-spider, property-details-spider and
+broker-details-spider in turn, then with fused-spider. Reports the wall
+time of both and the rows of every feed, which must be the same.
+
+"""
+import argparse
+import pathlib
+import tempfile
+
+from benchmarks import crawl, mocksite
+from benchmarks.suite import STAGES
+from landcrawler.spiders.land import (
+    BROKER_DETAILS_FILE, BROKER_LINKS_FILE, LISTING_LINKS_FILE, PROPERTY_DETAILS_FILE,
+    PROPERTY_LINKS_FILE,
+)
+
+
+FEED_FILES = [
+    LISTING_LINKS_FILE, PROPERTY_LINKS_FILE, BROKER_LINKS_FILE, PROPERTY_DETAILS_FILE,
+    BROKER_DETAILS_FILE,
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=0.002,
+                        help='share of the listings of every state')
+    parser.add_argument('--latency-ms', type=int, default=50)
+    parser.add_argument('--padding-kb', type=int, default=0,
+                        help='filler markup added to every page')
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    settings = {
+        'FRONTIER_ENABLED': False,
+        'ADAPTIVE_CONCURRENCY_ENABLED': False,
+        'CONCURRENT_REQUESTS': args.concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': args.concurrency,
+    }
+    port = crawl.free_port()
+    server = mocksite.start(port, args.padding_kb, latency_ms=args.latency_ms, scale=args.scale)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        crawl.wait_for_port(port)
+        results = {}
+        for label, spiders in (('stages', STAGES), ('fused', ['fused-spider'])):
+            with tempfile.TemporaryDirectory() as workdir:
+                workdir = pathlib.Path(workdir)
+                seconds = sum(
+                    crawl.run_spider(spider, workdir, base_url,
+                                     settings=dict(settings, LOG_FILE=workdir / f'{spider}.log'))
+                    for spider in spiders
+                )
+                results[label] = seconds, [crawl.count_rows(workdir / path) for path in FEED_FILES]
+    finally:
+        server.terminate()
+    print(f'{"run":<8}{"seconds":>9}' + ''.join(f'{path.stem:>18}' for path in FEED_FILES))
+    for label, (seconds, rows) in results.items():
+        print(f'{label:<8}{seconds:>9.1f}' + ''.join(f'{count:>18}' for count in rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark: change history merge of two runs against an in-memory diff.
+
+    python -m benchmarks.bench_history [--links 200000] [--changed 0.03]
+
+Stages a first run of ``--links`` synthetic property items into a
+HistoryStore and merges it, then a second run in which a ``--changed``
+share of the listings got a price cut or were sold, and a few were removed
+or added. Reports the time and Python memory peak of the streaming merge
+of each run, next to a diff of the second run with the staged items and
+the latest values loaded into dicts, the change rows written and the time
+of a "changed since" query.
+
+"""
+import argparse
+import pathlib
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from landcrawler.history import HistoryStore
+
+
+def snapshot(links, seed):
+    rnd = random.Random(seed)
+    for index in range(links):
+        yield f'https://www.landwatch.com/property/{index}', {
+            'brokerLink': f'/profile/{rnd.randint(0, 5000)}',
+            'status': 'Available',
+            'title': f'{rnd.randint(1, 900)} acres in {rnd.choice(["Texas", "Maine", "Oregon"])}',
+            'price': rnd.randint(10, 900) * 1000,
+            'acres': float(rnd.randint(1, 900)),
+            'zip': f'{rnd.randint(0, 99999):05d}',
+        }
+
+
+def next_snapshot(links, changed, seed):
+    rnd = random.Random(seed + 1)
+    for link, values in snapshot(links, seed):
+        chance = rnd.random()
+        if chance < changed / 2:
+            values['price'] = int(values['price'] * 0.9)
+        elif chance < changed:
+            values['status'] = 'Sold'
+        elif chance < changed + 0.005:
+            continue
+        yield link, values
+    for index in range(links, links + links // 200):
+        yield f'https://www.landwatch.com/property/{index}', {'status': 'Available', 'price': 1000}
+
+
+def in_memory_diff(path, run):
+    """Diff the staged items of ``run`` against the latest values with both loaded in dicts."""
+    connection = sqlite3.connect(path)
+    try:
+        old = dict(connection.execute('SELECT link, vals FROM latest'))
+        new = dict(connection.execute('SELECT link, vals FROM staged WHERE run = ?', (run,)))
+    finally:
+        connection.close()
+    return sum(1 for link in old.keys() | new.keys() if old.get(link) != new.get(link))
+
+
+def measured(func, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=200_000)
+    parser.add_argument('--changed', type=float, default=0.03)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        path = pathlib.Path(workdir) / 'property_details.sqlite'
+        store = HistoryStore(path)
+        for run, items in enumerate((snapshot(args.links, 1),
+                                     next_snapshot(args.links, args.changed, 1))):
+            store.start_run('bench')
+            since = time.time()
+            started = time.perf_counter()
+            for link, values in items:
+                store.stage(link, values)
+            stage_seconds = time.perf_counter() - started
+            if run:
+                store.commit()
+                differing, seconds, peak = measured(in_memory_diff, path, store.run)
+                print(f'in-memory diff: {differing} links in {seconds:.1f} s (peak {peak:.1f} MB)')
+            counts, merge_seconds, merge_peak = measured(store.merge, True)
+            print(f'run {run + 1}: staged in {stage_seconds:.1f} s, merged in {merge_seconds:.1f} s'
+                  f' (peak {merge_peak:.2f} MB), {counts}')
+        started = time.perf_counter()
+        rows = sum(1 for _ in store.changes(since))
+        print(f'changes since the second run: {rows} rows in '
+              f'{(time.perf_counter() - started) * 1000:.1f} ms')
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark: crawling the mock site against replaying the HTTP cache offline.
+
+    python -m benchmarks.bench_httpcache [--pages 2000] [--latency-ms 100]
+
+Crawls the local mock site with PropertyDetailsSpider with the HTTP cache
+enabled, stops the site and runs the spider again with HTTPCACHE_OFFLINE.
+Reports items/sec of both runs and the size of the cached bodies against
+the bytes downloaded.
+
+"""
+import argparse
+import pathlib
+import tempfile
+
+from benchmarks import crawl, mocksite
+from landcrawler.spiders.land import PROPERTY_DETAILS_FILE, PROPERTY_LINKS_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=int, default=100)
+    parser.add_argument('--padding-kb', type=int, default=100,
+                        help='filler markup added to every page')
+    parser.add_argument('--compression', default='zstd', choices=['zstd', 'gzip'])
+    args = parser.parse_args()
+
+    port = crawl.free_port()
+    server = mocksite.start(port, args.padding_kb, latency_ms=args.latency_ms)
+    try:
+        crawl.wait_for_port(port)
+        with tempfile.TemporaryDirectory() as workdir:
+            workdir = pathlib.Path(workdir)
+            crawl.write_links(workdir / PROPERTY_LINKS_FILE, 'link',
+                              (f'/property/{i}' for i in range(args.pages)))
+            print(f'{"run":<10}{"seconds":>9}{"items":>7}{"items/sec":>11}')
+            for label, offline in (('crawl', False), ('replay', True)):
+                if offline:
+                    # Nothing may be downloaded.
+                    server.terminate()
+                (workdir / PROPERTY_DETAILS_FILE).unlink(missing_ok=True)
+                log_file = workdir / f'{label}.log'
+                seconds = crawl.run_spider(
+                    'property-details-spider', workdir, f'http://127.0.0.1:{port}',
+                    settings={
+                        'LOG_FILE': log_file,
+                        'FRONTIER_ENABLED': False,
+                        'CONCURRENT_REQUESTS': 64,
+                        'HTTPCACHE_ENABLED': True,
+                        'HTTPCACHE_OFFLINE': offline,
+                        'HTTPCACHE_DIR': workdir / 'httpcache',
+                        'HTTPCACHE_COMPRESSION': args.compression,
+                    })
+                stats = crawl.read_stats(log_file)
+                items = crawl.count_rows(workdir / PROPERTY_DETAILS_FILE)
+                print(f'{label:<10}{seconds:>9.1f}{items:>7}{items / seconds:>11.1f}')
+                if not offline:
+                    body_bytes = stats.get('httpcache/body_bytes', 0)
+                    stored_bytes = stats.get('httpcache/stored_bytes', 0)
+            print(f'cached {stored_bytes / 1024 / 1024:.1f} MB of '
+                  f'{body_bytes / 1024 / 1024:.1f} MB bodies ({args.compression})')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark: slotted item classes against plain dict items.
+
+    python -m benchmarks.bench_items [--pages DIR] [--items N]
+
+Builds ``--items`` property and broker details items from the values the
+spiders extract from the fixture pages, once as dicts and once as the item
+classes of ``landcrawler.items``, and reports the memory held per item and
+the time to build the items and export them with the CSV feed exporter.
+
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+from itemadapter import ItemAdapter
+from scrapy.exporters import CsvItemExporter
+
+from benchmarks import fixtures
+from landcrawler.items import BrokerDetails, PropertyDetails
+from landcrawler.spiders.land import (
+    BROKER_DETAILS_FILE,
+    PROPERTY_DETAILS_FILE,
+    BrokerProfileSpider,
+    PropertyDetailsSpider,
+)
+
+
+KINDS = {
+    'property': (PropertyDetailsSpider, PropertyDetails, PROPERTY_DETAILS_FILE),
+    'broker': (BrokerProfileSpider, BrokerDetails, BROKER_DETAILS_FILE),
+}
+
+
+def build(values, count, item_class):
+    if item_class is dict:
+        return [dict(values[index % len(values)], link=str(index)) for index in range(count)]
+    return [item_class(**dict(values[index % len(values)], link=str(index)))
+            for index in range(count)]
+
+
+def held_memory(values, count, item_class):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = build(values, count, item_class)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del items
+    return held / count
+
+
+def throughput(values, count, item_class, fields):
+    started = time.perf_counter()
+    exporter = CsvItemExporter(io.BytesIO(), fields_to_export=fields)
+    exporter.start_exporting()
+    for item in build(values, count, item_class):
+        exporter.export_item(item)
+    exporter.finish_exporting()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', help='directory with saved fixture pages')
+    parser.add_argument('--items', type=int, default=100_000)
+    args = parser.parse_args()
+    pages = list(fixtures.load_corpus(args.pages) if args.pages else fixtures.corpus())
+    print(f'{"item":<10}{"type":<18}{"bytes/item":>11}{"items/sec":>11}')
+    for kind, (spider, item_class, feed) in KINDS.items():
+        # Values as the spiders extract them, before they become items.
+        values = [ItemAdapter(spider.extract_item(html, name)).asdict()
+                  for page_kind, name, html in pages if page_kind == kind]
+        fields = spider.custom_settings['FEEDS'][feed]['fields']
+        for label, cls in (('dict', dict), (item_class.__name__, item_class)):
+            memory = held_memory(values, args.items, cls)
+            rate = throughput(values, args.items, cls, fields)
+            print(f'{kind:<10}{label:<18}{memory:>11.0f}{rate:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
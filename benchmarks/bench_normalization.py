@@ -0,0 +1,58 @@
+"""Benchmark: property details crawl time with and without NormalizationPipeline.
+
+    python -m benchmarks.bench_normalization [--pages 1500] [--padding-kb 400]
+
+Crawls the local mock site with PropertyDetailsSpider once with
+NormalizationPipeline turned off in ITEM_PIPELINES and once with it, with
+real page sizes, and reports the wall time and items/sec of both runs.
+
+"""
+import argparse
+import json
+import pathlib
+import tempfile
+
+from benchmarks import crawl, mocksite
+from landcrawler.spiders.land import PROPERTY_DETAILS_FILE, PROPERTY_LINKS_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=1500)
+    parser.add_argument('--padding-kb', type=int, default=400,
+                        help='filler markup added to every page')
+    parser.add_argument('--latency-ms', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    port = crawl.free_port()
+    server = mocksite.start(port, args.padding_kb, latency_ms=args.latency_ms)
+    try:
+        crawl.wait_for_port(port)
+        with tempfile.TemporaryDirectory() as workdir:
+            workdir = pathlib.Path(workdir)
+            crawl.write_links(workdir / PROPERTY_LINKS_FILE, 'link',
+                              (f'/property/{i}' for i in range(args.pages)))
+            print(f'{"pipeline":<10}{"seconds":>9}{"items":>8}{"items/sec":>11}')
+            for name, enabled in (('off', False), ('on', True)):
+                (workdir / PROPERTY_DETAILS_FILE).unlink(missing_ok=True)
+                settings = {
+                    'FRONTIER_ENABLED': False,
+                    'CONCURRENT_REQUESTS': args.concurrency,
+                    'CONCURRENT_REQUESTS_PER_DOMAIN': args.concurrency,
+                    'ADAPTIVE_CONCURRENCY_ENABLED': False,
+                    'REJECTED_DIR': workdir / 'rejected',
+                }
+                if not enabled:
+                    settings['ITEM_PIPELINES'] = json.dumps(
+                        {'landcrawler.pipelines.NormalizationPipeline': None})
+                seconds = crawl.run_spider(
+                    'property-details-spider', workdir, f'http://127.0.0.1:{port}', settings)
+                items = crawl.count_rows(workdir / PROPERTY_DETAILS_FILE)
+                print(f'{name:<10}{seconds:>9.1f}{items:>8}{items / seconds:>11.1f}')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark: Parquet property details feed against the CSV one.
+
+    python -m benchmarks.bench_parquet [--pages DIR] [--rows N] [--compression zstd]
+
+Builds ``--rows`` property details items from the fixture pages, exports
+them with the CSV exporter of the spiders' feeds and with
+ParquetItemExporter, and reports export time, file size and the time to
+load the file back: CSV rows with the csv module and with pyarrow's CSV
+reader, Parquet with pyarrow.
+
+"""
+import argparse
+import csv
+import dataclasses
+import os
+import random
+import tempfile
+import time
+
+import pyarrow.csv
+import pyarrow.parquet
+from scrapy.exporters import CsvItemExporter
+
+from benchmarks import fixtures
+from landcrawler.exporters import ParquetItemExporter
+from landcrawler.spiders.land import PROPERTY_DETAILS_FILE, PropertyDetailsSpider
+
+
+FIELDS = PropertyDetailsSpider.custom_settings['FEEDS'][PROPERTY_DETAILS_FILE]['fields']
+
+
+def items(pages, rows, seed=42):
+    """Yield ``rows`` items made of the fixture ones with unique links, prices and acreage.
+
+    """
+    rnd = random.Random(seed)
+    base = [PropertyDetailsSpider.extract_item(html, name)
+            for kind, name, html in pages if kind == 'property']
+    for index in range(rows):
+        item = base[index % len(base)]
+        yield dataclasses.replace(
+            item, link=f'/property/{index}', price=rnd.randint(10, 5000) * 1000,
+            acres=round(rnd.uniform(0.5, 2000), 2), title=f'{item.title} #{index}')
+
+
+def export(exporter, path, rows):
+    started = time.perf_counter()
+    with open(path, 'wb') as feed:
+        exporter = exporter(feed)
+        exporter.start_exporting()
+        for item in rows:
+            exporter.export_item(item)
+        exporter.finish_exporting()
+    return time.perf_counter() - started
+
+
+def timed(load, path):
+    started = time.perf_counter()
+    load(path)
+    return time.perf_counter() - started
+
+
+def load_csv_rows(path):
+    with open(path, encoding='utf-8', newline='') as feed:
+        return list(csv.DictReader(feed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', help='directory with saved fixture pages')
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--compression', default='zstd')
+    args = parser.parse_args()
+    pages = list(fixtures.load_corpus(args.pages) if args.pages else fixtures.corpus())
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'property_details.csv')
+        parquet_path = os.path.join(directory, 'property_details.parquet')
+        csv_export = export(
+            lambda feed: CsvItemExporter(feed, fields_to_export=FIELDS),
+            csv_path, items(pages, args.rows))
+        parquet_export = export(
+            lambda feed: ParquetItemExporter(
+                feed, fields_to_export=FIELDS, field_types=PropertyDetailsSpider.field_types,
+                compression=args.compression),
+            parquet_path, items(pages, args.rows))
+        results = [
+            ('csv', 'csv module', csv_export, csv_path, load_csv_rows),
+            ('csv', 'pyarrow', csv_export, csv_path, pyarrow.csv.read_csv),
+            ('parquet', 'pyarrow', parquet_export, parquet_path, pyarrow.parquet.read_table),
+        ]
+        print(f'{args.rows} rows')
+        print(f'{"format":<10}{"loader":<12}{"export s":>9}{"size MiB":>10}{"load s":>8}')
+        for name, loader, export_seconds, path, load in results:
+            print(f'{name:<10}{loader:<12}{export_seconds:>9.2f}'
+                  f'{os.path.getsize(path) / 2 ** 20:>10.1f}{timed(load, path):>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark: parse failure retries on a site which blanks and truncates pages.
+
+    python -m benchmarks.bench_parse_failures [--pages 2000] [--blank-rate 0.05]
+        [--truncate-rate 0.05]
+
+Crawls the local mock site, which answers a share of the property pages
+without serverState and cuts another share in half, with
+PropertyDetailsSpider once without parse retries and once with
+PARSE_RETRY_TIMES. Reports the complete items, the retried fetches and the
+pages written to the dead letter file of each run.
+
+"""
+import argparse
+import csv
+import pathlib
+import tempfile
+
+from benchmarks import crawl, mocksite
+from landcrawler.failures import KINDS
+from landcrawler.spiders.land import PROPERTY_DETAILS_FILE, PROPERTY_LINKS_FILE
+
+
+def complete_rows(path):
+    with open(path, encoding='utf-8', newline='') as details_file:
+        return sum(1 for row in csv.DictReader(details_file) if row['title'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=int, default=20)
+    parser.add_argument('--blank-rate', type=float, default=0.05)
+    parser.add_argument('--truncate-rate', type=float, default=0.05)
+    parser.add_argument('--retries', type=int, default=3)
+    args = parser.parse_args()
+
+    port = crawl.free_port()
+    server = mocksite.start(port, latency_ms=args.latency_ms, blank_rate=args.blank_rate,
+                            truncate_rate=args.truncate_rate)
+    try:
+        crawl.wait_for_port(port)
+        with tempfile.TemporaryDirectory() as workdir:
+            workdir = pathlib.Path(workdir)
+            crawl.write_links(workdir / PROPERTY_LINKS_FILE, 'link',
+                              (f'/property/{i}' for i in range(args.pages)))
+            print(f'{"retries":<9}{"seconds":>9}{"fetches":>9}{"complete":>10}'
+                  f'{"retried":>9}{"dead letters":>14}')
+            for retries in (0, args.retries):
+                (workdir / PROPERTY_DETAILS_FILE).unlink(missing_ok=True)
+                log_file = workdir / f'retries-{retries}.log'
+                seconds = crawl.run_spider(
+                    'property-details-spider', workdir, f'http://127.0.0.1:{port}',
+                    settings={
+                        'LOG_FILE': log_file,
+                        'FRONTIER_ENABLED': False,
+                        'ADAPTIVE_CONCURRENCY_ENABLED': False,
+                        'PARSE_RETRY_TIMES': retries,
+                        'PARSE_RETRY_BACKOFF': 0.5,
+                        'DEADLETTER_DIR': workdir / f'deadletter-{retries}',
+                    })
+                stats = crawl.read_stats(log_file)
+                retried = sum(stats.get(f'parse_failures/retried/{kind}', 0) for kind in KINDS)
+                dead = sum(stats.get(f'parse_failures/dead_letter/{kind}', 0) for kind in KINDS)
+                print(f'{retries:<9}{seconds:>9.1f}'
+                      f'{stats.get("response_received_count", 0):>9.0f}'
+                      f'{complete_rows(workdir / PROPERTY_DETAILS_FILE):>10}'
+                      f'{retried:>9.0f}{dead:>14.0f}')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
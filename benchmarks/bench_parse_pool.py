@@ -0,0 +1,53 @@
+"""Benchmark: property details throughput against parse pool worker count.
+
+    python -m benchmarks.bench_parse_pool [--pages 2000] [--workers 0 1 2 4]
+
+Crawls the local mock site with PropertyDetailsSpider once per worker count
+(0 parses on the reactor thread) and reports items/sec.
+
+"""
+import argparse
+import tempfile
+import pathlib
+
+from benchmarks import crawl, mocksite
+from landcrawler.spiders.land import PROPERTY_DETAILS_FILE, PROPERTY_LINKS_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--padding-kb', type=int, default=100,
+                        help='filler markup added to every page')
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    port = crawl.free_port()
+    server = mocksite.start(port, args.padding_kb)
+    try:
+        crawl.wait_for_port(port)
+        with tempfile.TemporaryDirectory() as workdir:
+            workdir = pathlib.Path(workdir)
+            crawl.write_links(workdir / PROPERTY_LINKS_FILE, 'link',
+                              (f'/property/{i}' for i in range(args.pages)))
+            print(f'{"workers":>8}{"seconds":>10}{"items":>8}{"items/sec":>11}')
+            for workers in args.workers:
+                (workdir / PROPERTY_DETAILS_FILE).unlink(missing_ok=True)
+                seconds = crawl.run_spider(
+                    'property-details-spider', workdir, f'http://127.0.0.1:{port}',
+                    settings={
+                        'PARSE_POOL_WORKERS': workers,
+                        'CONCURRENT_REQUESTS': args.concurrency,
+                        'CONCURRENT_REQUESTS_PER_DOMAIN': args.concurrency,
+                        'ADAPTIVE_CONCURRENCY_ENABLED': False,
+                    },
+                )
+                items = crawl.count_rows(workdir / PROPERTY_DETAILS_FILE)
+                print(f'{workers:>8}{seconds:>10.2f}{items:>8}{items / seconds:>11.1f}')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark: projected decoding of serverState against full decoding.
+
+    python -m benchmarks.bench_projection [--pages DIR] [--repeat N]
+
+Reports parse time, peak allocated memory and the size of the decoded
+result per page for the spiders' projections compared with decoding the
+whole sub-object.
+
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks import fixtures
+from benchmarks.bench_serverstate import script_text
+from landcrawler.serverstate import extract_server_state
+from landcrawler.spiders.land import (
+    BrokerProfileSpider,
+    ListingPagesSpider,
+    PropertyDetailsSpider,
+)
+
+
+PROJECTIONS = {
+    'property': PropertyDetailsSpider.projection,
+    'broker': BrokerProfileSpider.projection,
+    'filter': ListingPagesSpider.projection,
+}
+
+
+def run(scripts, keys):
+    for script in scripts:
+        extract_server_state(script, keys)
+
+
+def measure(scripts, keys, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(scripts, keys)
+        best = min(best, time.perf_counter() - started)
+    peaks = kept = 0
+    tracemalloc.start()
+    for script in scripts:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = extract_server_state(script, keys)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks += peak - before
+        kept += current - before
+        del result
+    tracemalloc.stop()
+    return best / len(scripts), peaks / len(scripts), kept / len(scripts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', help='directory with saved fixture pages')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    pages = fixtures.load_corpus(args.pages) if args.pages else fixtures.corpus()
+    scripts = {}
+    for kind, _, html in pages:
+        if kind in PROJECTIONS:
+            scripts.setdefault(kind, []).append(script_text(html))
+    print(f'{"page":<10}{"mode":<12}{"ms/page":>9}{"peak KiB/page":>15}{"item KiB":>10}')
+    for kind, kind_scripts in scripts.items():
+        projection = PROJECTIONS[kind]
+        for mode, keys in (('full', tuple(projection)), ('projected', projection)):
+            seconds, peak, kept = measure(kind_scripts, keys, args.repeat)
+            print(f'{kind:<10}{mode:<12}{seconds * 1000:>9.3f}'
+                  f'{peak / 1024:>15.1f}{kept / 1024:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark: property details throughput against proxy pool size.
+
+    python -m benchmarks.bench_proxy_pool [--pages 1200] [--pools 1 2 4] [--capacity 4]
+
+Crawls the local mock site with PropertyDetailsSpider through pools of local
+stand-in proxies, each serving ``--capacity`` concurrent requests with
+``--latency-ms`` of delay, and then through the largest pool plus a proxy
+failing ``--bad-rate`` of its requests. Reports items/sec, the requests
+each proxy served, the connections it was opened and the retirements.
+
+"""
+import argparse
+import json
+import pathlib
+import tempfile
+import urllib.request
+
+from benchmarks import crawl, mocksite, proxies
+from landcrawler.spiders.land import PROPERTY_DETAILS_FILE, PROPERTY_LINKS_FILE
+
+
+def proxy_stats(port):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stats') as response:
+        return json.load(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=1200)
+    parser.add_argument('--pools', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--capacity', type=int, default=4)
+    parser.add_argument('--latency-ms', type=int, default=50)
+    parser.add_argument('--bad-rate', type=float, default=0.6)
+    args = parser.parse_args()
+
+    site_port = crawl.free_port()
+    servers = [mocksite.start(site_port)]
+    started = set()
+    runs = [(f'{size} proxies', [(crawl.free_port(), 0) for _ in range(size)])
+            for size in args.pools]
+    runs.append((f'{max(args.pools)} + 1 bad', runs[-1][1] + [(crawl.free_port(), args.bad_rate)]))
+    try:
+        crawl.wait_for_port(site_port)
+        with tempfile.TemporaryDirectory() as workdir:
+            workdir = pathlib.Path(workdir)
+            print(f'{"pool":<14}{"seconds":>9}{"items":>7}{"items/sec":>11}{"retired":>9}'
+                  '  requests/connections per proxy')
+            for label, pool in runs:
+                for port, failure_rate in pool:
+                    if port not in started:
+                        started.add(port)
+                        servers.append(proxies.start(port, args.latency_ms, capacity=args.capacity,
+                                                     failure_rate=failure_rate))
+                        crawl.wait_for_port(port)
+                before = {port: proxy_stats(port) for port, _ in pool}
+                crawl.write_links(workdir / PROPERTY_LINKS_FILE, 'link',
+                                  (f'/property/{i}' for i in range(args.pages)))
+                (workdir / PROPERTY_DETAILS_FILE).unlink(missing_ok=True)
+                log_file = workdir / 'crawl.log'
+                seconds = crawl.run_spider(
+                    'property-details-spider', workdir, f'http://127.0.0.1:{site_port}',
+                    settings={
+                        'LOG_FILE': log_file,
+                        'FRONTIER_ENABLED': False,
+                        'ADAPTIVE_CONCURRENCY_ENABLED': False,
+                        'CONCURRENT_REQUESTS': 64,
+                        'PROXY_LIST': ','.join(f'http://127.0.0.1:{port}' for port, _ in pool),
+                        'PROXY_MAX_PER_PROXY': args.capacity,
+                    })
+                stats = crawl.read_stats(log_file)
+                items = crawl.count_rows(workdir / PROPERTY_DETAILS_FILE)
+                served = []
+                for port, _ in pool:
+                    after = proxy_stats(port)
+                    served.append(f'{after["requests"] - before[port]["requests"]}/'
+                                  f'{after["connections"] - before[port]["connections"] - 1}')
+                print(f'{label:<14}{seconds:>9.1f}{items:>7}{items / seconds:>11.1f}'
+                      f'{stats.get("proxy/retired", 0):>9.0f}  {" ".join(served)}')
+    finally:
+        for server in servers:
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
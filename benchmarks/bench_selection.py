@@ -0,0 +1,93 @@
+"""Micro-benchmark: compiled selectors against the former parsel queries.
+
+    python -m benchmarks.bench_selection [--pages 20] [--padding-kb 100] [--repeat 5]
+
+Extracts the listing cards of mock site listing pages and the items of
+property pages with the former per-card parsel queries and DOM built for
+the broker link, and with the compiled selectors given the page text and
+given the UTF-8 body, as the spiders do. Results must be the same.
+
+"""
+import argparse
+import dataclasses
+import time
+
+from parsel import Selector
+
+from benchmarks import mocksite
+from landcrawler.spiders.land import DOMAIN, LandsForSaleSpider, PropertyDetailsSpider
+
+
+def legacy_cards(text):
+    """The per-card parsel queries the listing spider used before CARD_NODES."""
+    selector = Selector(text=text)
+    cards = [
+        (item_container.css('div._12a2b').xpath('a/@href').get(),
+         item_container.css('div.dc7c2').xpath('a/@href').get(),
+         item_container.xpath('normalize-space()').get())
+        for item_container in selector.css('div._51c43')
+    ]
+    next_page_url = selector.css('a.d72c6:last-child').xpath('@href').get()
+    return cards, next_page_url
+
+
+def legacy_property(text, page_url):
+    """Property item with the broker link taken from a parsel DOM of the page."""
+    broker_link = Selector(text=text).css('a.d51ec').xpath('@href').get()
+    return dataclasses.replace(
+        PropertyDetailsSpider.extract_item(text, page_url), brokerLink=broker_link)
+
+
+def measure(func, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for page in pages:
+            func(*page)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000 / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--padding-kb', type=int, default=100,
+                        help='filler markup added to every page')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    site = mocksite.MockSite(args.padding_kb)
+    listing_paths = [f'/texas-land-for-sale/region-{index % 5}/county-{index // 5}'
+                     for index in range(args.pages)]
+    property_paths = [f'/property/{index}' for index in range(args.pages)]
+    listing = [site.render(path) for path in listing_paths]
+    details = [(site.render(path), f'http://{DOMAIN}{path}') for path in property_paths]
+    runs = {
+        'cards': (
+            lambda text: legacy_cards(text),
+            lambda text: LandsForSaleSpider.extract_cards(text),
+            lambda body: LandsForSaleSpider.extract_cards(body),
+            [(body.decode('utf-8'),) for body in listing],
+            [(body,) for body in listing],
+        ),
+        'property': (
+            legacy_property,
+            PropertyDetailsSpider.extract_item,
+            PropertyDetailsSpider.extract_item,
+            [(body.decode('utf-8'), url) for body, url in details],
+            details,
+        ),
+    }
+    print(f'{"extraction":<12}{"parsel ms":>11}{"text ms":>9}{"body ms":>9}{"speedup":>9}')
+    for name, (legacy, text_func, body_func, text_pages, body_pages) in runs.items():
+        for text_page, body_page in zip(text_pages, body_pages):
+            expected = legacy(*text_page)
+            assert text_func(*text_page) == expected == body_func(*body_page), name
+        legacy_ms = measure(legacy, text_pages, args.repeat)
+        text_ms = measure(text_func, text_pages, args.repeat)
+        body_ms = measure(body_func, body_pages, args.repeat)
+        print(f'{name:<12}{legacy_ms:>11.3f}{text_ms:>9.3f}{body_ms:>9.3f}'
+              f'{legacy_ms / body_ms:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
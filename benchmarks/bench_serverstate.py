@@ -0,0 +1,105 @@
+"""Micro-benchmark: serverState extractor against the former regex chain.
+
+    python -m benchmarks.bench_serverstate [--pages DIR] [--repeat N]
+
+Without ``--pages`` a synthetic corpus from ``benchmarks.fixtures`` is used.
+
+"""
+import argparse
+import json
+import re
+import time
+
+from benchmarks import fixtures
+from landcrawler.serverstate import extract_server_state
+
+
+def legacy_prep(script_string):
+    """The regex/``re.sub`` chain the spiders used before the extractor."""
+    prep = re.findall('window.serverState = "(.*)";', script_string)
+    if not prep:
+        return None
+    prep = prep[0]
+    prep = re.sub(r'([:,\[\{])\\+"', r'\1"', prep)
+    prep = re.sub(r'\\+"([:,\]\}])', r'"\1', prep)
+    prep = re.sub(r'\\+"', r'\"', prep)
+    prep = re.sub(r'(encodedBoundaryPoints":)(".*?")', r'\1""', prep)
+    prep = prep.replace('"{', '{').replace('}"', '}')
+    return prep
+
+
+def legacy_property(script_string):
+    prep = legacy_prep(script_string)
+    details = re.findall(r'"propertyData":(.*),"propertyEvents"', prep)[0]
+    details = re.sub(r'"description":((?:(?!"description":).)*?),"directions"',
+                     r'"description":"","directions"', details)
+    details = re.sub(r'"breadcrumbSchema.*smallMapUrl', r'"smallMapUrl', details)
+    return json.loads(details)
+
+
+def legacy_broker(script_string):
+    prep = legacy_prep(script_string)
+    details = re.findall(
+        r'"breadCrumbSchema":.+?,"brokerDetails":(.*),"carouselCounts"', prep)[0]
+    details = re.sub(r'"description":((?:(?!"description":).)*?),"email"',
+                     r'"description":"","email"', details)
+    return json.loads(details)
+
+
+def legacy_filter(script_string):
+    prep = legacy_prep(script_string)
+    return json.loads(re.findall(r'"filterSections":(.*?),"footer"', prep)[0])
+
+
+LEGACY = {
+    'property': legacy_property,
+    'broker': legacy_broker,
+    'filter': legacy_filter,
+}
+KEYS = {
+    'property': 'propertyData',
+    'broker': 'brokerDetails',
+    'filter': 'filterSections',
+}
+
+
+def script_text(html):
+    start = html.find(fixtures.SERVER_STATE_PREFIX)
+    return html[start:html.find('</script>', start)]
+
+
+def extractor(kind):
+    key = KEYS[kind]
+    return lambda script: extract_server_state(script, (key,))[key]
+
+
+def measure(func, scripts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for script in scripts:
+            func(script)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', help='directory with saved fixture pages')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    pages = fixtures.load_corpus(args.pages) if args.pages else fixtures.corpus()
+    scripts = {}
+    for kind, _, html in pages:
+        if kind in KEYS:
+            scripts.setdefault(kind, []).append(script_text(html))
+    print(f'{"page":<10}{"pages":>7}{"legacy ms/page":>17}{"extractor ms/page":>20}{"speedup":>9}')
+    for kind, kind_scripts in scripts.items():
+        legacy = measure(LEGACY[kind], kind_scripts, args.repeat) / len(kind_scripts)
+        current = measure(extractor(kind), kind_scripts, args.repeat) / len(kind_scripts)
+        print(f'{kind:<10}{len(kind_scripts):>7}{legacy * 1000:>17.3f}'
+              f'{current * 1000:>20.3f}{legacy / current:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
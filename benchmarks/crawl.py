@@ -0,0 +1,99 @@
+"""Helpers which run project spiders against the local mock site.
+
+"""
+import csv
+import os
+import pathlib
+import re
+import socket
+import subprocess
+import sys
+import time
+
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'Mock site did not start on port {port}')
+
+
+def write_links(path, field, links):
+    with open(path, 'w', encoding='utf-8', newline='') as links_file:
+        writer = csv.writer(links_file)
+        writer.writerow([field, 'root_page'])
+        writer.writerows([link, ''] for link in links)
+
+
+def spider_command(spider, base_url, settings=None, args=None):
+    """Return the ``scrapy crawl spider`` command and its environment.
+
+    """
+    command = [sys.executable, '-m', 'scrapy', 'crawl', spider, '-a', f'base_url={base_url}']
+    for name, value in (args or {}).items():
+        command += ['-a', f'{name}={value}']
+    settings = {'LOG_LEVEL': 'INFO', 'LOG_FILE': f'{spider}.log', **(settings or {})}
+    for name, value in settings.items():
+        command += ['-s', f'{name}={value}']
+    env = dict(os.environ, SCRAPY_SETTINGS_MODULE='landcrawler.settings',
+               PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')])))
+    return command, env
+
+
+def run_spider(spider, workdir, base_url, settings=None, args=None):
+    """Run ``scrapy crawl spider`` in ``workdir`` and return the wall time.
+
+    """
+    command, env = spider_command(spider, base_url, settings, args)
+    started = time.perf_counter()
+    subprocess.run(command, cwd=workdir, env=env, check=True)
+    return time.perf_counter() - started
+
+
+def measure_spider(spider, workdir, base_url, settings=None, args=None):
+    """Run the spider like ``run_spider``, return wall time, CPU seconds and peak RSS bytes.
+
+    CPU and memory are the crawl process ones, parse pool workers are not
+    counted.
+
+    """
+    command, env = spider_command(spider, base_url, settings, args)
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=env)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    peak_rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return seconds, usage.ru_utime + usage.ru_stime, peak_rss
+
+
+def count_rows(path):
+    with open(path, encoding='utf-8') as csv_file:
+        return max(sum(1 for _ in csv_file) - 1, 0)
+
+
+def read_stats(log_file):
+    """Return the numeric stats dumped at the end of the crawl log ``log_file``.
+
+    """
+    with open(log_file, encoding='utf-8') as log:
+        text = log.read()
+    dump = text[text.rfind('Dumping Scrapy stats:'):]
+    return {key: float(value) for key, value in
+            re.findall(r"'([^']+)': (-?\d+(?:\.\d+)?)[,}]", dump)}
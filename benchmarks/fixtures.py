@@ -0,0 +1,217 @@
+"""Synthetic landwatch-like pages used by the benchmarks.
+
+The pages mimic the markup the spiders rely on: the ``window.serverState``
+script (a JSON document serialised into a JavaScript string literal, with some
+values stringified once more) and the CSS classes of listing cards.
+
+Run ``python -m benchmarks.fixtures DIR`` to save a fixture corpus to disk.
+
+"""
+import json
+import pathlib
+import random
+import sys
+
+
+STATES = ['texas', 'montana', 'colorado', 'georgia', 'maine', 'oregon']
+SERVER_STATE_PREFIX = 'window.serverState = '
+WORDS = ('land acres creek pasture timber hunting road views pond well '
+         'fenced barn cabin hill valley ridge river meadow ranch').split()
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _description(rnd, words):
+    # Real descriptions carry markup, quotes and escaped characters.
+    return (f'<p>{_text(rnd, words)}</p> the "best" {_text(rnd, 10)}'
+            f' \\ path <br/> {_text(rnd, words)}')
+
+
+def _boundary(rnd, points):
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_~@?|'
+    return ''.join(rnd.choice(alphabet) for _ in range(points))
+
+
+def server_state_script(state):
+    """Return the ``window.serverState`` script text for ``state``."""
+    literal = json.dumps(json.dumps(state, separators=(',', ':')))
+    return f'{SERVER_STATE_PREFIX}{literal};window.__ENV__ = {{"env":"prod"}};'
+
+
+def html_page(script, body=''):
+    return (
+        '<!DOCTYPE html><html><head><title>LandWatch</title>'
+        '<script>window.dataLayer = [];</script>'
+        f'</head><body>{body}<script>{script}</script></body></html>'
+    )
+
+
+def property_state(rnd, property_id):
+    address = {
+        'address1': f'{rnd.randint(1, 9999)} County Road {rnd.randint(1, 99)}',
+        'address2': '',
+        'city': rnd.choice(WORDS).title(),
+        'stateAbbreviation': rnd.choice(['TX', 'MT', 'CO', 'GA', 'ME', 'OR']),
+        'zip': f'{rnd.randint(10000, 99999)}',
+        'county': rnd.choice(WORDS).title(),
+        'latitude': rnd.uniform(25, 48),
+        'longitude': rnd.uniform(-120, -70),
+    }
+    property_data = {
+        'id': property_id,
+        'status': rnd.randint(1, 4),
+        'title': f'{rnd.randint(1, 900)} Acres in {address["city"]} County',
+        'price': rnd.randint(10, 5000) * 1000,
+        'acres': round(rnd.uniform(0.5, 2000), 2),
+        'address': address,
+        'homesqft': rnd.choice([0, 1200, 2400]),
+        'beds': rnd.randint(0, 5),
+        'baths': rnd.randint(0, 3),
+        'halfBaths': rnd.randint(0, 1),
+        'types': rnd.sample(['Farms and Ranches', 'Hunting Land', 'Recreational Property',
+                             'Timberland', 'Undeveloped Land', 'Homesites'], 2),
+        'externalLink': f'https://broker.example.com/listing/{property_id}',
+        'description': _description(rnd, 400),
+        'directions': _text(rnd, 30),
+        'breadcrumbSchema': json.dumps({
+            '@context': 'https://schema.org',
+            '@type': 'BreadcrumbList',
+            'itemListElement': [{'@type': 'ListItem', 'position': i, 'name': _text(rnd, 2)}
+                                for i in range(1, 5)],
+        }),
+        'smallMapUrl': f'https://maps.example.com/{property_id}.png',
+        'encodedBoundaryPoints': _boundary(rnd, 3000),
+        'photos': [{'url': f'https://img.example.com/{property_id}/{i}.jpg',
+                    'caption': _text(rnd, 5)} for i in range(30)],
+        'amenities': [_text(rnd, 2) for _ in range(20)],
+    }
+    return {
+        'propertyDetailPage': {
+            'propertyData': property_data,
+            'propertyEvents': [{'date': '2022-01-01', 'name': _text(rnd, 3)}],
+            'similarListings': [{'id': property_id + i, 'title': _text(rnd, 6),
+                                 'price': rnd.randint(10, 900) * 1000}
+                                for i in range(1, 12)],
+        },
+        'footer': {'links': [_text(rnd, 3) for _ in range(40)]},
+    }
+
+
+def property_page(rnd, property_id, broker_id):
+    body = f'<div class="_4d3a5"><a class="d51ec" href="/profile/{broker_id}">Broker</a></div>'
+    return html_page(server_state_script(property_state(rnd, property_id)), body)
+
+
+def broker_state(rnd, broker_id):
+    details = {
+        'id': broker_id,
+        'contactName': f'{rnd.choice(WORDS).title()} {rnd.choice(WORDS).title()}',
+        'companyName': f'{rnd.choice(WORDS).title()} Land Company',
+        'phoneCell': f'({rnd.randint(200, 999)}) {rnd.randint(200, 999)}-{rnd.randint(1000, 9999)}',
+        'phoneOffice': f'{rnd.randint(200, 999)}.{rnd.randint(200, 999)}.{rnd.randint(1000, 9999)}',
+        'description': _description(rnd, 250),
+        'email': f'broker{broker_id}@example.com',
+        'url': f'https://broker{broker_id}.example.com',
+        'companyAddress1': f'{rnd.randint(1, 9999)} Main St',
+        'companyAddress2': '',
+        'companyCity': rnd.choice(WORDS).title(),
+        'companyState': rnd.choice(['TX', 'MT', 'CO', 'GA', 'ME', 'OR']),
+        'companyZip': f'{rnd.randint(10000, 99999)}',
+        'logo': f'https://img.example.com/logo/{broker_id}.png',
+    }
+    return {
+        'brokerProfilePage': {
+            'breadCrumbSchema': json.dumps({'@type': 'BreadcrumbList',
+                                            'name': _text(rnd, 3)}),
+            'brokerDetails': details,
+            'carouselCounts': {'available': rnd.randint(0, 900), 'sold': rnd.randint(0, 90)},
+            'listings': [{'id': broker_id * 100 + i, 'title': _text(rnd, 6)}
+                         for i in range(24)],
+        },
+        'footer': {'links': [_text(rnd, 3) for _ in range(40)]},
+    }
+
+
+def broker_page(rnd, broker_id):
+    return html_page(server_state_script(broker_state(rnd, broker_id)))
+
+
+def filter_state(rnd, sections, total=None):
+    """``sections`` maps a filter section name to a list of (path, count)."""
+    filter_sections = [
+        {'section': name,
+         'filterLinks': [{'relativeUrlPath': path, 'count': count, 'name': path}
+                         for path, count in links]}
+        for name, links in sections.items()
+    ]
+    return {
+        'searchPage': {
+            'searchResults': {'totalCount': total},
+            'filterSections': filter_sections,
+            'footer': {'links': [_text(rnd, 3) for _ in range(40)]},
+        },
+    }
+
+
+def filter_page(rnd, sections, cards='', total=None):
+    return html_page(server_state_script(filter_state(rnd, sections, total)), cards)
+
+
+def pagination(next_page_path):
+    if next_page_path is None:
+        return ''
+    return f'<div class="_9a2c1"><a class="d72c6" href="{next_page_path}">Next</a></div>'
+
+
+def listing_cards(rnd, property_ids, broker_ids):
+    cards = []
+    for property_id, broker_id in zip(property_ids, broker_ids):
+        cards.append(
+            '<div class="_51c43">'
+            f'<div class="_12a2b"><a href="/property/{property_id}">{_text(rnd, 4)}</a></div>'
+            f'<div class="_7a1c2"><span>${rnd.randint(10, 900)},000</span>'
+            f'<span>{rnd.randint(1, 900)} acres</span></div>'
+            f'<div class="dc7c2"><a href="/profile/{broker_id}">{_text(rnd, 2)}</a></div>'
+            '</div>'
+        )
+    return ''.join(cards)
+
+
+def land_index_page():
+    links = ''.join(f'<a class="e6625" href="/{state}-land-for-sale">{state}</a>'
+                    for state in STATES)
+    return html_page('window.dataLayer.push({});', links)
+
+
+def corpus(pages=50, seed=42):
+    """Yield ``(kind, name, html)`` fixture pages."""
+    rnd = random.Random(seed)
+    for index in range(pages):
+        yield 'property', f'property-{index}.html', property_page(rnd, 1000 + index, index % 7)
+        yield 'broker', f'broker-{index}.html', broker_page(rnd, index)
+        sections = {
+            'Region': [(f'/texas-land-for-sale/region-{i}', rnd.randint(0, 20_000))
+                       for i in range(12)],
+            'Price': [(f'/texas-land-for-sale/price-{i * 50000}-{(i + 1) * 50000}',
+                       rnd.randint(0, 5_000)) for i in range(10)],
+        }
+        yield 'filter', f'filter-{index}.html', filter_page(rnd, sections)
+
+
+def load_corpus(directory):
+    """Yield ``(kind, name, html)`` for pages saved in ``directory``."""
+    for path in sorted(pathlib.Path(directory).glob('*.html')):
+        yield path.stem.split('-')[0], path.name, path.read_text(encoding='utf-8')
+
+
+def main(argv):
+    directory = pathlib.Path(argv[0] if argv else 'fixtures')
+    directory.mkdir(parents=True, exist_ok=True)
+    for _, name, html in corpus():
+        (directory / name).write_text(html, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
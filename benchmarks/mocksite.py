@@ -0,0 +1,238 @@
+"""Local HTTP server serving landwatch-like fixture pages.
+
+    python -m benchmarks.mocksite [--port 8765] [--padding-kb 0] [--latency-ms 0]
+        [--capacity 0] [--error-rate 0] [--blank-rate 0] [--truncate-rate 0]
+        [--scale 1]
+
+Routes:
+    /land                       land index with state links
+    /property/<id>              property details page
+    /profile/<id>               broker profile page
+    /<state>-land-for-sale/...  filter and listing page
+
+Filter pages form a tree (state, region, county, city) whose listing counts
+add up, and ``/price-<low>-<high>`` and ``/acres-<low>-<high>`` segments,
+or ``-over-<low>`` ones without an upper bound, narrow a bucket by a log-normal price and acreage distribution. A trailing
+``/page-<n>`` selects a listing page. Pages are generated deterministically
+from ``benchmarks.fixtures``.
+
+"""
+import argparse
+import functools
+import math
+import multiprocessing
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import fixtures
+
+
+CARDS_PER_PAGE = 25
+PAGE_CAP = 10_000
+SECTIONS = ['Region', 'County', 'City']
+# Median and sigma of the log-normal distributions of price and acreage.
+DISTRIBUTIONS = {'price': (150_000, 1.5), 'acres': (20, 1.8)}
+_RANGE = re.compile(r'(price|acres)-(?:(\d+)-(\d+)|over-(\d+))$')
+_PAGE = re.compile(r'page-(\d+)$')
+
+
+def _cdf(dimension, value):
+    median, sigma = DISTRIBUTIONS[dimension]
+    if value <= 0:
+        return 0.0
+    return 0.5 * (1 + math.erf(math.log(value / median) / (sigma * math.sqrt(2))))
+
+
+class MockSite:
+    """Renders fixture pages for request paths.
+
+    ``padding_kb`` appends filler markup so pages approach the size of the
+    real ones. ``scale`` multiplies the listings of every state, which are
+    20 000 to 150 000.
+
+    """
+    def __init__(self, padding_kb=0, scale=1.0):
+        self.scale = scale
+        self.padding = '<div class="_pad">' + 'x' * 1000 + '</div>'
+        self.padding = self.padding * padding_kb
+
+    @functools.lru_cache(maxsize=65536)
+    def count(self, path):
+        """Return the number of listings of the filter page ``path``.
+
+        """
+        parent, _, segment = path.rpartition('/')
+        if not parent:
+            count = random.Random(zlib.crc32(path.encode())).randint(20_000, 150_000)
+            return round(count * self.scale)
+        match = _RANGE.match(segment)
+        if match:
+            dimension, low, high, over = match.groups()
+            if over is not None:
+                share = 1 - _cdf(dimension, int(over))
+            else:
+                low, high = int(low), int(high)
+                if dimension == 'price':
+                    high += 1
+                share = _cdf(dimension, high) - _cdf(dimension, low)
+            return round(self.count(parent) * share)
+        siblings = self.children(parent)
+        return dict(siblings).get(path, 0)
+
+    @functools.lru_cache(maxsize=65536)
+    def children(self, path):
+        """Return ``(path, count)`` of the filter links of ``path``.
+
+        """
+        depth = path.count('/') - 1
+        if depth >= len(SECTIONS) or _RANGE.search(path):
+            return ()
+        rnd = random.Random(zlib.crc32(path.encode()))
+        name = SECTIONS[depth].lower()
+        weights = [rnd.random() ** 2 for _ in range(rnd.randint(3, 8))]
+        total = self.count(path)
+        return tuple(
+            (f'{path}/{name}-{index}', round(total * weight / sum(weights)))
+            for index, weight in enumerate(weights)
+        )
+
+    def listing_page(self, path, rnd):
+        page = 1
+        match = _PAGE.search(path)
+        if match:
+            page = int(match.group(1))
+            path = path[:match.start() - 1]
+        count = self.count(path)
+        pages = math.ceil(min(count, PAGE_CAP) / CARDS_PER_PAGE)
+        first = zlib.crc32(path.encode()) * 1000 + (page - 1) * CARDS_PER_PAGE
+        cards = min(CARDS_PER_PAGE, max(count - (page - 1) * CARDS_PER_PAGE, 0))
+        body = fixtures.listing_cards(
+            rnd,
+            range(first, first + cards),
+            [rnd.randint(0, 996) for _ in range(cards)],
+        )
+        body += fixtures.pagination(f'{path}/page-{page + 1}' if page < pages else None)
+        depth = path.count('/') - 1
+        sections = {}
+        if depth < len(SECTIONS) and not _RANGE.search(path):
+            sections[SECTIONS[depth]] = list(self.children(path))
+        return fixtures.filter_page(rnd, sections, body, total=count)
+
+    @functools.lru_cache(maxsize=4096)
+    def render(self, path):
+        rnd = random.Random(zlib.crc32(path.encode()))
+        parts = path.strip('/').split('/')
+        if path == '/land':
+            html = fixtures.land_index_page()
+        elif parts[0] == 'property' and len(parts) == 2 and parts[1].isdigit():
+            property_id = int(parts[1])
+            html = fixtures.property_page(rnd, property_id, property_id % 997)
+        elif parts[0] == 'profile' and len(parts) == 2 and parts[1].isdigit():
+            html = fixtures.broker_page(rnd, int(parts[1]))
+        else:
+            html = self.listing_page(path.rstrip('/'), rnd)
+        return html.replace('</body>', self.padding + '</body>').encode('utf-8')
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves MockSite pages.
+
+    With ``capacity`` more concurrent requests get 429 responses, an
+    ``error_rate`` share of requests gets 503 responses, a ``blank_rate``
+    share gets a page without serverState and a ``truncate_rate`` share the
+    first half of the page.
+
+    """
+    site = None
+    latency = 0
+    capacity = 0
+    error_rate = 0
+    blank_rate = 0
+    truncate_rate = 0
+    protocol_version = 'HTTP/1.1'
+    in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            type(self).in_flight += 1
+            overloaded = self.capacity and self.in_flight > self.capacity
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            chance = random.random()
+            if overloaded:
+                self.respond(429, b'Too Many Requests')
+            elif chance < self.error_rate:
+                self.respond(503, b'Service Unavailable')
+            elif chance < self.error_rate + self.blank_rate:
+                self.respond(200, b'<html><body>Please wait</body></html>')
+            elif chance < self.error_rate + self.blank_rate + self.truncate_rate:
+                body = self.site.render(self.path)
+                self.respond(200, body[:len(body) // 2])
+            else:
+                self.respond(200, self.site.render(self.path))
+        finally:
+            with self.lock:
+                type(self).in_flight -= 1
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, padding_kb=0, handler=Handler, latency_ms=0, scale=1.0, **faults):
+    """Serve the mock site, ``faults`` are capacity and the rates of Handler.
+
+    """
+    handler = type(handler.__name__, (handler,),
+                   {'site': MockSite(padding_kb, scale), 'latency': latency_ms / 1000, **faults})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def start(port, padding_kb=0, handler=Handler, latency_ms=0, scale=1.0, **faults):
+    """Serve the mock site from a background process and return the process.
+
+    """
+    process = multiprocessing.Process(
+        target=serve, args=(port, padding_kb, handler, latency_ms, scale), kwargs=faults, daemon=True)
+    process.start()
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--padding-kb', type=int, default=0)
+    parser.add_argument('--latency-ms', type=int, default=0,
+                        help='delay of every response, like a remote site')
+    parser.add_argument('--capacity', type=int, default=0,
+                        help='concurrent requests served before answering 429')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of 503 responses')
+    parser.add_argument('--blank-rate', type=float, default=0,
+                        help='share of pages without serverState')
+    parser.add_argument('--truncate-rate', type=float, default=0,
+                        help='share of pages cut in half')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies the listings of every state')
+    args = parser.parse_args()
+    serve(args.port, args.padding_kb, latency_ms=args.latency_ms, scale=args.scale,
+          capacity=args.capacity,
+          error_rate=args.error_rate, blank_rate=args.blank_rate,
+          truncate_rate=args.truncate_rate)
+
+
+if __name__ == '__main__':
+    main()
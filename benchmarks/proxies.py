@@ -0,0 +1,120 @@
+"""Local stand-in HTTP proxies for the proxy pool benchmark.
+
+    python -m benchmarks.proxies [--port 8800] [--latency-ms 0] [--capacity 0]
+        [--failure-rate 0]
+
+A proxy forwards ``GET http://host/path`` requests to the upstream site over
+a kept-alive connection per client connection. It adds ``--latency-ms`` to
+every response, answers 429 above ``--capacity`` concurrent requests and 502
+to a ``--failure-rate`` share of requests. ``GET /_stats`` returns the
+connections and requests it served as JSON.
+
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    latency = 0
+    capacity = 0
+    failure_rate = 0
+    protocol_version = 'HTTP/1.1'
+    in_flight = 0
+    connections = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        self.upstream = None
+        with self.lock:
+            type(self).connections += 1
+
+    def finish(self):
+        super().finish()
+        if self.upstream is not None:
+            self.upstream.close()
+
+    def do_GET(self):
+        if self.path == '/_stats':
+            body = json.dumps({'connections': self.connections, 'requests': self.requests})
+            self.respond(200, body.encode(), 'application/json')
+            return
+        with self.lock:
+            type(self).in_flight += 1
+            type(self).requests += 1
+            overloaded = self.capacity and self.in_flight > self.capacity
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if overloaded:
+                self.respond(429, b'Too Many Requests')
+            elif random.random() < self.failure_rate:
+                self.respond(502, b'Bad Gateway')
+            else:
+                self.forward()
+        finally:
+            with self.lock:
+                type(self).in_flight -= 1
+
+    def forward(self):
+        url = urlsplit(self.path)
+        if self.upstream is None or self.upstream.host != url.hostname:
+            self.upstream = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        path = url.path + (f'?{url.query}' if url.query else '')
+        self.upstream.request('GET', path, headers={'User-Agent': self.headers.get('User-Agent', '')})
+        response = self.upstream.getresponse()
+        self.respond(response.status, response.read(), response.getheader('Content-Type'))
+
+    def respond(self, status, body, content_type='text/html; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, latency_ms=0, **faults):
+    """Serve a proxy, ``faults`` are capacity and failure_rate of ProxyHandler.
+
+    """
+    handler = type(ProxyHandler.__name__, (ProxyHandler,), {
+        'latency': latency_ms / 1000, 'lock': threading.Lock(), **faults})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def start(port, latency_ms=0, **faults):
+    """Serve a proxy from a background process and return the process.
+
+    """
+    process = multiprocessing.Process(
+        target=serve, args=(port, latency_ms), kwargs=faults, daemon=True)
+    process.start()
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--capacity', type=int, default=0,
+                        help='concurrent requests served before answering 429')
+    parser.add_argument('--failure-rate', type=float, default=0, help='share of 502 responses')
+    args = parser.parse_args()
+    serve(args.port, args.latency_ms, capacity=args.capacity, failure_rate=args.failure_rate)
+
+
+if __name__ == '__main__':
+    main()
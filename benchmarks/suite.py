@@ -0,0 +1,235 @@
+"""Benchmark suite: the four spiders end to end against the local mock site.
+
+    python -m benchmarks.suite [--start-links 10] [--properties 2000] [--brokers 500]
+        [--latency-ms 0] [--save FILE] [--baseline FILE] [--threshold 0.15]
+
+Runs listing-pages-spider, landwatch-spider on the first ``--start-links``
+of its listing links, then property-details-spider and broker-details-spider
+on the first links the listings spider found, each in its own process like
+``scrapy crawl``. Reports pages/sec, items/sec, CPU ms per page and peak RSS
+of every spider, and the time per page of the extraction steps of every
+spider callback measured on pages of the mock site.
+
+``--save`` writes the results as JSON. ``--baseline`` compares the results
+with saved ones and exits with status 1 when a metric regressed by more than
+``--threshold`` (a share, 0.15 is 15%), so it can run in CI. Pass
+``--replay DIR`` to run the spiders offline on an HTTP cache recorded from
+the site instead, see HTTPCACHE_OFFLINE.
+
+"""
+import argparse
+import json
+import pathlib
+import sys
+import tempfile
+import time
+
+from benchmarks import crawl, mocksite
+from landcrawler.links import read_links
+from landcrawler.selection import html_root, tag_attribute
+from landcrawler.serverstate import extract_server_state
+from landcrawler.spiders.land import (
+    BROKER_LINKS_FILE, DOMAIN, PROPERTY_LINKS_FILE, BrokerProfileSpider, LandsForSaleSpider,
+    ListingPagesSpider, PropertyDetailsSpider,
+)
+
+
+STAGES = [
+    'listing-pages-spider', 'landwatch-spider', 'property-details-spider', 'broker-details-spider',
+]
+# Metric -> 1 if higher is better, -1 if lower is better.
+METRICS = {
+    'pages_per_sec': 1,
+    'items_per_sec': 1,
+    'cpu_ms_per_page': -1,
+    'peak_rss_mb': -1,
+}
+
+
+def _property_broker_link(page, url):
+    return tag_attribute(page, 'a', 'd51ec', 'href')
+
+
+def _html_root(page, url):
+    return html_root(page)
+
+
+def _server_state(projection):
+    return lambda page, url: extract_server_state(page, projection, url)
+
+
+# Spider callback -> mock site paths and (step, func(page, url)) of its extraction,
+# pages are given as UTF-8 bodies like the spiders give them.
+BREAKDOWN = {
+    'listing-pages-spider.parse_page': (
+        ['/texas-land-for-sale', '/maine-land-for-sale/region-0'],
+        [('serverState', _server_state(ListingPagesSpider.projection)),
+         ('extract_filters', ListingPagesSpider.extract_filters)],
+    ),
+    'landwatch-spider.parse': (
+        ['/texas-land-for-sale/region-0/county-0', '/oregon-land-for-sale/region-1/page-2'],
+        [('DOM', _html_root),
+         ('extract_cards', lambda page, url: LandsForSaleSpider.extract_cards(page))],
+    ),
+    'property-details-spider.parse': (
+        [f'/property/{i}' for i in range(20)],
+        [('serverState', _server_state(PropertyDetailsSpider.projection)),
+         ('brokerLink', _property_broker_link),
+         ('extract_item', PropertyDetailsSpider.extract_item)],
+    ),
+    'broker-details-spider.parse': (
+        [f'/profile/{i}' for i in range(20)],
+        [('serverState', _server_state(BrokerProfileSpider.projection)),
+         ('extract_item', BrokerProfileSpider.extract_item)],
+    ),
+}
+
+
+def limit_links(path, field, count):
+    """Keep the first ``count`` distinct links of the links file ``path``.
+
+    """
+    seen, links = set(), []
+    for link in read_links(path):
+        if link not in seen:
+            seen.add(link)
+            links.append(link)
+            if len(links) == count:
+                break
+    crawl.write_links(path, field, links)
+
+
+def run_stages(args, workdir, base_url, settings):
+    results = {}
+    for spider in STAGES:
+        log_file = workdir / f'{spider}.log'
+        if spider == 'property-details-spider':
+            limit_links(workdir / PROPERTY_LINKS_FILE, 'link', args.properties)
+        elif spider == 'broker-details-spider':
+            limit_links(workdir / BROKER_LINKS_FILE, 'profile_link', args.brokers)
+        run_args = {'lines': f':{args.start_links}'} if spider == 'landwatch-spider' else {}
+        seconds, cpu, peak_rss = crawl.measure_spider(
+            spider, workdir, base_url, settings=dict(settings, LOG_FILE=log_file), args=run_args)
+        stats = crawl.read_stats(log_file)
+        pages = stats.get('response_received_count', 0)
+        items = stats.get('item_scraped_count', 0)
+        results[spider] = {
+            'seconds': round(seconds, 2),
+            'pages': int(pages),
+            'items': int(items),
+            'pages_per_sec': round(pages / seconds, 1),
+            'items_per_sec': round(items / seconds, 1),
+            'cpu_ms_per_page': round(cpu * 1000 / pages, 2) if pages else 0,
+            'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+        }
+    return results
+
+
+def measure_breakdown(repeat, padding_kb=0):
+    """Return the best ms per page of every extraction step of every callback.
+
+    """
+    site = mocksite.MockSite(padding_kb)
+    results = {}
+    for callback, (paths, steps) in BREAKDOWN.items():
+        pages = [(site.render(path), f'http://{DOMAIN}{path}') for path in paths]
+        results[callback] = {}
+        for step, func in steps:
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                for page, url in pages:
+                    func(page, url)
+                best = min(best, time.perf_counter() - started)
+            results[callback][step] = round(best * 1000 / len(pages), 3)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Yield a description of every metric of ``results`` worse than ``baseline`` by ``threshold``.
+
+    """
+    for spider, metrics in results['spiders'].items():
+        for metric, direction in METRICS.items():
+            previous = baseline.get('spiders', {}).get(spider, {}).get(metric)
+            if previous and direction * (metrics[metric] - previous) / previous < -threshold:
+                yield f'{spider} {metric}: {previous} -> {metrics[metric]}'
+    for callback, steps in results['breakdown'].items():
+        for step, ms in steps.items():
+            previous = baseline.get('breakdown', {}).get(callback, {}).get(step)
+            if previous and (ms - previous) / previous > threshold:
+                yield f'{callback} {step} ms/page: {previous} -> {ms}'
+
+
+def report(results):
+    print(f'{"spider":<26}{"seconds":>9}{"pages":>8}{"items":>8}{"pages/s":>9}'
+          f'{"items/s":>9}{"CPU ms/page":>13}{"peak RSS MB":>13}')
+    for spider, metrics in results['spiders'].items():
+        print(f'{spider:<26}{metrics["seconds"]:>9.1f}{metrics["pages"]:>8}{metrics["items"]:>8}'
+              f'{metrics["pages_per_sec"]:>9.1f}{metrics["items_per_sec"]:>9.1f}'
+              f'{metrics["cpu_ms_per_page"]:>13.2f}{metrics["peak_rss_mb"]:>13.1f}')
+    print(f'\n{"callback":<34}{"step":<20}{"ms/page":>9}')
+    for callback, steps in results['breakdown'].items():
+        for step, ms in steps.items():
+            print(f'{callback:<34}{step:<20}{ms:>9.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--start-links', type=int, default=10,
+                        help='listing links crawled by landwatch-spider')
+    parser.add_argument('--properties', type=int, default=2000)
+    parser.add_argument('--brokers', type=int, default=500)
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--padding-kb', type=int, default=100,
+                        help='filler markup added to every page')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=5, help='runs of the breakdown steps')
+    parser.add_argument('--replay', help='HTTP cache directory to replay offline')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.15)
+    args = parser.parse_args()
+
+    settings = {
+        'FRONTIER_ENABLED': False,
+        'ADAPTIVE_CONCURRENCY_ENABLED': False,
+        'CONCURRENT_REQUESTS': args.concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': args.concurrency,
+    }
+    server = None
+    if args.replay:
+        base_url = f'https://{DOMAIN}'
+        settings.update(HTTPCACHE_OFFLINE=True,
+                        HTTPCACHE_DIR=pathlib.Path(args.replay).resolve())
+    else:
+        port = crawl.free_port()
+        server = mocksite.start(port, args.padding_kb, latency_ms=args.latency_ms)
+        base_url = f'http://127.0.0.1:{port}'
+    try:
+        if server is not None:
+            crawl.wait_for_port(port)
+        with tempfile.TemporaryDirectory() as workdir:
+            spiders = run_stages(args, pathlib.Path(workdir), base_url, settings)
+    finally:
+        if server is not None:
+            server.terminate()
+    results = {'spiders': spiders, 'breakdown': measure_breakdown(args.repeat, args.padding_kb)}
+    report(results)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as results_file:
+            json.dump(results, results_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressed = list(regressions(results, baseline, args.threshold))
+        if regressed:
+            print(f'\nRegressions over {args.threshold:.0%}:')
+            for regression in regressed:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'\nNo regression over {args.threshold:.0%} against {args.baseline}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Deduplication of links across the crawl stages.
+
+A single broker has thousands of listings and overlapping filter pages repeat
+property links, so the link feeds and links files are full of duplicates.
+``SeenIndex`` remembers links as 64-bit hashes in a sorted array, about 8
+bytes per link, instead of keeping the strings themselves.
+
+"""
+from array import array
+from bisect import bisect_left
+
+from itemadapter import ItemAdapter
+from scrapy.extensions.feedexport import ItemFilter
+
+
+class SeenIndex:
+    """Compact set of seen keys.
+
+    New hashes go to a small buffer which is merged into the sorted array
+    once it holds ``buffer_size`` hashes. Two keys with the same 64-bit hash
+    are taken for one, which is negligible for a few million links. Hashes
+    are the built-in ``hash`` ones, so an index lives within one process.
+
+    """
+    def __init__(self, buffer_size=65536):
+        self.buffer_size = buffer_size
+        self._sorted = array('q')
+        self._buffer = set()
+
+    def __len__(self):
+        return len(self._sorted) + len(self._buffer)
+
+    def __contains__(self, key):
+        return self._contains(hash(key))
+
+    def _contains(self, hashed):
+        if hashed in self._buffer:
+            return True
+        index = bisect_left(self._sorted, hashed)
+        return index < len(self._sorted) and self._sorted[index] == hashed
+
+    def add(self, key):
+        """Add ``key`` and return True if it was not seen before.
+
+        """
+        hashed = hash(key)
+        if self._contains(hashed):
+            return False
+        self._buffer.add(hashed)
+        if len(self._buffer) >= self.buffer_size:
+            self._merge()
+        return True
+
+    def _merge(self):
+        # Merges the two sorted runs straight into a new array, so the only
+        # extra memory is that array. The buffer is small, each of its hashes
+        # is placed by bisection and the runs of the array between them are
+        # copied in C.
+        merged = array('q')
+        start = 0
+        for hashed in sorted(self._buffer):
+            end = bisect_left(self._sorted, hashed, start)
+            merged.extend(self._sorted[start:end])
+            merged.append(hashed)
+            start = end
+        merged.extend(self._sorted[start:])
+        self._sorted = merged
+        self._buffer = set()
+
+
+class RequiredFieldFilter(ItemFilter):
+    """Feed item filter which skips items with an empty ``required_field``.
+
+    The link spiders blank duplicate links, so each link feed gets a link once.
+
+    """
+    def __init__(self, feed_options):
+        super().__init__(feed_options)
+        self.required_field = feed_options['required_field']
+
+    def accepts(self, item):
+        return super().accepts(item) and bool(ItemAdapter(item).get(self.required_field))
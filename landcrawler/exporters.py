@@ -0,0 +1,145 @@
+"""Feed exporters of the project.
+
+``ParquetItemExporter`` writes items into a Parquet file with a typed schema.
+Rows are buffered column by column and written as a row group once
+``row_group_size`` of them are collected, so memory stays bounded by one row
+group. It needs pyarrow, which is an optional dependency.
+``TimedCsvItemExporter`` is Scrapy's CSV exporter timed as ``export/csv``.
+
+"""
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from scrapy.exporters import BaseItemExporter, CsvItemExporter
+
+from landcrawler.instrument import timer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def _to_int(value):
+    return int(float(value)) if isinstance(value, str) else int(value)
+
+
+# Feed field type name -> (pyarrow type factory name, converter).
+FIELD_TYPES = {
+    'string': ('string', str),
+    'int64': ('int64', _to_int),
+    'float64': ('float64', float),
+}
+
+
+def parquet_feeds(feeds, field_types=None):
+    """Return ``feeds`` options which write Parquet with ``field_types`` instead of CSV.
+
+    Parquet files can not be appended to, so every run writes a new file into
+    a directory named after the feed, which readers load as one dataset.
+
+    """
+    parquet = {}
+    for uri, options in feeds.items():
+        path = str(uri)
+        stem = path[:-len('.csv')] if path.endswith('.csv') else path
+        options = dict(options, format='parquet', overwrite=True,
+                       item_export_kwargs={'field_types': field_types or {}})
+        parquet[f'{stem}/%(time)s.parquet'] = options
+    return parquet
+
+
+class TimedCsvItemExporter(CsvItemExporter):
+    """CSV exporter which times every exported item.
+
+    """
+    def export_item(self, item):
+        with timer('export/csv'):
+            super().export_item(item)
+
+
+class ParquetItemExporter(BaseItemExporter):
+    """Exports items into a Parquet file, batched in row groups.
+
+    ``field_types`` maps a field to one of FIELD_TYPES, other fields are
+    strings. Values which do not convert to their field type and empty
+    values are written as nulls.
+
+    """
+    def __init__(self, file, *, field_types=None, compression='zstd', row_group_size=10_000,
+                 **kwargs):
+        if pyarrow is None:
+            raise NotConfigured('ParquetItemExporter requires pyarrow')
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.field_types = field_types or {}
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self._writer = None
+        self._schema = None
+        self._converters = None
+        self._columns = None
+        self._rows = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, file, **kwargs):
+        settings = crawler.settings
+        kwargs.setdefault('compression', settings.get('PARQUET_COMPRESSION'))
+        kwargs.setdefault('row_group_size', settings.getint('PARQUET_ROW_GROUP_SIZE'))
+        return cls(file, **kwargs)
+
+    def _start(self, fields):
+        self.fields_to_export = list(fields)
+        schema = []
+        self._converters = []
+        for field in self.fields_to_export:
+            arrow_type, converter = FIELD_TYPES[self.field_types.get(field, 'string')]
+            schema.append((field, getattr(pyarrow, arrow_type)()))
+            self._converters.append(converter)
+        self._schema = pyarrow.schema(schema)
+        self._columns = [[] for _ in self.fields_to_export]
+        self._writer = pyarrow.parquet.ParquetWriter(
+            self.file, self._schema, compression=self.compression)
+
+    def export_item(self, item):
+        with timer('export/parquet'):
+            self._export_item(item)
+
+    def _export_item(self, item):
+        if self._writer is None:
+            # Without ``fields`` in the feed options the first item tells them.
+            self._start(self.fields_to_export or ItemAdapter(item).field_names())
+        values = dict(self._get_serialized_fields(item, default_value=None))
+        for column, converter, field in zip(
+                self._columns, self._converters, self.fields_to_export):
+            value = values.get(field)
+            if value is None or value == '':
+                column.append(None)
+                continue
+            try:
+                column.append(converter(value))
+            except (TypeError, ValueError):
+                column.append(None)
+        self._rows += 1
+        if self._rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            arrays = [pyarrow.array(column, field.type)
+                      for column, field in zip(self._columns, self._schema)]
+            self._writer.write_table(
+                pyarrow.Table.from_arrays(arrays, schema=self._schema),
+                row_group_size=self._rows,
+            )
+            self._columns = [[] for _ in self.fields_to_export]
+            self._rows = 0
+
+    def finish_exporting(self):
+        if self._writer is None:
+            if not self.fields_to_export:
+                return
+            # A feed without items still gets a valid file with the schema.
+            self._start(self.fields_to_export)
+        self._flush()
+        self._writer.close()
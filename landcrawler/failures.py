@@ -0,0 +1,184 @@
+"""Classification, retries and dead letters of pages which can not be parsed.
+
+Extraction raises ``ParseFailure`` instead of writing a mostly empty item
+when the serverState of a page can not be read. ``classify`` tells why from
+the page text:
+
+``truncated``        the page ends before ``</html>``, the body was cut short;
+``no_server_state``  a complete page without serverState, likely a block or
+                     captcha page;
+``schema_drift``     serverState is there but not in the expected shape.
+
+``ParseFailureMiddleware`` fetches the pages of the first two, which are
+transient, again after a backoff and through another proxy of the pool.
+Pages which keep failing and schema drift ones are written to a dead letter
+file with their raw body, so they can be debugged offline.
+
+"""
+import csv
+import logging
+import pathlib
+from hashlib import blake2b
+
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+
+from landcrawler.serverstate import SERVER_STATE_MARKER
+
+
+logger = logging.getLogger(__name__)
+
+TRUNCATED = 'truncated'
+NO_SERVER_STATE = 'no_server_state'
+SCHEMA_DRIFT = 'schema_drift'
+KINDS = (TRUNCATED, NO_SERVER_STATE, SCHEMA_DRIFT)
+TRANSIENT = frozenset({TRUNCATED, NO_SERVER_STATE})
+
+
+def classify(page):
+    """Return the kind of failure of a page whose serverState could not be read.
+
+    ``page`` is the page text or its UTF-8 bytes.
+
+    """
+    if isinstance(page, bytes):
+        closing, marker = b'</html>', SERVER_STATE_MARKER.encode()
+    else:
+        closing, marker = '</html>', SERVER_STATE_MARKER
+    if closing not in page[-1024:].lower():
+        return TRUNCATED
+    if marker not in page:
+        return NO_SERVER_STATE
+    return SCHEMA_DRIFT
+
+
+class ParseFailure(Exception):
+    """Raised by extraction steps for a page which can not be parsed.
+
+    It is picklable, so it comes back from parse pool workers.
+
+    """
+    def __init__(self, kind, message):
+        super().__init__(kind, message)
+        self.kind = kind
+        self.message = message
+
+    def __str__(self):
+        return f'{self.kind}: {self.message}'
+
+    @classmethod
+    def of_page(cls, page, message):
+        return cls(classify(page), message)
+
+    @property
+    def transient(self):
+        return self.kind in TRANSIENT
+
+
+class ParseFailureMiddleware:
+    """Spider middleware which retries or dead-letters pages raising ParseFailure.
+
+    Transient failures are fetched again up to PARSE_RETRY_TIMES times,
+    PARSE_RETRY_BACKOFF seconds later, doubled every time up to
+    PARSE_RETRY_MAX_BACKOFF, bypassing the HTTP cache and excluding the
+    proxy which served the page. Other failures go to
+    DEADLETTER_DIR/<spider name>.csv and the body to a file of
+    DEADLETTER_DIR/<spider name>/, then the spider's ``parse_failed`` is
+    called with the response if it has one. The ``parse_failures/*`` stats
+    count the failures, retries and dead letters of every kind and the
+    failure rate of the responses. In offline replays nothing is retried.
+
+    """
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_retries = settings.getint('PARSE_RETRY_TIMES')
+        self.backoff = settings.getfloat('PARSE_RETRY_BACKOFF')
+        self.max_backoff = settings.getfloat('PARSE_RETRY_MAX_BACKOFF')
+        self.offline = settings.getbool('HTTPCACHE_OFFLINE')
+        self.deadletter_dir = pathlib.Path(settings.get('DEADLETTER_DIR'))
+        self.deadletter_path = None
+        self.bodies_dir = None
+        self.pending = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        name = f'{spider.name}{getattr(spider, "shard_suffix", "")}'
+        self.deadletter_path = self.deadletter_dir / f'{name}.csv'
+        self.bodies_dir = self.deadletter_dir / name
+
+    def spider_idle(self, spider):
+        if self.pending:
+            # Retries are waiting for their backoff.
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in self.pending:
+            call.cancel()
+        self.pending.clear()
+
+    def process_spider_exception(self, response, exception, spider):
+        if not isinstance(exception, ParseFailure):
+            return None
+        kind = exception.kind
+        self.stats.inc_value(f'parse_failures/{kind}')
+        responses = self.stats.get_value('response_received_count', 0)
+        if responses:
+            self.stats.set_value(
+                f'parse_failures/rate/{kind}',
+                round(self.stats.get_value(f'parse_failures/{kind}') / responses, 4))
+        retries = response.meta.get('parse_retries', 0)
+        if exception.transient and retries < self.max_retries and not self.offline:
+            self.retry(response.request, retries, exception)
+        else:
+            spider.logger.error(
+                "Page %s can not be parsed after %s retries, %s", response.url, retries, exception)
+            self.write_dead_letter(response, exception, retries)
+            parse_failed = getattr(spider, 'parse_failed', None)
+            if parse_failed is not None:
+                parse_failed(response)
+        return []
+
+    def retry(self, request, retries, exception):
+        from twisted.internet import reactor
+        delay = min(self.backoff * 2 ** retries, self.max_backoff)
+        meta = dict(request.meta, parse_retries=retries + 1, dont_cache=True)
+        if 'pool_proxy' in meta:
+            meta['proxy_exclude'] = meta['pool_proxy']
+        for key in ('download_slot', 'download_latency', 'download_timeout'):
+            meta.pop(key, None)
+        retry_request = request.replace(meta=meta, dont_filter=True)
+        self.stats.inc_value(f'parse_failures/retried/{exception.kind}')
+        logger.info("Retrying %s in %.1f s (%s of %s), %s",
+                    request.url, delay, retries + 1, self.max_retries, exception)
+        call = reactor.callLater(delay, self.schedule, retry_request)
+        self.pending.add(call)
+
+    def schedule(self, request):
+        self.pending = {call for call in self.pending if call.active()}
+        self.crawler.engine.crawl(request)
+
+    def write_dead_letter(self, response, exception, retries):
+        self.stats.inc_value(f'parse_failures/dead_letter/{exception.kind}')
+        self.bodies_dir.mkdir(parents=True, exist_ok=True)
+        # Content addressed, the same block page is kept once.
+        body_path = self.bodies_dir / f'{blake2b(response.body, digest_size=16).hexdigest()}.html'
+        if not body_path.exists():
+            body_path.write_bytes(response.body)
+        new = not self.deadletter_path.exists()
+        with open(self.deadletter_path, 'a', encoding='utf-8', newline='') as deadletter_file:
+            writer = csv.writer(deadletter_file)
+            if new:
+                writer.writerow(['kind', 'url', 'status', 'retries', 'error', 'body'])
+            writer.writerow([
+                exception.kind, response.url, response.status, retries, exception.message,
+                body_path.relative_to(self.deadletter_dir).as_posix(),
+            ])
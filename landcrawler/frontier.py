@@ -0,0 +1,165 @@
+"""On-disk crawl frontier which lets the link spiders resume interrupted runs.
+
+Every link of a spider's links file is kept in a SQLite table together with
+its state: pending, in_flight, scraped, done or failed. A run takes pending
+links, marks them in flight and marks them scraped once their items are
+handed to the feeds. Scraped links become done only at a checkpoint, when
+the feed files are flushed or closed, so a restarted run continues with what
+is left and does not skip rows which never reached the disk. When nothing is
+left the next run starts over with the links of the links file.
+
+"""
+import os
+import pathlib
+import sqlite3
+import time
+
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+SCRAPED = 'scraped'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Frontier:
+    """SQLite backed set of links with their crawl state.
+
+    State changes are committed in batches of ``commit_every``, a crash loses
+    at most that many completions, which are fetched again on resume. Before
+    every commit ``flush`` is called, if it returns True the items of all
+    scraped links are on disk and they are marked done.
+
+    """
+    def __init__(self, path, commit_every=500, flush=None):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.commit_every = commit_every
+        self.flush = flush
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS links ('
+            ' link TEXT PRIMARY KEY,'
+            ' state TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' updated REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS links_state ON links (state)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._connection.commit()
+
+    @staticmethod
+    def resumable(path):
+        """Return True if the frontier at ``path`` has unfinished links.
+
+        """
+        if not pathlib.Path(path).exists():
+            return False
+        frontier = Frontier(path)
+        try:
+            counts = frontier.counts()
+        finally:
+            frontier.close()
+        return bool(counts.get(PENDING) or counts.get(IN_FLIGHT) or counts.get(SCRAPED))
+
+    def seed(self, links_file, links):
+        """Add ``links`` read from ``links_file`` unless the file is unchanged.
+
+        Known links keep their state. Returns the number of new links.
+
+        """
+        stat = os.stat(links_file)
+        signature = f'{stat.st_size}:{stat.st_mtime_ns}'
+        key = f'seed:{pathlib.Path(links_file).resolve()}'
+        row = self._connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        if row and row[0] == signature:
+            return 0
+        before = self._connection.total_changes
+        now = time.time()
+        self._connection.executemany(
+            'INSERT OR IGNORE INTO links (link, state, updated) VALUES (?, ?, ?)',
+            ((link, PENDING, now) for link in links),
+        )
+        added = self._connection.total_changes - before
+        self._connection.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, signature))
+        self._connection.commit()
+        return added
+
+    def start_run(self):
+        """Prepare the links for a run and return True if it resumes a previous one.
+
+        Links left in flight or scraped but not checkpointed by an interrupted
+        run become pending again. If no link is pending, the previous run has
+        finished and the frontier is emptied, so the new run takes the links
+        of the current links file.
+
+        """
+        self._connection.execute(
+            'UPDATE links SET state = ? WHERE state IN (?, ?)', (PENDING, IN_FLIGHT, SCRAPED))
+        resumed = self._connection.execute(
+            'SELECT 1 FROM links WHERE state = ? LIMIT 1', (PENDING,)).fetchone() is not None
+        if not resumed:
+            self._connection.execute('DELETE FROM links')
+            self._connection.execute('DELETE FROM meta')
+        self._connection.commit()
+        return resumed
+
+    def take(self, batch_size=1000):
+        """Yield pending links, marking them in flight batch by batch.
+
+        """
+        while True:
+            rows = self._connection.execute(
+                'SELECT link FROM links WHERE state = ? LIMIT ?', (PENDING, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            now = time.time()
+            self._connection.executemany(
+                'UPDATE links SET state = ?, attempts = attempts + 1, updated = ? WHERE link = ?',
+                ((IN_FLIGHT, now, link) for link, in rows),
+            )
+            self._connection.commit()
+            for link, in rows:
+                yield link
+
+    def mark(self, link, state):
+        # Commits before the change, the items of ``link`` may not be handed
+        # to the feeds yet.
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+        self._connection.execute(
+            'UPDATE links SET state = ?, updated = ? WHERE link = ?', (state, time.time(), link))
+        self._uncommitted += 1
+
+    def commit(self):
+        if self.flush is not None and self.flush():
+            self._checkpoint()
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def checkpoint(self):
+        """Mark the scraped links done, their items are on disk.
+
+        """
+        self._checkpoint()
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def _checkpoint(self):
+        self._connection.execute(
+            'UPDATE links SET state = ?, updated = ? WHERE state = ?',
+            (DONE, time.time(), SCRAPED))
+
+    def counts(self):
+        return dict(self._connection.execute(
+            'SELECT state, COUNT(*) FROM links GROUP BY state').fetchall())
+
+    def close(self):
+        self.commit()
+        self._connection.close()
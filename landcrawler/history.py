@@ -0,0 +1,405 @@
+"""Change history of the details items between runs.
+
+Feeds only get snapshots, each run appends every item again. With
+HISTORY_ENABLED the details items also go into a ``HistoryStore`` per item
+type, ``HISTORY_DIR/property_details.sqlite`` and ``broker_details.sqlite``,
+which keeps the latest values of every link and a log of what changed:
+
+``added``    a link seen for the first time, with all its values;
+``changed``  one row per changed field, with the old and the new value;
+``removed``  a link of the previous snapshot which a complete run did not
+             see, with its last values.
+
+Items of a run are staged on disk while the crawl runs. At the end the
+staged items and the latest values are read ordered by link and diffed by
+``diff_sorted``, a streaming merge, so memory does not grow with the
+number of links. The log is indexed by time and by link.
+
+    python -m landcrawler.history history/property_details.sqlite --since 2026-10-01
+        [--until DATE] [--field price] [--kind changed] [--link LINK]
+
+writes the changes since a date as CSV.
+
+"""
+import argparse
+import csv
+import datetime
+import json
+import pathlib
+import sqlite3
+import sys
+import time
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from landcrawler.instrument import timer
+from landcrawler.items import BrokerDetails, PropertyDetails
+
+
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+# Sent by spiders with the ``link`` of a page which gave no item, so that a
+# complete run does not take it for a removed listing.
+link_seen = object()
+
+
+def original_url(request):
+    """Return the URL ``request`` was made for before any redirect, the key of its link.
+
+    """
+    return request.meta.get('redirect_urls', [request.url])[0]
+
+
+def encode_values(values):
+    """Return the canonical JSON of the field values of an item, None as it is.
+
+    """
+    if values is None:
+        return None
+    return json.dumps(values, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def diff_sorted(previous, current):
+    """Yield ``(link, previous row, current row)`` of two snapshots where they differ.
+
+    ``previous`` and ``current`` are iterables of ``(link, values JSON, ...)``
+    rows sorted by link, a missing row is None. Current values of None mean
+    the link was seen without values, it is neither changed nor removed.
+
+    """
+    previous, current = iter(previous), iter(current)
+    old = next(previous, None)
+    new = next(current, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield old[0], old, None
+            old = next(previous, None)
+        elif old is None or new[0] < old[0]:
+            if new[1] is not None:
+                yield new[0], None, new
+            new = next(current, None)
+        else:
+            if new[1] is not None and old[1] != new[1]:
+                yield new[0], old, new
+            old = next(previous, None)
+            new = next(current, None)
+
+
+def parse_time(value):
+    """Return the epoch seconds of an ISO date or date time, UTC unless it has an offset.
+
+    """
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def format_time(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat(
+        timespec='seconds')
+
+
+class HistoryStore:
+    """SQLite store of the latest values of every link and of their changes.
+
+    ``stage`` keeps the items of the current run, ``merge`` diffs them
+    against the latest values and logs the changes. Staged items are
+    committed in batches of ``commit_every``, a run which stops before the
+    merge leaves them to the next run of the same owner, which should not
+    merge a partial stage. Shards of a spider
+    share a store, each one is an owner and merges its own run.
+
+    """
+    def __init__(self, path, commit_every=500):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(self.path, timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS runs ('
+            ' run INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' owner TEXT NOT NULL,'
+            ' started REAL NOT NULL,'
+            ' merged REAL,'
+            ' complete INTEGER NOT NULL DEFAULT 0)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS staged ('
+            ' run INTEGER NOT NULL,'
+            ' link TEXT NOT NULL,'
+            ' vals TEXT,'
+            ' seen REAL NOT NULL,'
+            ' PRIMARY KEY (run, link))'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS latest ('
+            ' link TEXT PRIMARY KEY,'
+            ' vals TEXT NOT NULL,'
+            ' updated REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS changes ('
+            ' changed REAL NOT NULL,'
+            ' link TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' field TEXT,'
+            ' old TEXT,'
+            ' new TEXT,'
+            ' run INTEGER NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS changes_changed ON changes (changed)')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS changes_link ON changes (link, changed)')
+        self._connection.commit()
+        self.run = None
+
+    def start_run(self, owner):
+        """Start a run of ``owner``, or go on with its run which stopped before the merge.
+
+        """
+        row = self._connection.execute(
+            'SELECT run FROM runs WHERE owner = ? AND merged IS NULL ORDER BY run DESC LIMIT 1',
+            (owner,)
+        ).fetchone()
+        if row is not None:
+            self.run = row[0]
+        else:
+            self.run = self._connection.execute(
+                'INSERT INTO runs (owner, started) VALUES (?, ?)', (owner, time.time())).lastrowid
+            self._connection.commit()
+        return self.run
+
+    def stage(self, link, values, seen=None):
+        """Keep the ``values`` dict of ``link`` in this run, None if it was seen without them.
+
+        """
+        if values is None:
+            # An item of the link wins over seeing it without one.
+            self._connection.execute(
+                'INSERT OR IGNORE INTO staged (run, link, vals, seen) VALUES (?, ?, NULL, ?)',
+                (self.run, link, seen or time.time()))
+        else:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO staged (run, link, vals, seen) VALUES (?, ?, ?, ?)',
+                (self.run, link, encode_values(values), seen or time.time()))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def merge(self, complete=False):
+        """Log the changes of the staged items against the latest values and return their counts.
+
+        Only a ``complete`` run, which saw every link, logs removed links.
+
+        """
+        self.commit()
+        counts = {ADDED: 0, CHANGED: 0, REMOVED: 0, 'changed_fields': 0}
+        # A second connection reads a snapshot of both tables while the first
+        # one writes to them.
+        reader = sqlite3.connect(self.path, timeout=60)
+        try:
+            reader.execute('BEGIN')
+            staged = reader.execute(
+                'SELECT link, vals, seen FROM staged WHERE run = ? ORDER BY link', (self.run,))
+            latest = reader.execute('SELECT link, vals FROM latest ORDER BY link')
+            now = time.time()
+            for link, old, new in diff_sorted(latest, staged):
+                if old is None:
+                    counts[ADDED] += 1
+                    _, values, seen = new
+                    self._log(seen, link, ADDED, None, None, values)
+                    self._connection.execute(
+                        'INSERT OR REPLACE INTO latest (link, vals, updated) VALUES (?, ?, ?)',
+                        (link, values, seen))
+                elif new is None:
+                    if not complete:
+                        continue
+                    counts[REMOVED] += 1
+                    self._log(now, link, REMOVED, None, old[1], None)
+                    self._connection.execute('DELETE FROM latest WHERE link = ?', (link,))
+                else:
+                    counts[CHANGED] += 1
+                    _, values, seen = new
+                    old_values, new_values = json.loads(old[1]), json.loads(values)
+                    for field in sorted(old_values.keys() | new_values.keys()):
+                        if old_values.get(field) != new_values.get(field):
+                            counts['changed_fields'] += 1
+                            self._log(seen, link, CHANGED, field,
+                                      encode_values(old_values.get(field)),
+                                      encode_values(new_values.get(field)))
+                    self._connection.execute(
+                        'UPDATE latest SET vals = ?, updated = ? WHERE link = ?',
+                        (values, seen, link))
+                self._changed()
+        finally:
+            reader.close()
+        self._connection.execute('DELETE FROM staged WHERE run = ?', (self.run,))
+        self._connection.execute(
+            'UPDATE runs SET merged = ?, complete = ? WHERE run = ?',
+            (time.time(), int(complete), self.run))
+        self.commit()
+        return counts
+
+    def _log(self, changed, link, kind, field, old, new):
+        self._connection.execute(
+            'INSERT INTO changes (changed, link, kind, field, old, new, run)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (changed, link, kind, field, old, new, self.run))
+
+    def _changed(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def changes(self, since, until=None, field=None, kind=None, link=None):
+        """Yield ``(changed, link, kind, field, old, new)`` logged from ``since`` on, oldest first.
+
+        Times are epoch seconds, values JSON.
+
+        """
+        query = 'SELECT changed, link, kind, field, old, new FROM changes WHERE changed >= ?'
+        params = [since]
+        if until is not None:
+            query += ' AND changed < ?'
+            params.append(until)
+        for column, value in (('field', field), ('kind', kind), ('link', link)):
+            if value is not None:
+                query += f' AND {column} = ?'
+                params.append(value)
+        yield from self._connection.execute(query + ' ORDER BY changed', params)
+
+    def commit(self):
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self._connection.close()
+
+
+class HistoryExtension:
+    """Records the details items of a crawl in the ``HistoryStore`` of their type.
+
+    Items are staged in the store of their type as they are scraped and
+    merged when the spider finishes. A run which stops before leaves its
+    items staged for the next run of the spider to go on with. Items are
+    keyed by the URL their link was requested for, before redirects, like
+    failed links. Dropped items and the ``link_seen`` signal count as seen
+    links, so that a complete run does not take them for removed listings.
+    A run is complete when it finished and crawled the whole links file: no
+    line range, no shard, no incremental skipping and no resumed frontier,
+    whose earlier items may not all have been staged. Fused crawls have no
+    links file and never are.
+
+    """
+    stores = {PropertyDetails: 'property_details', BrokerDetails: 'broker_details'}
+
+    def __init__(self, history_dir, stats):
+        self.history_dir = pathlib.Path(history_dir)
+        self.stats = stats
+        self.owner = None
+        self.open_stores = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('HISTORY_ENABLED'):
+            raise NotConfigured
+        extension = cls(settings.get('HISTORY_DIR'), crawler.stats)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(extension.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(extension.link_seen, signal=link_seen)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.owner = f'{spider.name}{getattr(spider, "shard_suffix", "")}'
+
+    def store(self, item_class):
+        name = self.stores.get(item_class)
+        if name is None:
+            return None
+        store = self.open_stores.get(name)
+        if store is None:
+            store = self.open_stores[name] = HistoryStore(self.history_dir / f'{name}.sqlite')
+            store.start_run(self.owner)
+        return store
+
+    def item_scraped(self, item, response, spider):
+        store = self.store(type(item))
+        if store is not None:
+            with timer('history/stage'):
+                values = ItemAdapter(item).asdict()
+                del values['link']
+                store.stage(original_url(response.request), values)
+
+    def item_dropped(self, item, response, exception, spider):
+        store = self.store(type(item))
+        if store is not None:
+            store.stage(original_url(response.request), None)
+
+    def link_seen(self, link, item_class):
+        store = self.store(item_class)
+        if store is not None:
+            store.stage(link, None)
+
+    def spider_closed(self, spider, reason):
+        if reason != 'finished':
+            for name, store in self.open_stores.items():
+                store.close()
+                spider.logger.info(
+                    'History of %s not merged, the run stopped (%s); its items stay staged.',
+                    name, reason)
+            self.open_stores = {}
+            return
+        complete = (getattr(spider, 'links_file', None) is not None
+                    and getattr(spider, 'lines', None) is None
+                    and not getattr(spider, 'shards', None)
+                    and getattr(spider, 'fingerprints', None) is None
+                    and not getattr(spider, 'resumed', False))
+        for name, store in self.open_stores.items():
+            with timer('history/merge'):
+                counts = store.merge(complete)
+            store.close()
+            for key, count in counts.items():
+                self.stats.set_value(f'history/{name}/{key}', count)
+            spider.logger.info(
+                'History of %s: %s added, %s changed (%s fields), %s removed.', name,
+                counts['added'], counts['changed'], counts['changed_fields'], counts['removed'])
+        self.open_stores = {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write the changes of a history store as CSV.')
+    parser.add_argument('store', help='history store, e.g. history/property_details.sqlite')
+    parser.add_argument('--since', required=True, help='ISO date or date time, UTC by default')
+    parser.add_argument('--until', help='ISO date or date time, exclusive')
+    parser.add_argument('--field')
+    parser.add_argument('--kind', choices=[ADDED, CHANGED, REMOVED])
+    parser.add_argument('--link')
+    args = parser.parse_args(argv)
+    if not pathlib.Path(args.store).exists():
+        parser.error(f'{args.store} does not exist')
+    store = HistoryStore(args.store)
+    try:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['changed', 'link', 'kind', 'field', 'old', 'new'])
+        for changed, *row in store.changes(
+                parse_time(args.since), args.until and parse_time(args.until),
+                args.field, args.kind, args.link):
+            writer.writerow([format_time(changed), *row])
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
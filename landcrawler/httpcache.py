@@ -0,0 +1,254 @@
+"""Compressed on-disk HTTP cache storage for parser development and replays.
+
+``CompressedCacheStorage`` plugs into Scrapy's HttpCacheMiddleware through
+HTTPCACHE_STORAGE. Response bodies are compressed and stored once per
+content, named after their hash, and a SQLite index maps the request
+fingerprint to the status, headers and body of the response. All spiders
+share one store, so pages fetched by one of them are replayed for the
+others. zstd compression needs zstandard, an optional dependency; without
+it bodies are stored gzip compressed.
+
+"""
+import gzip
+import logging
+import os
+import pathlib
+import sqlite3
+import time
+from hashlib import blake2b
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor(level=10).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# Compression name -> (file suffix, compress, decompress).
+CODECS = {
+    'zstd': ('.zst', _zstd_compress, _zstd_decompress),
+    'gzip': ('.gz', gzip.compress, gzip.decompress),
+}
+DECOMPRESSORS = {suffix: decompress for suffix, _, decompress in CODECS.values()}
+
+
+def offline_settings(settings):
+    """Turn ``settings`` into the offline replay ones of HTTPCACHE_OFFLINE.
+
+    Every response comes from the cache, whatever its age, and requests
+    which are not cached are ignored instead of downloaded.
+
+    """
+    priority = settings.getpriority('HTTPCACHE_OFFLINE')
+    settings.set('HTTPCACHE_ENABLED', True, priority=priority)
+    settings.set('HTTPCACHE_IGNORE_MISSING', True, priority=priority)
+    settings.set('HTTPCACHE_EXPIRATION_SECS', 0, priority=priority)
+
+
+class CompressedCacheStorage:
+    """HTTP cache storage with compressed, content-addressed bodies.
+
+    Entries older than HTTPCACHE_EXPIRATION_SECS are not served and are
+    removed at spider close. Once the bodies exceed HTTPCACHE_MAX_SIZE_MB
+    the least recently used entries are evicted, and bodies which no entry
+    refers to any more are deleted. Index updates are committed in batches
+    of ``commit_every``.
+
+    """
+    commit_every = 500
+
+    def __init__(self, settings):
+        self.cache_dir = pathlib.Path(data_path(settings['HTTPCACHE_DIR'], createdir=True))
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_size = settings.getfloat('HTTPCACHE_MAX_SIZE_MB') * 1024 * 1024
+        compression = settings.get('HTTPCACHE_COMPRESSION')
+        if compression == 'zstd' and zstandard is None:
+            logger.warning('HTTPCACHE_COMPRESSION is zstd but zstandard is not installed, '
+                           'bodies are stored gzip compressed.')
+            compression = 'gzip'
+        self.compression = compression
+        self.suffix, self.compress, _ = CODECS[compression]
+        self.stats = None
+        self._connection = None
+        self._fingerprinter = None
+        self._uncommitted = 0
+        self._size = 0
+
+    def open_spider(self, spider):
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.stats = spider.crawler.stats
+        (self.cache_dir / 'bodies').mkdir(parents=True, exist_ok=True)
+        # Shards of a spider share the store, so writers wait for each other.
+        self._connection = sqlite3.connect(self.cache_dir / 'index.sqlite', timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' fingerprint TEXT PRIMARY KEY,'
+            ' url TEXT NOT NULL,'
+            ' status INTEGER NOT NULL,'
+            ' headers BLOB NOT NULL,'
+            ' body TEXT NOT NULL,'
+            ' stored REAL NOT NULL,'
+            ' accessed REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_body ON responses (body)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS bodies ('
+            ' digest TEXT PRIMARY KEY,'
+            ' file TEXT NOT NULL,'
+            ' size INTEGER NOT NULL)'
+        )
+        self._connection.commit()
+        self._size = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+        spider.logger.info(
+            'HTTP cache %s: %s responses, %.1f MB of %s compressed bodies',
+            self.cache_dir, self.count(), self._size / 1024 / 1024, self.compression)
+
+    def close_spider(self, spider):
+        if self.expiration_secs > 0:
+            cursor = self._connection.execute(
+                'DELETE FROM responses WHERE stored < ?', (time.time() - self.expiration_secs,))
+            self.inc_stat('httpcache/expired', cursor.rowcount)
+        self.evict()
+        self.delete_orphans()
+        self._connection.commit()
+        self._connection.close()
+
+    def count(self):
+        return self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def inc_stat(self, key, count=1):
+        if count:
+            self.stats.inc_value(key, count)
+
+    def retrieve_response(self, spider, request):
+        """Return the cached response of ``request`` or None.
+
+        """
+        key = self._fingerprinter.fingerprint(request).hex()
+        row = self._connection.execute(
+            'SELECT responses.url, status, headers, stored, file FROM responses'
+            ' JOIN bodies ON bodies.digest = responses.body WHERE fingerprint = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, raw_headers, stored, file = row
+        if 0 < self.expiration_secs < time.time() - stored:
+            return None
+        path = self.cache_dir / 'bodies' / file
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            # Evicted by another process sharing the store.
+            return None
+        if path.suffix == '.zst' and zstandard is None:
+            logger.warning('Cached body %s needs zstandard to be read.', path)
+            return None
+        body = DECOMPRESSORS[path.suffix](data)
+        self._connection.execute(
+            'UPDATE responses SET accessed = ? WHERE fingerprint = ?', (time.time(), key))
+        self._changed()
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        key = self._fingerprinter.fingerprint(request).hex()
+        digest = blake2b(response.body, digest_size=16).hexdigest()
+        if self._connection.execute(
+                'SELECT 1 FROM bodies WHERE digest = ?', (digest,)).fetchone() is None:
+            file = f'{digest[:2]}/{digest}{self.suffix}'
+            path = self.cache_dir / 'bodies' / file
+            path.parent.mkdir(exist_ok=True)
+            data = self.compress(response.body)
+            temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+            self._connection.execute(
+                'INSERT OR REPLACE INTO bodies (digest, file, size) VALUES (?, ?, ?)',
+                (digest, file, len(data)))
+            self._size += len(data)
+            self.inc_stat('httpcache/stored_bytes', len(data))
+            self.inc_stat('httpcache/body_bytes', len(response.body))
+        else:
+            self.inc_stat('httpcache/shared_bodies')
+        now = time.time()
+        self._connection.execute(
+            'INSERT OR REPLACE INTO responses'
+            ' (fingerprint, url, status, headers, body, stored, accessed)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, response.url, response.status,
+             headers_dict_to_raw(response.headers), digest, now, now))
+        self._changed()
+        if self.max_size and self._size > self.max_size:
+            self.evict()
+            self.delete_orphans()
+
+    def _changed(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self._connection.commit()
+            self._uncommitted = 0
+
+    def evict(self):
+        """Remove the least recently used entries until the bodies fit HTTPCACHE_MAX_SIZE_MB.
+
+        Eviction goes down to 90% of the limit, so it does not run on every store.
+
+        """
+        if not self.max_size or self._size <= self.max_size:
+            return
+        target = self.max_size * 0.9
+        # Bodies shared by several entries are freed only with the last of them.
+        rows = self._connection.execute(
+            'SELECT fingerprint, body, size FROM responses'
+            ' JOIN bodies ON bodies.digest = responses.body ORDER BY accessed'
+        ).fetchall()
+        references = dict(self._connection.execute(
+            'SELECT body, COUNT(*) FROM responses GROUP BY body').fetchall())
+        evicted = []
+        size = self._size
+        for key, digest, body_size in rows:
+            if size <= target:
+                break
+            evicted.append((key,))
+            references[digest] -= 1
+            if not references[digest]:
+                size -= body_size
+        self._connection.executemany('DELETE FROM responses WHERE fingerprint = ?', evicted)
+        self.inc_stat('httpcache/evicted', len(evicted))
+
+    def delete_orphans(self):
+        """Delete the bodies which no entry refers to.
+
+        """
+        orphans = self._connection.execute(
+            'SELECT digest, file, size FROM bodies'
+            ' WHERE NOT EXISTS (SELECT 1 FROM responses WHERE responses.body = bodies.digest)'
+        ).fetchall()
+        for digest, file, size in orphans:
+            (self.cache_dir / 'bodies' / file).unlink(missing_ok=True)
+            self._size -= size
+        self._connection.executemany(
+            'DELETE FROM bodies WHERE digest = ?', ((digest,) for digest, _, _ in orphans))
+        self._connection.commit()
+        self._uncommitted = 0
@@ -0,0 +1,95 @@
+"""Fingerprints of links from previous runs for incremental re-crawls.
+
+With INCREMENTAL_ENABLED the listings spider writes a property link only if
+its listing card changed since the previous run, and the details spiders
+send the HTTP validators of the previous response and write an item only if
+its content changed, so a refresh emits just the delta rows.
+
+"""
+import pathlib
+import sqlite3
+import time
+from hashlib import blake2b
+
+
+def fingerprint(values):
+    """Return a short stable hash of ``values``.
+
+    """
+    digest = blake2b(digest_size=12)
+    for value in values:
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class FingerprintStore:
+    """SQLite backed map of a link to its fingerprint and HTTP validators.
+
+    A fingerprint must not be kept before the row it stands for is on disk,
+    or a killed run would never write that row again. Updates are held by
+    their ``owner``, the links file link whose rows carry them, until
+    ``write`` once the owner is done, and written updates are kept only
+    from the next ``commit`` on, which the spider makes when its feeds are
+    flushed. Updates of owners which are not written are dropped.
+
+    """
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._pending = {}
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            ' link TEXT PRIMARY KEY,'
+            ' fingerprint TEXT,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' updated REAL NOT NULL)'
+        )
+        self._connection.commit()
+
+    def get(self, link):
+        """Return ``(fingerprint, etag, last_modified)`` of ``link`` or None.
+
+        """
+        return self._connection.execute(
+            'SELECT fingerprint, etag, last_modified FROM fingerprints WHERE link = ?', (link,)
+        ).fetchone()
+
+    def update(self, owner, link, fingerprint, etag=None, last_modified=None):
+        """Hold the fingerprint of ``link`` for ``owner``, return True if it changed.
+
+        """
+        previous = self.get(link)
+        if previous != (fingerprint, etag, last_modified):
+            self._pending.setdefault(owner, []).append(
+                (link, fingerprint, etag, last_modified, time.time()))
+        return previous is None or previous[0] != fingerprint
+
+    def write(self, owner):
+        """Write the updates of ``owner``, whose rows are handed to the feeds.
+
+        """
+        rows = self._pending.pop(owner, None)
+        if rows:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO fingerprints'
+                ' (link, fingerprint, etag, last_modified, updated) VALUES (?, ?, ?, ?, ?)',
+                rows,
+            )
+
+    def discard(self, owner):
+        self._pending.pop(owner, None)
+
+    def commit(self):
+        """Keep the written updates, their rows are on disk.
+
+        """
+        self._connection.commit()
+
+    def close(self):
+        self.commit()
+        self._connection.close()
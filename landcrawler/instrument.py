@@ -0,0 +1,356 @@
+"""Timing of the hot path stages of a crawl.
+
+``timer(stage)`` adds how long its block took to the histogram of ``stage``
+in the process wide ``TIMINGS``. Stages are named ``<kind>/<name>``:
+``callback/*`` spider callbacks, ``extract/*`` extraction steps,
+``serverstate/*`` locating and decoding window.serverState, ``selector/*``
+DOM building and queries, ``export/*`` feed exporters and ``pipeline/*``
+item pipelines. Extraction run in parse pool workers goes through
+``timed_call``, which sends the timings of the worker back with the result.
+
+``InstrumentationExtension`` reports the histograms as ``timing/<stage>/*``
+stats and logs the costliest stages every INSTRUMENT_LOG_INTERVAL seconds.
+``TimingSpiderMiddleware`` times the callbacks and runs cProfile on a share
+of responses, which can be changed while the crawl runs by writing it to
+the INSTRUMENT_PROFILE_FILE file.
+
+"""
+import cProfile
+import logging
+import math
+import pathlib
+import random
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets per doubling of the duration in microseconds.
+BUCKETS_PER_OCTAVE = 4
+BUCKETS = 26 * BUCKETS_PER_OCTAVE
+
+ENABLED = True
+
+
+class Histogram:
+    """Count, total, maximum and log scale buckets of durations.
+
+    """
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        micros = seconds * 1_000_000
+        bucket = int(math.log2(micros) * BUCKETS_PER_OCTAVE) if micros > 1 else 0
+        self.buckets[min(bucket, BUCKETS - 1)] += 1
+
+    def merge(self, raw):
+        count, total, maximum, buckets = raw
+        self.count += count
+        self.total += total
+        self.max = max(self.max, maximum)
+        for index, bucket in enumerate(buckets):
+            self.buckets[index] += bucket
+
+    def raw(self):
+        return self.count, self.total, self.max, self.buckets
+
+    def percentile(self, fraction):
+        """Return the duration below which ``fraction`` of them are, within a bucket.
+
+        """
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                return min(2 ** ((index + 0.5) / BUCKETS_PER_OCTAVE) / 1_000_000, self.max)
+        return self.max
+
+
+class Timings:
+    """Histograms of the stages.
+
+    """
+    def __init__(self):
+        self.histograms = {}
+
+    def add(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.add(seconds)
+
+    def merge(self, raw):
+        for stage, histogram_raw in raw.items():
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.merge(histogram_raw)
+
+    def drain(self):
+        """Return the picklable histograms and start over.
+
+        """
+        raw = {stage: histogram.raw() for stage, histogram in self.histograms.items()}
+        self.histograms = {}
+        return raw
+
+
+TIMINGS = Timings()
+
+
+class timer:
+    """Context manager which times its block as ``stage``.
+
+    """
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if ENABLED:
+            TIMINGS.add(self.stage, time.perf_counter() - self.started)
+
+
+def timed_call(func, *args):
+    """Return ``func(*args)`` and the timings it recorded, for parse pool workers.
+
+    """
+    TIMINGS.drain()
+    with timer(f'extract/{func.__qualname__}'):
+        result = func(*args)
+    return result, TIMINGS.drain()
+
+
+class Profiler:
+    """cProfile of a share of the spider callbacks.
+
+    Only one callback is profiled at a time, the statistics add up until
+    they are dumped.
+
+    """
+    def __init__(self, rate=0.0):
+        self.rate = rate
+        self.profile = None
+        self.active = False
+        self.samples = 0
+        self.dumped = 0
+
+    def sample(self):
+        """Return True if the next callback is to be profiled.
+
+        """
+        if not self.rate or self.active or random.random() >= self.rate:
+            return False
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+        self.active = True
+        self.samples += 1
+        return True
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def finish(self):
+        self.active = False
+
+    def dump(self, path):
+        """Write the statistics to ``path`` if callbacks were profiled since the last dump.
+
+        """
+        if self.profile is None or self.active or self.samples == self.dumped:
+            return False
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.profile.dump_stats(path)
+        self.dumped = self.samples
+        return True
+
+
+PROFILER = Profiler()
+
+
+class TimingSpiderMiddleware:
+    """Spider middleware which times the spider callbacks as ``callback/<name>``.
+
+    Only the time spent inside the callback counts, not the processing of
+    what it yields. Awaiting a parse pool worker is included. Sampled
+    callbacks run under the PROFILER, unless the spider has a parse pool:
+    the extraction then runs in the workers and the profile would only show
+    what the reactor does meanwhile.
+
+    """
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INSTRUMENT_ENABLED'):
+            raise NotConfigured
+        return cls()
+
+    @staticmethod
+    def stage(response, spider):
+        callback = response.request.callback if response.request is not None else None
+        return f'callback/{getattr(callback, "__name__", "parse")}'
+
+    @staticmethod
+    def sample(spider):
+        return getattr(spider, 'parse_pool', None) is None and PROFILER.sample()
+
+    def process_spider_output(self, response, result, spider):
+        stage = self.stage(response, spider)
+        profiled = self.sample(spider)
+        elapsed = 0.0
+        iterator = iter(result)
+        try:
+            while True:
+                started = time.perf_counter()
+                if profiled:
+                    PROFILER.enable()
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    if profiled:
+                        PROFILER.disable()
+                    elapsed += time.perf_counter() - started
+                yield output
+        finally:
+            if profiled:
+                PROFILER.finish()
+            TIMINGS.add(stage, elapsed)
+
+    async def process_spider_output_async(self, response, result, spider):
+        stage = self.stage(response, spider)
+        profiled = self.sample(spider)
+        elapsed = 0.0
+        iterator = result.__aiter__()
+        try:
+            while True:
+                started = time.perf_counter()
+                if profiled:
+                    PROFILER.enable()
+                try:
+                    output = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    if profiled:
+                        PROFILER.disable()
+                    elapsed += time.perf_counter() - started
+                yield output
+        finally:
+            if profiled:
+                PROFILER.finish()
+            TIMINGS.add(stage, elapsed)
+
+
+class InstrumentationExtension:
+    """Reports the stage timings as stats and a periodic log line.
+
+    Every INSTRUMENT_LOG_INTERVAL seconds the ``timing/*`` stats are updated,
+    the costliest stages are logged, the profiling rate is read from
+    INSTRUMENT_PROFILE_FILE if it exists and the profile statistics are
+    written to INSTRUMENT_PROFILE_DIR/<spider name>.pstats.
+
+    """
+    logged_stages = 6
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.interval = settings.getfloat('INSTRUMENT_LOG_INTERVAL')
+        self.default_rate = settings.getfloat('INSTRUMENT_PROFILE_RATE')
+        self.profile_file = pathlib.Path(settings.get('INSTRUMENT_PROFILE_FILE'))
+        self.profile_dir = pathlib.Path(settings.get('INSTRUMENT_PROFILE_DIR'))
+        self.profile_path = None
+        self.loop = task.LoopingCall(self.report)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        global ENABLED
+        ENABLED = crawler.settings.getbool('INSTRUMENT_ENABLED')
+        if not ENABLED:
+            raise NotConfigured
+        extension = cls(crawler)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        suffix = getattr(spider, 'shard_suffix', '')
+        self.profile_path = self.profile_dir / f'{spider.name}{suffix}.pstats'
+        PROFILER.rate = self.default_rate
+        self.update_profile_rate()
+        if self.interval > 0:
+            self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.loop.running:
+            self.loop.stop()
+        self.update_stats()
+        self.dump_profile()
+
+    def update_profile_rate(self):
+        try:
+            text = self.profile_file.read_text().strip()
+        except FileNotFoundError:
+            rate = self.default_rate
+        else:
+            try:
+                rate = float(text) if text else 1.0
+            except ValueError:
+                logger.warning('Profile rate %r of %s is not a number.', text, self.profile_file)
+                return
+        if rate != PROFILER.rate:
+            logger.info('Profiling %.1f%% of the callbacks.', rate * 100)
+            PROFILER.rate = rate
+
+    def update_stats(self):
+        for stage, histogram in TIMINGS.histograms.items():
+            prefix = f'timing/{stage}'
+            self.stats.set_value(f'{prefix}/count', histogram.count)
+            self.stats.set_value(f'{prefix}/total_ms', round(histogram.total * 1000, 1))
+            self.stats.set_value(f'{prefix}/mean_ms', round(histogram.total * 1000 / histogram.count, 3))
+            self.stats.set_value(f'{prefix}/p50_ms', round(histogram.percentile(0.5) * 1000, 3))
+            self.stats.set_value(f'{prefix}/p90_ms', round(histogram.percentile(0.9) * 1000, 3))
+            self.stats.set_value(f'{prefix}/p99_ms', round(histogram.percentile(0.99) * 1000, 3))
+            self.stats.set_value(f'{prefix}/max_ms', round(histogram.max * 1000, 3))
+
+    def report(self):
+        self.update_stats()
+        costliest = sorted(TIMINGS.histograms.items(), key=lambda stage: -stage[1].total)
+        if costliest:
+            logger.info('Timings: %s', ', '.join(
+                f'{stage} {histogram.count} x {histogram.total * 1000 / histogram.count:.2f} ms'
+                f' (p90 {histogram.percentile(0.9) * 1000:.2f} ms)'
+                for stage, histogram in costliest[:self.logged_stages]
+            ))
+        self.update_profile_rate()
+        self.dump_profile()
+
+    def dump_profile(self):
+        if PROFILER.dump(self.profile_path):
+            logger.info('Profile of %s callbacks written to %s.',
+                        PROFILER.samples, self.profile_path)
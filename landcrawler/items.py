@@ -2,11 +2,113 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
+#
+# Items are slotted dataclasses: no per-item dict, and itemadapter lets the
+# feed exporters and pipelines read their fields directly. Numeric fields are
+# converted when an item is created, values which do not convert are kept as
+# they are for NormalizationPipeline to parse or report.
+from dataclasses import dataclass
+
+
+STATUSES = {
+    1: "Available",
+    2: "Under Contract",
+    3: "Off Market",
+    4: "Sold",
+}
+
+
+def to_int(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return value
+
+
+def to_float(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def to_status(value):
+    """Return the label of a status code, a label is kept as it is.
+
+    """
+    if isinstance(value, str) or value is None:
+        return value or None
+    return STATUSES.get(value)
+
+
+@dataclass(slots=True)
+class ListingPage:
+    """Start link of a listing pages bucket found by ListingPagesSpider.
+
+    """
+    start_link: str
+    count: int
+    root_page: str
+
+
+@dataclass(slots=True)
+class ListingLinks:
+    """Property and broker profile links of a listing card.
+
+    """
+    link: str = None
+    profile_link: str = None
+    root_page: str = None
+
+
+@dataclass(slots=True)
+class PropertyDetails:
+    link: str
+    brokerLink: str = None
+    status: str = None
+    title: str = None
+    price: int = None
+    acres: float = None
+    address1: str = None
+    address2: str = None
+    city: str = None
+    state: str = None
+    zip: str = None
+    homesqft: int = None
+    beds: int = None
+    baths: int = None
+    halfBaths: int = None
+    type: str = None
+    propertyWebsite: str = None
 
-import scrapy
+    def __post_init__(self):
+        self.status = to_status(self.status)
+        self.price = to_int(self.price)
+        self.acres = to_float(self.acres)
+        self.homesqft = to_int(self.homesqft)
+        self.beds = to_int(self.beds)
+        self.baths = to_int(self.baths)
+        self.halfBaths = to_int(self.halfBaths)
 
 
-class LandcrawlerItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+@dataclass(slots=True)
+class BrokerDetails:
+    link: str
+    contactName: str = None
+    companyName: str = None
+    phoneCell: str = None
+    phoneOffice: str = None
+    email: str = None
+    companyWebsite: str = None
+    address1: str = None
+    address2: str = None
+    city: str = None
+    state: str = None
+    zip: str = None
@@ -0,0 +1,86 @@
+"""Streaming of links files into the scheduler.
+
+``read_links`` parses a links file with the csv module row by row and can
+pick a part of it, a range of lines or a hash shard. ``RequestFeeder`` hands
+requests made of the links to the engine only while few requests wait in
+the scheduler, so memory does not grow with the size of the links file.
+
+"""
+import csv
+import zlib
+
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+
+
+def parse_lines(lines):
+    """Return ``(start, stop)`` of a ``START:STOP`` line range, either may be empty.
+
+    """
+    start, _, stop = lines.partition(':')
+    return int(start) if start else 0, int(stop) if stop else None
+
+
+def in_shard(link, shard, shards):
+    """Return True if ``link`` belongs to ``shard`` of ``shards``.
+
+    Uses crc32, which is stable across processes unlike the built-in hash.
+
+    """
+    return zlib.crc32(link.encode('utf-8')) % shards == shard
+
+
+def read_links(path, lines=None, shard=None, shards=None):
+    """Yield the links of the first column of the links file ``path``.
+
+    ``lines`` is ``(start, stop)`` of the data rows to read, counted from 0
+    after the header line. ``shard`` of ``shards`` keeps only the links of
+    that hash shard.
+
+    """
+    start, stop = lines or (0, None)
+    with open(path, 'r', encoding='utf-8', newline='') as links_file:
+        reader = csv.reader(links_file)
+        next(reader, None)
+        for index, row in enumerate(reader):
+            if index < start:
+                continue
+            if stop is not None and index >= stop:
+                return
+            if not row or not row[0]:
+                continue
+            if shards and not in_shard(row[0], shard, shards):
+                continue
+            yield row[0]
+
+
+class RequestFeeder:
+    """Schedules ``requests`` while the scheduler has less than ``watermark`` requests.
+
+    The scheduler is topped up whenever a response arrives and when the
+    spider is idle, which is kept open until ``requests`` is exhausted.
+
+    """
+    def __init__(self, crawler, requests, watermark):
+        self.crawler = crawler
+        self.requests = iter(requests)
+        self.watermark = watermark
+        self.exhausted = False
+        crawler.signals.connect(self.feed, signal=signals.response_received)
+        crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+
+    def feed(self):
+        if self.exhausted:
+            return
+        engine = self.crawler.engine
+        while len(engine.slot.scheduler) < self.watermark:
+            request = next(self.requests, None)
+            if request is None:
+                self.exhausted = True
+                return
+            engine.crawl(request)
+
+    def spider_idle(self):
+        self.feed()
+        if not self.exhausted:
+            raise DontCloseSpider
@@ -2,10 +2,16 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+import logging
 import random
+import time
+from urllib.parse import urlparse
 
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
 
+from landcrawler.serverstate import SERVER_STATE_MARKER
 from landcrawler.settings import USER_AGENTS
 
 
@@ -103,3 +109,325 @@ class LandcrawlerDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class SlotState:
+    """Responses of one download slot since the last adjustment.
+
+    """
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.baseline = None
+        self.ceiling = None
+        self.backing_off = False
+        self.stable = 0
+        self.latencies = []
+        self.errors = 0
+        self.throttled = 0
+
+    @property
+    def responses(self):
+        return len(self.latencies) + self.errors
+
+    def reset(self):
+        self.latencies = []
+        self.errors = 0
+        self.throttled = 0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))]
+
+
+class AdaptiveConcurrencyMiddleware(LandcrawlerDownloaderMiddleware):
+    """Downloader middleware which adjusts the concurrency of every download slot.
+
+    Every ADAPTIVE_INTERVAL seconds the responses of a slot are checked. The
+    concurrency is halved when 429 responses come back or the share of 403,
+    429 and 5xx responses, download errors and pages without serverState is
+    above ADAPTIVE_MAX_ERROR_RATE; it is lowered by one when the 90th latency
+    percentile grows over ADAPTIVE_LATENCY_FACTOR times the best median seen,
+    and raised by one otherwise, within ADAPTIVE_MIN_CONCURRENCY and
+    ADAPTIVE_MAX_CONCURRENCY. Once halved, it grows back up to just below
+    the concurrency which was too much and stays there for
+    ADAPTIVE_PROBE_INTERVALS before trying more. Requests with
+    ``server_state`` False in their meta are not expected to have serverState.
+
+    """
+    error_statuses = {403, 429}
+    server_state_marker = SERVER_STATE_MARKER.encode()
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.interval = settings.getfloat('ADAPTIVE_INTERVAL')
+        self.min_concurrency = settings.getint('ADAPTIVE_MIN_CONCURRENCY')
+        self.max_concurrency = settings.getint('ADAPTIVE_MAX_CONCURRENCY')
+        self.start_concurrency = settings.getint('ADAPTIVE_START_CONCURRENCY')
+        self.max_error_rate = settings.getfloat('ADAPTIVE_MAX_ERROR_RATE')
+        self.latency_factor = settings.getfloat('ADAPTIVE_LATENCY_FACTOR')
+        self.min_responses = settings.getint('ADAPTIVE_MIN_RESPONSES')
+        self.probe_intervals = settings.getint('ADAPTIVE_PROBE_INTERVALS')
+        self.slots = {}
+        self.loop = task.LoopingCall(self.adjust)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            # Only the user agent rotation.
+            return LandcrawlerDownloaderMiddleware.from_crawler(crawler)
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        super().spider_opened(spider)
+        self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.loop.running:
+            self.loop.stop()
+
+    def slot_state(self, request, spider):
+        downloader = self.crawler.engine.downloader
+        key = downloader.get_slot_key(request)
+        state = self.slots.get(key)
+        if state is None:
+            state = self.slots[key] = SlotState(self.start_concurrency)
+            if key not in downloader.slots:
+                # The downloader creates a slot only once the request has been
+                # through the middlewares, the first wave would go out at
+                # CONCURRENT_REQUESTS_PER_DOMAIN.
+                downloader._get_slot(request, spider)
+            self.apply(key, state)
+        return state
+
+    def process_request(self, request, spider):
+        super().process_request(request, spider)
+        self.slot_state(request, spider)
+        return None
+
+    def process_response(self, request, response, spider):
+        if 'cached' in response.flags:
+            # Served by the HTTP cache, it tells nothing about the site.
+            return response
+        state = self.slot_state(request, spider)
+        status = response.status
+        if status in self.error_statuses or status >= 500:
+            state.errors += 1
+            state.throttled += status == 429
+            self.stats.inc_value(f'adaptive/errors/{status}')
+        elif (status == 200 and request.meta.get('server_state', True)
+                and self.server_state_marker not in response.body):
+            state.errors += 1
+            self.stats.inc_value('adaptive/errors/no_server_state')
+        else:
+            state.latencies.append(request.meta.get('download_latency', 0))
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self.slot_state(request, spider).errors += 1
+        self.stats.inc_value('adaptive/errors/exception')
+
+    def adjust(self):
+        for key, state in self.slots.items():
+            if state.responses < self.min_responses and not state.throttled:
+                continue
+            concurrency = state.concurrency
+            error_rate = state.errors / state.responses
+            p90 = median = None
+            if state.latencies:
+                median = percentile(state.latencies, 0.5)
+                p90 = percentile(state.latencies, 0.9)
+                if state.baseline is None or median < state.baseline:
+                    state.baseline = median
+            backing_off, state.backing_off = state.backing_off, False
+            if state.throttled or error_rate > self.max_error_rate:
+                # Responses of the previous interval were sent at the previous
+                # concurrency, so a fresh decrease is not repeated at once.
+                if not backing_off:
+                    state.ceiling = concurrency - 1
+                    state.backing_off = True
+                    concurrency //= 2
+            elif p90 is not None and p90 > self.latency_factor * state.baseline:
+                concurrency -= 1
+            elif state.ceiling is None or concurrency < state.ceiling:
+                concurrency += 1
+            else:
+                # At the concurrency where the site pushed back, try one more
+                # only after a while.
+                state.stable += 1
+                if state.stable >= self.probe_intervals:
+                    state.stable = 0
+                    concurrency += 1
+            concurrency = max(self.min_concurrency, min(self.slot_max(key), concurrency))
+            if concurrency != state.concurrency:
+                self.stats.inc_value(
+                    'adaptive/increases' if concurrency > state.concurrency
+                    else 'adaptive/decreases')
+                logging.info(
+                    "Slot %s concurrency %s -> %s (p90 %s ms, errors %.1f%% of %s)",
+                    key, state.concurrency, concurrency,
+                    round(p90 * 1000) if p90 is not None else '-',
+                    error_rate * 100, state.responses
+                )
+                state.concurrency = concurrency
+            self.apply(key, state)
+            if p90 is not None:
+                self.stats.set_value(f'adaptive/{key}/p90_latency_ms', round(p90 * 1000))
+            state.reset()
+
+    def slot_max(self, key):
+        """Return the highest concurrency of a slot, DOWNLOAD_SLOTS can cap it lower.
+
+        """
+        slot_settings = self.crawler.engine.downloader.per_slot_settings.get(key, {})
+        return min(self.max_concurrency, slot_settings.get('concurrency', self.max_concurrency))
+
+    def apply(self, key, state):
+        self.stats.set_value(f'adaptive/{key}/concurrency', state.concurrency)
+        self.stats.max_value(f'adaptive/{key}/max_concurrency', state.concurrency)
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.concurrency = state.concurrency
+
+
+class ProxyState:
+    """Health of one proxy of the pool.
+
+    ``success`` and ``latency`` are exponentially weighted averages.
+
+    """
+    def __init__(self, url):
+        self.url = url
+        # Without the credentials, for slots, stats and logs.
+        self.name = urlparse(url).netloc.rpartition('@')[2] or url
+        self.success = 1.0
+        self.latency = None
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown = 0
+        self.retired_until = 0
+
+    def score(self):
+        return self.success / (self.latency or 0.1)
+
+
+class ProxyPoolMiddleware:
+    """Downloader middleware which spreads requests over the proxies of PROXY_LIST.
+
+    Every request goes through the better of two healthy proxies picked at
+    random, scored by success rate over latency, preferring proxies below
+    their concurrency. A proxy has at most PROXY_MAX_PER_PROXY requests in flight and
+    its own download slot, so its connections are kept and reused. A proxy
+    failing PROXY_MAX_FAILURES times in a row, or whose success rate falls
+    under PROXY_MIN_SUCCESS, is retired for PROXY_COOLDOWN seconds, twice as
+    long every time in a row. Retried requests pick a proxy again, other
+    than the ``proxy_exclude`` one of their meta if there is another one.
+    Pages without serverState count as failures of their proxy, like
+    AdaptiveConcurrencyMiddleware counts them.
+
+    """
+    failure_statuses = {403, 407, 429, 500, 502, 503, 504}
+    server_state_marker = SERVER_STATE_MARKER.encode()
+
+    def __init__(self, crawler, proxies):
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.proxies = {url: ProxyState(url) for url in proxies}
+        self.max_per_proxy = settings.getint('PROXY_MAX_PER_PROXY')
+        self.max_failures = settings.getint('PROXY_MAX_FAILURES')
+        self.min_success = settings.getfloat('PROXY_MIN_SUCCESS')
+        self.base_cooldown = settings.getfloat('PROXY_COOLDOWN')
+        self.smoothing = 0.2
+        self.random = random.Random()
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        proxies = crawler.settings.getlist('PROXY_LIST')
+        if not proxies:
+            raise NotConfigured('PROXY_LIST is empty')
+        s = cls(crawler, proxies)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def spider_opened(self, spider):
+        # The downloader creates the slots of the proxies with this concurrency.
+        slots = self.crawler.engine.downloader.per_slot_settings
+        for proxy in self.proxies.values():
+            slots.setdefault(self.slot(proxy), {})['concurrency'] = self.max_per_proxy
+        spider.logger.info('Proxy pool: %s proxies', len(self.proxies))
+
+    @staticmethod
+    def slot(proxy):
+        return f'proxy:{proxy.name}'
+
+    def choose(self, exclude=None):
+        now = time.monotonic()
+        healthy = [proxy for proxy in self.proxies.values() if proxy.retired_until <= now]
+        if exclude is not None:
+            healthy = [proxy for proxy in healthy if proxy.url != exclude] or healthy
+        if not healthy:
+            # All retired, the one back first.
+            return min(self.proxies.values(), key=lambda proxy: proxy.retired_until)
+        free = [proxy for proxy in healthy if proxy.in_flight < self.max_per_proxy] or healthy
+        pair = self.random.sample(free, min(2, len(free)))
+        return max(pair, key=lambda proxy: (proxy.score(), -proxy.in_flight))
+
+    def process_request(self, request, spider):
+        if 'proxy' in request.meta and 'pool_proxy' not in request.meta:
+            # A proxy chosen by the spider.
+            return None
+        proxy = self.choose(request.meta.get('proxy_exclude'))
+        proxy.in_flight += 1
+        request.meta['pool_proxy'] = proxy.url
+        request.meta['proxy'] = proxy.url
+        request.meta['download_slot'] = self.slot(proxy)
+        self.stats.inc_value(f'proxy/requests/{proxy.name}')
+        return None
+
+    def process_response(self, request, response, spider):
+        proxy = self.proxies.get(request.meta.get('pool_proxy'))
+        if proxy is not None:
+            if 'cached' in response.flags:
+                # Served by the HTTP cache without going through the proxy.
+                proxy.in_flight -= 1
+            else:
+                blocked = (response.status == 200 and request.meta.get('server_state', True)
+                           and self.server_state_marker not in response.body)
+                self.done(proxy, request,
+                          response.status not in self.failure_statuses and not blocked)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        proxy = self.proxies.get(request.meta.get('pool_proxy'))
+        if proxy is not None:
+            self.done(proxy, request, False)
+
+    def done(self, proxy, request, succeeded):
+        proxy.in_flight -= 1
+        proxy.success += self.smoothing * (succeeded - proxy.success)
+        if succeeded:
+            latency = request.meta.get('download_latency', 0)
+            proxy.latency = latency if proxy.latency is None else (
+                proxy.latency + self.smoothing * (latency - proxy.latency))
+            proxy.failures = 0
+            proxy.cooldown = 0
+            return
+        proxy.failures += 1
+        self.stats.inc_value(f'proxy/failures/{proxy.name}')
+        now = time.monotonic()
+        if proxy.retired_until <= now and (
+                proxy.failures >= self.max_failures or proxy.success < self.min_success):
+            proxy.cooldown = proxy.cooldown * 2 if proxy.cooldown else self.base_cooldown
+            proxy.retired_until = now + proxy.cooldown
+            # It comes back with a clean slate.
+            proxy.failures = 0
+            proxy.success = 1.0
+            self.stats.inc_value('proxy/retired')
+            logging.warning(
+                "Proxy %s retired for %s s after failures.", proxy.name, proxy.cooldown)
@@ -2,12 +2,212 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-
+import csv
+import pathlib
+import re
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from landcrawler.instrument import timer
+
+
+STATES = {
+    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
+    'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'District of Columbia': 'DC',
+    'Florida': 'FL', 'Georgia': 'GA', 'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL',
+    'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS', 'Kentucky': 'KY', 'Louisiana': 'LA',
+    'Maine': 'ME', 'Maryland': 'MD', 'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN',
+    'Mississippi': 'MS', 'Missouri': 'MO', 'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV',
+    'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM', 'New York': 'NY',
+    'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK', 'Oregon': 'OR',
+    'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC', 'South Dakota': 'SD',
+    'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT', 'Virginia': 'VA',
+    'Washington': 'WA', 'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY',
+    'Puerto Rico': 'PR',
+}
+_STATE_CODES = {name.upper(): code for name, code in STATES.items()}
+_STATE_CODES.update({code: code for code in STATES.values()})
+
+_NOT_DIGITS = re.compile(r'\D')
+_EXTENSION = re.compile(r'\s*(?:ext\.?|extension|x|#)\s*(\d+)\s*$', re.IGNORECASE)
+_QUANTITY = re.compile(r'(-?\d[\d,]*(?:\.\d+)?|-?\.\d+)\s*([A-Za-z]*)')
+_EMAIL = re.compile(r'[^@\s]+@[^@\s]+\.[A-Za-z]{2,}')
+
+# Unit suffix of a price or an acreage, lower case -> multiplier.
+PRICE_UNITS = {
+    '': 1, 'usd': 1, 'k': 1_000, 'm': 1_000_000, 'mm': 1_000_000, 'mil': 1_000_000,
+    'million': 1_000_000, 'b': 1_000_000_000, 'bn': 1_000_000_000, 'billion': 1_000_000_000,
+}
+ACRE_UNITS = {'': 1, 'ac': 1, 'acre': 1, 'acres': 1}
+
+
+def normalize_phone(value):
+    """Return ``(phone, error)``, phones are formatted as ``(555) 555-5555``.
+
+    An extension is kept as `` x123``.
+
+    """
+    text = str(value)
+    extension = _EXTENSION.search(text)
+    if extension is not None:
+        text = text[:extension.start()]
+    digits = _NOT_DIGITS.sub('', text)
+    if len(digits) == 11 and digits[0] == '1':
+        digits = digits[1:]
+    if len(digits) != 10:
+        return value, 'not a 10 digit phone number'
+    phone = f'({digits[:3]}) {digits[3:6]}-{digits[6:]}'
+    if extension is not None:
+        phone += f' x{extension.group(1)}'
+    return phone, None
+
+
+def normalize_state(value):
+    code = _STATE_CODES.get(str(value).upper())
+    if code is None:
+        return value, 'unknown state'
+    return code, None
+
+
+def normalize_zip(value):
+    digits = _NOT_DIGITS.sub('', str(value))
+    if len(digits) in (4, 8):
+        # A leading zero lost by a numeric conversion.
+        digits = '0' + digits
+    if len(digits) == 5:
+        return digits, None
+    if len(digits) == 9:
+        return f'{digits[:5]}-{digits[5:]}', None
+    return value, 'not a 5 or 9 digit zip'
+
+
+def _quantity(value, units):
+    """Return ``(number, error)`` of the first number in ``value`` scaled by its unit.
+
+    """
+    if isinstance(value, (int, float)):
+        return value, None
+    match = _QUANTITY.search(str(value))
+    if match is None:
+        return None, 'no number'
+    number, unit = match.groups()
+    multiplier = units.get(unit.lower())
+    if multiplier is None:
+        return None, f'unknown unit {unit!r}'
+    return float(number.replace(',', '')) * multiplier, None
+
+
+def normalize_price(value):
+    number, error = _quantity(value, PRICE_UNITS)
+    if error is None and number < 0:
+        error = 'negative'
+    if error is not None:
+        return value, f'not a price, {error}'
+    return round(number), None
+
+
+def normalize_acres(value):
+    number, error = _quantity(value, ACRE_UNITS)
+    if error is None and number < 0:
+        error = 'negative'
+    if error is not None:
+        return value, f'not an acreage, {error}'
+    return float(number), None
+
+
+def normalize_email(value):
+    email = str(value).lower()
+    if not _EMAIL.fullmatch(email):
+        return value, 'invalid email'
+    return email, None
+
+
+# Field -> function returning the normalized value and an error or None.
+NORMALIZERS = {
+    'phoneCell': normalize_phone,
+    'phoneOffice': normalize_phone,
+    'state': normalize_state,
+    'zip': normalize_zip,
+    'price': normalize_price,
+    'acres': normalize_acres,
+    'email': normalize_email,
+}
+
+
+def normalize_item(item):
+    """Normalize the fields of ``item`` in place and return the invalid ones.
+
+    Returns a list of ``(field, value, error)``, invalid values are kept as
+    they are. Empty values are left as they are.
+
+    """
+    adapter = ItemAdapter(item)
+    invalid = []
+    for field in NORMALIZERS.keys() & set(adapter.field_names()):
+        value = adapter.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        normalized, error = NORMALIZERS[field](value)
+        if error is None:
+            adapter[field] = normalized
+        else:
+            invalid.append((field, adapter.get(field), error))
+    return invalid
+
+
+class NormalizationPipeline:
+    """Validates and normalizes the details items.
+
+    Items are normalized as they come, holding an item back would keep its
+    response in the scraper slot. A value which can not be normalized is
+    kept as it was scraped, the item goes on and the value is written with
+    the reason to ``rejected/<spider name>.csv``. Items without normalized
+    fields pass through as they are.
+
+    """
+    def __init__(self, rejected_dir):
+        self.rejected_dir = pathlib.Path(rejected_dir)
+        self.stats = None
+        self.rejected_path = None
+        self.rejected_file = None
+        self.rejected_writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(crawler.settings.get('REJECTED_DIR'))
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def open_spider(self, spider):
+        suffix = getattr(spider, 'shard_suffix', '')
+        self.rejected_path = self.rejected_dir / f'{spider.name}{suffix}.csv'
+
+    def close_spider(self, spider):
+        if self.rejected_file is not None:
+            self.rejected_file.close()
+            self.rejected_file = self.rejected_writer = None
 
-class LandcrawlerPipeline:
     def process_item(self, item, spider):
+        if not NORMALIZERS.keys() & set(ItemAdapter(item).field_names()):
+            return item
+        with timer('pipeline/normalize'):
+            invalid = normalize_item(item)
+        if invalid:
+            self.write_rejected(ItemAdapter(item).get('link'), invalid)
         return item
+
+    def write_rejected(self, link, invalid):
+        if self.rejected_writer is None:
+            self.rejected_dir.mkdir(parents=True, exist_ok=True)
+            new = not self.rejected_path.exists()
+            self.rejected_file = open(self.rejected_path, 'a', encoding='utf-8', newline='')
+            self.rejected_writer = csv.writer(self.rejected_file)
+            if new:
+                self.rejected_writer.writerow(['link', 'field', 'value', 'reason'])
+        for field, value, error in invalid:
+            self.stats.inc_value(f'normalize/rejected/{field}')
+            self.rejected_writer.writerow([link, field, value, error])
+
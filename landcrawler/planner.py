@@ -0,0 +1,139 @@
+"""Partitioning of oversized listing buckets into price and acreage ranges.
+
+The site lists at most ``PAGE_CAP`` listings for a filter page. A bucket with
+more listings and no finer filter section is split in two price ranges, and
+each half which is still too big is split again, down to ``min_width``. A
+price range which cannot be split further is split by acreage. Every
+dimension also gets an open-ended range above its highest bound, so no
+listing falls outside the plan. Afterwards
+contiguous small ranges are merged while their sum stays under the cap, so the
+listing pages walked by LandsForSaleSpider are few and cover the bucket.
+
+"""
+import math
+
+
+PAGE_CAP = 10_000
+
+# Dimension name, lowest value and highest bound of the split ranges, the
+# smallest range width and the smallest value used to place split points on a
+# geometric scale. Values from the highest bound on are an open-ended range.
+DIMENSIONS = (
+    ('price', 0, 100_000_000, 1_000, 1_000),
+    ('acres', 0, 100_000, 1, 1),
+)
+RANGE_SEGMENT = '/{dimension}-{low}-{high}'
+OPEN_RANGE_SEGMENT = '/{dimension}-over-{low}'
+
+
+def range_path(path, ranges):
+    """Return the filter page path of ``path`` narrowed to ``ranges``.
+
+    Prices are whole dollars so the upper bound of a price range is excluded,
+    acreage bounds are inclusive and an overlap is removed by deduplication.
+    A range whose ``high`` is None has no upper bound.
+
+    """
+    for dimension, low, high in ranges:
+        if high is None:
+            path += OPEN_RANGE_SEGMENT.format(dimension=dimension, low=low)
+            continue
+        if dimension == 'price':
+            high -= 1
+        path += RANGE_SEGMENT.format(dimension=dimension, low=low, high=high)
+    return path
+
+
+def _split_point(low, high, scale):
+    middle = round(math.sqrt(max(low, scale) * high))
+    if not low < middle < high:
+        middle = (low + high) // 2
+    return middle
+
+
+class RangePlan:
+    """Plan of the ranges covering one oversized bucket.
+
+    ``start`` returns the first ranges to fetch, every fetched count goes to
+    ``add`` which returns the ranges to fetch next. Once ``done``, ``buckets``
+    returns ``(path, count)`` of the planned listing pages. ``truncated``
+    counts listings beyond the cap of ranges which can not be split further,
+    ``failed`` counts ranges whose count could not be fetched.
+
+    """
+    def __init__(self, path, count, cap=PAGE_CAP):
+        self.path = path
+        self.count = count
+        self.cap = cap
+        self.pending = set()
+        self.leaves = []
+        self.truncated = 0
+        self.failed = 0
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def start(self):
+        return self._split(())
+
+    def add(self, ranges, count):
+        """Record the ``count`` of fetched ``ranges``, return ranges to fetch next.
+
+        """
+        self.pending.discard(ranges)
+        if count is None:
+            self.failed += 1
+            return []
+        if count <= self.cap:
+            if count:
+                self.leaves.append((ranges, count))
+            return []
+        return self._split(ranges, count)
+
+    def fail(self, ranges):
+        self.pending.discard(ranges)
+        self.failed += 1
+
+    def _split(self, ranges, count=None):
+        used = len(ranges)
+        if ranges:
+            dimension, low, high = ranges[-1]
+            _, _, _, min_width, scale = DIMENSIONS[used - 1]
+            if high is not None and high - low >= 2 * min_width:
+                middle = _split_point(low, high, scale)
+                children = [ranges[:-1] + ((dimension, low, middle),),
+                            ranges[:-1] + ((dimension, middle, high),)]
+                self.pending.update(children)
+                return children
+        if used == len(DIMENSIONS):
+            # Nothing left to split by, the site shows the first ``cap`` of them.
+            self.leaves.append((ranges, self.cap))
+            self.truncated += count - self.cap if count else 0
+            return []
+        dimension, low, high, _, _ = DIMENSIONS[used]
+        top = ranges + ((dimension, high, None),)
+        self.pending.add(top)
+        return self._split(ranges + ((dimension, low, high),), count) + [top]
+
+    def buckets(self):
+        """Return ``(path, count)`` of the planned pages, small neighbours merged.
+
+        """
+        groups = {}
+        for ranges, count in self.leaves:
+            groups.setdefault(ranges[:-1], []).append((ranges[-1], count))
+        buckets = []
+        for prefix, leaves in groups.items():
+            leaves.sort(key=lambda leaf: leaf[0][1])
+            merged = []
+            for (dimension, low, high), count in leaves:
+                if merged:
+                    (_, last_low, last_high), last_count = merged[-1]
+                    if last_high == low and last_count + count <= self.cap:
+                        merged[-1] = ((dimension, last_low, high), last_count + count)
+                        continue
+                merged.append(((dimension, low, high), count))
+            buckets.extend(
+                (range_path(self.path, prefix + (last,)), count) for last, count in merged)
+        return buckets
@@ -0,0 +1,100 @@
+"""Compiled selectors for the hot extraction paths.
+
+Parsel translates CSS to XPath on every query and wraps every node a query
+returns in a Selector. Here queries are translated and compiled to lxml
+XPath objects once, with ``compiled`` caching them, and run on the bare
+lxml tree of ``html_root``, which parses a page like parsel does so the
+results are the same.
+
+``tag_attribute`` finds an attribute of the first tag with a class by a
+regular expression over the page, for pages whose DOM would be built only
+for that one link. Pages may be text or UTF-8 bytes.
+
+"""
+import html
+import re
+from functools import lru_cache
+
+from lxml import etree
+from lxml import html as lxml_html
+from parsel.csstranslator import css2xpath
+
+
+@lru_cache(maxsize=None)
+def compiled(query):
+    """Return the compiled lxml XPath of the XPath ``query``.
+
+    """
+    return etree.XPath(query)
+
+
+@lru_cache(maxsize=None)
+def css_xpath(query):
+    """Return the XPath of the CSS ``query``, relative to the context node.
+
+    """
+    return css2xpath(query)
+
+
+@lru_cache(maxsize=None)
+def _parser():
+    return lxml_html.HTMLParser(recover=True, encoding='utf-8', huge_tree=True)
+
+
+def html_root(page):
+    """Return the lxml root element of the HTML ``page``, text or UTF-8 bytes.
+
+    """
+    if isinstance(page, str):
+        page = page.strip().replace('\x00', '').encode('utf-8')
+    else:
+        page = page.replace(b'\x00', b'').strip()
+    try:
+        root = etree.fromstring(page or b'<html/>', parser=_parser())
+    except etree.XMLSyntaxError:
+        # Invalid UTF-8.
+        root = etree.fromstring(
+            page.decode('utf-8', 'replace').encode('utf-8'), parser=_parser())
+    if root is None:
+        root = etree.fromstring(b'<html/>', parser=_parser())
+    return root
+
+
+def has_class(element, name):
+    return name in (element.get('class') or '').split()
+
+
+@lru_cache(maxsize=None)
+def _tag_pattern(tag, class_name, attribute):
+    tag_pattern = (
+        rf'<{tag}\s(?:[^>]*?\s)?class\s*=\s*["\']?(?:[^"\'>]*?\s)?{re.escape(class_name)}'
+        rf'(?=[\s"\'>])[^>]*>'
+    )
+    attribute_pattern = rf'\s{attribute}\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))'
+    return (re.compile(tag_pattern, re.IGNORECASE),
+            re.compile(tag_pattern.encode(), re.IGNORECASE),
+            re.compile(attribute_pattern, re.IGNORECASE),
+            re.compile(attribute_pattern.encode(), re.IGNORECASE))
+
+
+def tag_attribute(page, tag, class_name, attribute):
+    """Return ``attribute`` of the first ``tag`` with ``class_name`` having it, or None.
+
+    Like ``tag.class_name/@attribute`` but without parsing the page, tags
+    inside comments and scripts are not told apart.
+
+    """
+    text_tag, bytes_tag, text_attribute, bytes_attribute = _tag_pattern(tag, class_name, attribute)
+    if isinstance(page, str):
+        tag_re, attribute_re = text_tag, text_attribute
+    else:
+        tag_re, attribute_re = bytes_tag, bytes_attribute
+    for match in tag_re.finditer(page):
+        value = attribute_re.search(match.group())
+        if value is None:
+            continue
+        value = next(group for group in value.groups() if group is not None)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        return html.unescape(value)
+    return None
@@ -0,0 +1,294 @@
+"""Extraction of sub-objects from the ``window.serverState`` script.
+
+Landwatch pages embed the page state as a JSON document serialised into a
+JavaScript string literal, some values of which are stringified JSON
+themselves. The extractor unescapes the literal once and decodes only the
+requested top-level keys, skipping the bulky ``description`` and
+``encodedBoundaryPoints`` values without copying them. A key which is only
+found inside a stringified value is decoded from that value.
+
+A projection (nested dict of wanted keys, None meaning "the whole value")
+narrows decoding further: members outside of it are skipped by span and
+scanning stops as soon as every wanted top-level member has been read.
+
+Pages may be given as UTF-8 bytes, then the literal is found by a byte
+search and only the literal is decoded.
+
+"""
+import json
+import logging
+import re
+
+from landcrawler.instrument import timer
+
+
+SERVER_STATE_MARKER = 'window.serverState = "'
+_MARKER_BYTES = SERVER_STATE_MARKER.encode()
+SKIPPED_KEYS = frozenset({'description', 'encodedBoundaryPoints'})
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_NEXT_BRACKET = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*([\[\]{}])', re.DOTALL)
+_SCALAR = re.compile(r'[^,\]}\s]+')
+_JS_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|.)', re.DOTALL)
+_JS_ESCAPES = {
+    'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v', '0': '\0',
+}
+
+
+def _js_unescape(match):
+    sequence = match.group(1)
+    if len(sequence) > 1:
+        return chr(int(sequence[1:], 16))
+    return _JS_ESCAPES.get(sequence, sequence)
+
+
+def _literal_end(script_string, start):
+    """Return the index after the string literal opened at ``start``, or -1.
+
+    JSON never puts ``";`` outside of a string, so the closing quote is the
+    first ``";`` whose quote is not escaped. ``script_string`` is text or bytes.
+
+    """
+    if isinstance(script_string, bytes):
+        closing, backslash = b'";', b'\\'
+    else:
+        closing, backslash = '";', '\\'
+    end = script_string.find(closing, start + 1)
+    while end != -1:
+        backslashes = 0
+        while script_string[end - 1 - backslashes:end - backslashes] == backslash:
+            backslashes += 1
+        if not backslashes % 2:
+            return end + 1
+        end = script_string.find(closing, end + 2)
+    if isinstance(script_string, bytes):
+        return -1
+    match = _STRING.match(script_string, start)
+    return match.end() if match else -1
+
+
+def server_state_text(script_string):
+    """Return the unescaped JSON text of ``window.serverState`` or None.
+
+    ``script_string`` is the page text or its UTF-8 bytes.
+
+    """
+    if not script_string:
+        return None
+    is_bytes = isinstance(script_string, bytes)
+    start = script_string.find(_MARKER_BYTES if is_bytes else SERVER_STATE_MARKER)
+    if start == -1:
+        return None
+    start += len(SERVER_STATE_MARKER) - 1
+    end = _literal_end(script_string, start)
+    if end == -1 and is_bytes:
+        script_string = script_string[start:].decode('utf-8', 'replace')
+        start = 0
+        end = _literal_end(script_string, start)
+    if end == -1:
+        return None
+    literal = script_string[start:end]
+    if is_bytes:
+        literal = literal.decode('utf-8', 'replace')
+    try:
+        return json.loads(literal)
+    except ValueError:
+        # Not every JavaScript escape is a valid JSON one.
+        return _JS_ESCAPE.sub(_js_unescape, literal[1:-1])
+
+
+def skip_value(text, pos):
+    """Return the index right after the JSON value starting at ``pos``.
+
+    """
+    char = text[pos]
+    if char == '"':
+        return _STRING.match(text, pos).end()
+    if char not in '{[':
+        return _SCALAR.match(text, pos).end()
+    depth = 0
+    while True:
+        match = _NEXT_BRACKET.match(text, pos)
+        if match is None:
+            raise ValueError(f'Unterminated JSON value at {pos}')
+        pos = match.end()
+        depth += 1 if match.group(1) in '{[' else -1
+        if depth == 0:
+            return pos
+
+
+def _unwrap(value):
+    """Decode stringified JSON objects nested inside ``value``.
+
+    """
+    if isinstance(value, str):
+        if value.startswith('{') and value.endswith('}'):
+            try:
+                return _unwrap(json.loads(value))
+            except ValueError:
+                pass
+        return value
+    if isinstance(value, dict):
+        return {key: _unwrap(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_unwrap(item) for item in value]
+    return value
+
+
+def _members(text, pos):
+    """Yield ``(key, value position)`` of the object at ``pos``.
+
+    The caller must send back the index right after each value.
+
+    """
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text[pos] == '}':
+        return pos + 1
+    while True:
+        key = _STRING.match(text, pos)
+        if key is None:
+            raise ValueError(f'Expecting property name at {pos}')
+        key_end = key.end()
+        key = key.group()
+        key = key[1:-1] if '\\' not in key else json.loads(key)
+        pos = _WHITESPACE.match(text, key_end).end()
+        if text[pos] != ':':
+            raise ValueError(f"Expecting ':' delimiter at {pos}")
+        pos = _WHITESPACE.match(text, pos + 1).end()
+        end = yield key, pos
+        pos = _WHITESPACE.match(text, end).end()
+        char = text[pos]
+        if char == '}':
+            return pos + 1
+        if char != ',':
+            raise ValueError(f"Expecting ',' delimiter at {pos}")
+        pos = _WHITESPACE.match(text, pos + 1).end()
+
+
+def decode_object(text, pos, skip=SKIPPED_KEYS):
+    """Decode the JSON object starting at ``pos``, blanking ``skip`` members.
+
+    Returns the object and the index right after it.
+
+    """
+    if text[pos] != '{':
+        value, end = _decoder.raw_decode(text, pos)
+        return _unwrap(value), end
+    obj = {}
+    members = _members(text, pos)
+    try:
+        key, pos = next(members)
+        while True:
+            if key in skip:
+                obj[key] = ''
+                end = skip_value(text, pos)
+            else:
+                value, end = _decoder.raw_decode(text, pos)
+                obj[key] = _unwrap(value)
+            key, pos = members.send(end)
+    except StopIteration as stop:
+        return obj, stop.value
+
+
+def select(value, projection):
+    """Return the ``projection`` part of an already decoded ``value``.
+
+    ``projection`` is a dict of wanted keys mapped to a nested projection or
+    to None for the whole value. Projections of lists apply to every item,
+    stringified JSON values are decoded on the fly.
+
+    """
+    if projection is None:
+        return _unwrap(value)
+    if isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return value
+    if isinstance(value, dict):
+        return {key: select(value[key], nested)
+                for key, nested in projection.items() if key in value}
+    if isinstance(value, list):
+        return [select(item, projection) for item in value]
+    return value
+
+
+def project_members(text, pos, projection):
+    """Decode the ``projection`` part of the JSON object at ``pos``.
+
+    Unwanted members are skipped by span and scanning stops as soon as every
+    wanted member has been read.
+
+    """
+    if projection is None or text[pos] != '{':
+        return select(_decoder.raw_decode(text, pos)[0], projection)
+    obj = {}
+    members = _members(text, pos)
+    try:
+        key, pos = next(members)
+        while True:
+            if key in projection:
+                value, end = _decoder.raw_decode(text, pos)
+                obj[key] = select(value, projection[key])
+                if len(obj) == len(projection):
+                    members.close()
+                    return obj
+            else:
+                end = skip_value(text, pos)
+            key, pos = members.send(end)
+    except StopIteration:
+        return obj
+
+
+def find_key(text, key):
+    """Return the text holding the value of the first ``key`` member and its index.
+
+    A member nested inside stringified values is searched in the decoded
+    strings. The index is -1 when there is no such member.
+
+    """
+    index = text.find(f'"{key}":')
+    if index != -1:
+        return text, _WHITESPACE.match(text, index + len(key) + 3).end()
+    # The quote before a key is escaped at least once inside a string.
+    escaped = f'\\"{key}\\'
+    if escaped not in text:
+        return text, -1
+    for string in _STRING.finditer(text):
+        if escaped in string.group():
+            nested, index = find_key(json.loads(string.group()), key)
+            if index != -1:
+                return nested, index
+    return text, -1
+
+
+def extract_server_state(script_string, keys, page_url=None, skip=SKIPPED_KEYS):
+    """Decode the ``keys`` members of ``window.serverState``.
+
+    ``keys`` is either a sequence of member names or a dict mapping member
+    names to projections (see ``select``), in which case ``skip`` is unused.
+    Returns a dict with the found keys, or None when the page has no
+    serverState. Raises ValueError when a found member is malformed.
+
+    """
+    with timer('serverstate/locate'):
+        text = server_state_text(script_string)
+    if text is None:
+        logging.warning(
+            "Can not find 'window.serverState' inside passed script text at the page %s.",
+            page_url
+        )
+        return None
+    state = {}
+    with timer('serverstate/decode'):
+        for key in keys:
+            found, pos = find_key(text, key)
+            if pos == -1:
+                continue
+            if isinstance(keys, dict):
+                state[key] = project_members(found, pos, keys[key])
+            else:
+                state[key] = decode_object(found, pos, skip)[0]
+    return state
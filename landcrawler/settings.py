@@ -1,3 +1,5 @@
+import os
+
 from dotenv import load_dotenv
 
 
@@ -31,11 +33,101 @@ USER_AGENTS = [
 #RANDOMIZE_DOWNLOAD_DELAY = True
 #RETRY_TIMES = 3
 
+# Number of worker processes which extract items from pages off the reactor
+# thread (0 parses on the reactor thread) and how many pages may wait for them
+PARSE_POOL_WORKERS = 0
+#PARSE_POOL_MAX_IN_FLIGHT = 32
+
+# Keep the state of every link of a links file on disk, so interrupted runs of
+# the link spiders resume where they stopped
+FRONTIER_ENABLED = True
+FRONTIER_DIR = 'frontier'
+
+# Keep fingerprints of the links between runs and write only the listings
+# and details which changed since the previous run
+INCREMENTAL_ENABLED = False
+INCREMENTAL_DIR = 'incremental'
+
+# Links of a links file are turned into requests only while fewer requests
+# than this wait in the scheduler (0 hands all of them to the scheduler)
+START_REQUESTS_WATERMARK = 1000
+
+# Write the details feeds as 'csv' or as typed 'parquet' (needs pyarrow), with
+# this compression and this many rows per row group
+DETAILS_FEED_FORMAT = 'csv'
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_ROW_GROUP_SIZE = 10_000
+FEED_EXPORTERS = {
+    'csv': 'landcrawler.exporters.TimedCsvItemExporter',
+    'parquet': 'landcrawler.exporters.ParquetItemExporter',
+}
+
+# Details items rejected by NormalizationPipeline go to
+# REJECTED_DIR/<spider name>.csv
+REJECTED_DIR = 'rejected'
+
+# Pages whose serverState is missing or cut short are fetched again up to
+# PARSE_RETRY_TIMES times, PARSE_RETRY_BACKOFF seconds later doubled every
+# time, through another proxy; pages which still fail, or whose serverState
+# changed shape, are written with their body to DEADLETTER_DIR
+PARSE_RETRY_TIMES = 3
+PARSE_RETRY_BACKOFF = 2.0
+PARSE_RETRY_MAX_BACKOFF = 60.0
+DEADLETTER_DIR = 'deadletter'
+
+# Keep the latest values of every details link in HISTORY_DIR and log the
+# fields which changed since the previous run, see landcrawler.history
+HISTORY_ENABLED = False
+HISTORY_DIR = 'history'
+
+# Adjust the concurrency of every download slot from the latency and error
+# rate of its responses, see AdaptiveConcurrencyMiddleware
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_START_CONCURRENCY = 4
+ADAPTIVE_MIN_CONCURRENCY = 1
+ADAPTIVE_MAX_CONCURRENCY = 32
+ADAPTIVE_INTERVAL = 5.0
+ADAPTIVE_MIN_RESPONSES = 10
+ADAPTIVE_MAX_ERROR_RATE = 0.05
+ADAPTIVE_LATENCY_FACTOR = 3.0
+ADAPTIVE_PROBE_INTERVALS = 12
+
+# Proxies used by ProxyPoolMiddleware, comma separated in the PROXY_LIST
+# environment variable or .env file (empty disables the pool), the requests
+# in flight per proxy, and when and for how long a failing proxy is retired
+PROXY_LIST = [proxy for proxy in os.getenv('PROXY_LIST', '').split(',') if proxy.strip()]
+PROXY_MAX_PER_PROXY = 8
+PROXY_MAX_FAILURES = 5
+PROXY_MIN_SUCCESS = 0.5
+PROXY_COOLDOWN = 60
+
+# Time the callbacks, extraction steps, exporters and pipelines as timing/*
+# stats, logged every INSTRUMENT_LOG_INTERVAL seconds. A share of callbacks
+# is profiled with cProfile into INSTRUMENT_PROFILE_DIR, the share is read
+# again from INSTRUMENT_PROFILE_FILE while the crawl runs if the file exists
+INSTRUMENT_ENABLED = True
+INSTRUMENT_LOG_INTERVAL = 60.0
+INSTRUMENT_PROFILE_RATE = 0.0
+INSTRUMENT_PROFILE_FILE = 'profile.rate'
+INSTRUMENT_PROFILE_DIR = 'profiles'
+SPIDER_MIDDLEWARES = {
+    'landcrawler.failures.ParseFailureMiddleware': 900,
+    'landcrawler.instrument.TimingSpiderMiddleware': 950,
+}
+EXTENSIONS = {
+    'landcrawler.instrument.InstrumentationExtension': 500,
+    'landcrawler.history.HistoryExtension': 500,
+}
+
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
-    'scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware': 100,
-    'landcrawler.middlewares.LandcrawlerDownloaderMiddleware': 950,
+    # Above RetryMiddleware, so the pool sees the responses and errors which
+    # are retried, and before HttpProxyMiddleware, which sets the credentials
+    # of the proxy it chose.
+    'landcrawler.middlewares.ProxyPoolMiddleware': 740,
+    'scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware': 750,
+    'landcrawler.middlewares.AdaptiveConcurrencyMiddleware': 950,
 #    'scrapy.downloadermiddlewares.redirect.MetaRefreshMiddleware': None,
 #    'scrapy.contrib.downloadermiddleware.redirect.RedirectMiddleware': None,
 }
@@ -52,7 +144,7 @@ LOG_FILE_APPEND = 'False'
 LOG_LEVEL = 'DEBUG'
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-#CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS = 32
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
@@ -95,9 +187,9 @@ COOKIES_ENABLED = False
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    'landcrawler.pipelines.LandcrawlerPipeline': 300,
-#}
+ITEM_PIPELINES = {
+    'landcrawler.pipelines.NormalizationPipeline': 300,
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -114,8 +206,15 @@ COOKIES_ENABLED = False
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = 'httpcache'
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+# Bodies are stored compressed (zstd needs zstandard, else gzip) and once per
+# content; the least recently used responses are evicted above
+# HTTPCACHE_MAX_SIZE_MB (0 is unlimited). HTTPCACHE_OFFLINE replays the cache
+# without network, requests which are not cached are ignored.
+HTTPCACHE_ENABLED = False
+HTTPCACHE_OFFLINE = False
+HTTPCACHE_EXPIRATION_SECS = 0
+HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_IGNORE_HTTP_CODES = [304, 403, 429, 500, 502, 503, 504]
+HTTPCACHE_STORAGE = 'landcrawler.httpcache.CompressedCacheStorage'
+HTTPCACHE_COMPRESSION = 'zstd'
+HTTPCACHE_MAX_SIZE_MB = 0
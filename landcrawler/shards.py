@@ -0,0 +1,137 @@
+"""Sharded runs of the spiders which read a links file.
+
+    python -m landcrawler.shards property-details-spider --shards 4 [-a NAME=VALUE] [-s NAME=VALUE]
+
+Runs ``--shards`` copies of the spider as separate processes, each of them
+with ``-a shard=I -a shards=N``, so each crawls the links of its hash shard
+and writes its own feed parts, frontier and log. Once every shard has
+finished, the parts of each feed are merged into the feed file, ordered by
+its first field. A failed shard leaves its parts and frontier in place, so
+running the same command again resumes it.
+
+"""
+import argparse
+import csv
+import heapq
+import logging
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+
+
+def shard_suffix(shard, shards):
+    return f'.shard-{shard}-of-{shards}'
+
+
+def part_path(path, shard, shards):
+    """Return the path of the ``shard`` part of the file ``path``.
+
+    """
+    path = pathlib.Path(str(path))
+    return path.with_name(f'{path.stem}{shard_suffix(shard, shards)}{path.suffix}')
+
+
+def _sorted_rows(path, key, directory):
+    """Return a temporary file with the rows of the csv file ``path`` sorted by ``key``.
+
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as part:
+        reader = csv.DictReader(part)
+        fields = reader.fieldnames or []
+        rows = sorted(reader, key=lambda row: row[key])
+    sorted_file = tempfile.TemporaryFile('w+', encoding='utf-8', newline='', dir=directory)
+    writer = csv.DictWriter(sorted_file, fields)
+    writer.writeheader()
+    writer.writerows(rows)
+    sorted_file.seek(0)
+    return sorted_file
+
+
+def merge_parts(path, parts, fields, append=False):
+    """Merge the csv ``parts`` into ``path`` ordered by the first of ``fields``.
+
+    Every part is sorted on its own, one at a time, and the sorted parts are
+    merged as streams, so at most one part is held in memory. A key which is
+    in several parts, e.g. after a resumed shard, is written once.
+    Returns the number of written rows.
+
+    """
+    path = pathlib.Path(str(path))
+    key = fields[0]
+    parts = [part for part in parts if part.exists() and part.stat().st_size]
+    sorted_files = [_sorted_rows(part, key, path.parent) for part in parts]
+    readers = [csv.DictReader(sorted_file) for sorted_file in sorted_files]
+    write_header = not (append and path.exists() and path.stat().st_size)
+    written = 0
+    try:
+        with open(path, 'a' if append else 'w', encoding='utf-8', newline='') as feed:
+            writer = csv.DictWriter(feed, fields, extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+            last_key = None
+            for row in heapq.merge(*readers, key=lambda row: row[key]):
+                if row[key] == last_key:
+                    continue
+                last_key = row[key]
+                writer.writerow(row)
+                written += 1
+    finally:
+        for sorted_file in sorted_files:
+            sorted_file.close()
+    return written
+
+
+def run_shards(spider, shards, args=(), settings=(), log_file=None):
+    """Run ``shards`` processes of ``spider`` and return their exit codes.
+
+    """
+    processes = []
+    for shard in range(shards):
+        command = [sys.executable, '-m', 'scrapy', 'crawl', spider,
+                   '-a', f'shard={shard}', '-a', f'shards={shards}']
+        for arg in args:
+            command += ['-a', arg]
+        for setting in settings:
+            command += ['-s', setting]
+        if log_file:
+            command += ['-s', f'LOG_FILE={part_path(log_file, shard, shards)}']
+        processes.append(subprocess.Popen(command))
+    return [process.wait() for process in processes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('spider')
+    parser.add_argument('--shards', type=int, required=True)
+    parser.add_argument('-a', dest='args', action='append', default=[], metavar='NAME=VALUE',
+                        help='spider argument passed to every shard')
+    parser.add_argument('-s', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='setting passed to every shard')
+    options = parser.parse_args()
+    settings = get_project_settings()
+    spidercls = SpiderLoader.from_settings(settings).load(options.spider)
+    codes = run_shards(options.spider, options.shards, options.args, options.settings,
+                       settings.get('LOG_FILE'))
+    failed = [shard for shard, code in enumerate(codes) if code]
+    if failed:
+        logging.error("Shards %s failed, feed parts are not merged.", failed)
+        sys.exit(1)
+    for uri, feed_options in spidercls.custom_settings['FEEDS'].items():
+        parts = [part_path(uri, shard, options.shards) for shard in range(options.shards)]
+        if not any(part.exists() for part in parts):
+            # Parquet parts are already files of the feed dataset.
+            continue
+        written = merge_parts(
+            uri, parts, feed_options['fields'], append=not feed_options.get('overwrite', True))
+        logging.info("Merged %s rows of %s parts into %s.", written, len(parts), uri)
+        for part in parts:
+            part.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
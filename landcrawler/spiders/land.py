@@ -1,14 +1,41 @@
 """Module contains next spiders:
 
 LandsForSaleSpider -- to find them all,
-BrokerProfileSpider and PropertyDetailsSpider -- to bring them all.
+BrokerProfileSpider and PropertyDetailsSpider -- to bring them all,
+FusedLandSpider -- and in one crawl bind them.
 
 """
-import json
+import copy
+import csv
 import logging
-import re
+import math
+import multiprocessing
 import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
 import scrapy
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.extensions.feedexport import FeedExporter
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from landcrawler.dedup import SeenIndex
+from landcrawler.exporters import ParquetItemExporter, parquet_feeds
+from landcrawler.failures import ParseFailure
+from landcrawler.frontier import FAILED, SCRAPED, Frontier
+from landcrawler.history import link_seen, original_url
+from landcrawler.httpcache import offline_settings
+from landcrawler.incremental import FingerprintStore, fingerprint
+from landcrawler.instrument import TIMINGS, timed_call, timer
+from landcrawler.items import BrokerDetails, ListingLinks, ListingPage, PropertyDetails
+from landcrawler.links import RequestFeeder, parse_lines, read_links
+from landcrawler.planner import PAGE_CAP, RangePlan, range_path
+from landcrawler.selection import compiled, css_xpath, has_class, html_root, tag_attribute
+from landcrawler.serverstate import extract_server_state
+from landcrawler.shards import part_path, shard_suffix
 
 
 DOMAIN = "www.landwatch.com"
@@ -19,44 +46,374 @@ BROKER_DETAILS_FILE = pathlib.Path('broker_details.csv')
 PROPERTY_LINKS_FILE = pathlib.Path('property_links.csv')
 PROPERTY_DETAILS_FILE = pathlib.Path('property_details.csv')
 
-STATUSES = {
-    1: "Available",
-    2: "Under Contract",
-    3: "Off Market",
-    4: "Sold",
-}
-
 ADDRESS_FIELDS = ['address1', 'address2', 'city', 'state', 'zip']
 
+CARDS_PER_PAGE = 25
+PAGE_SEGMENT = '/page-{page}'
 
-def _script_string_to_json_prep(script_string: str, page_url: str):
-    prep = re.findall('window.serverState = "(.*)";', script_string)
-    if not prep:
-        logging.warning(
-            "Can not find 'window.serverState' inside passed script text at the page %s.",
-            page_url
-        )
-        return None
-    prep = prep[0]
-    prep = re.sub(r'([:,\[\{])\\+"', r'\1"', prep)
-    prep = re.sub(r'\\+"([:,\]\}])', r'"\1', prep)
-    prep = re.sub(r'\\+"', r'\"', prep)
-    prep = re.sub(r'(encodedBoundaryPoints":)(".*?")', r'\1""', prep)
-    prep = prep.replace('"{', '{').replace('}"', '}')
-    return prep
+# Listing cards, each followed by the hrefs of its property and broker links,
+# in document order. contains() is much cheaper than the class token test of
+# CSS selectors, the tokens are checked on the few nodes it lets through.
+CARD_CLASS, PROPERTY_LINK_CLASS, BROKER_LINK_CLASS = '_51c43', '_12a2b', 'dc7c2'
+_CARD = f"descendant-or-self::div[contains(@class, '{CARD_CLASS}')]"
+CARD_NODES = compiled(
+    f"{_CARD} | {_CARD}/descendant::div[contains(@class, '{PROPERTY_LINK_CLASS}')"
+    f" or contains(@class, '{BROKER_LINK_CLASS}')]/a/@href"
+)
+NORMALIZED_TEXT = compiled('normalize-space()')
+NEXT_PAGE_URL = compiled(f"{css_xpath('a.d72c6:last-child')}/@href")
 
 
-class ListingPagesSpider(scrapy.Spider):
-    """Spider which collects start urls for LandsForSaleSpider.
+def listing_pages(count):
+    """Return the number of listing pages of a bucket of ``count`` listings, 1 if unknown.
+
+    """
+    return math.ceil(min(count, PAGE_CAP) / CARDS_PER_PAGE) if count else 1
+
+
+def page_path(link, page):
+    return link if page == 1 else link + PAGE_SEGMENT.format(page=page)
+
+
+def page_source(response):
+    """Return the page of ``response`` given to extraction steps.
+
+    UTF-8 pages are given as the body, extraction then decodes only what it
+    needs; pages in other encodings as the text.
+
+    """
+    return response.body if response.encoding == 'utf-8' else response.text
+
+
+def _fire(deferred, future):
+    exception = future.exception()
+    if exception is not None:
+        deferred.errback(Failure(exception))
+    else:
+        deferred.callback(future.result())
+
+
+class ParsePool:
+    """Process pool which runs page extraction off the reactor thread.
+
+    At most ``max_in_flight`` pages are handed to the workers at a time, the
+    rest wait for a free slot, so memory held by pending pages stays bounded.
+
+    """
+    def __init__(self, workers, max_in_flight):
+        self._executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'))
+        self._semaphore = defer.DeferredSemaphore(max_in_flight)
+
+    @classmethod
+    def from_settings(cls, settings):
+        workers = settings.getint('PARSE_POOL_WORKERS')
+        if workers <= 0:
+            return None
+        return cls(workers, settings.getint('PARSE_POOL_MAX_IN_FLIGHT') or workers * 4)
+
+    def run(self, func, *args):
+        """Return a Deferred which fires with ``func(*args)`` run in a worker.
+
+        """
+        return self._semaphore.run(self._submit, func, *args)
+
+    def _submit(self, func, *args):
+        from twisted.internet import reactor
+
+        deferred = defer.Deferred()
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda done: reactor.callFromThread(_fire, deferred, done))
+        return deferred
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LandwatchSpider(scrapy.Spider):
+    """The spider which is used as a base for all landwatch spiders.
+
+    Pass ``-a base_url=http://127.0.0.1:8000`` to crawl a local copy of the site.
+    With HTTPCACHE_OFFLINE the spider replays the HTTP cache without network.
 
     """
-    name = "listing-pages-spider"
     domain = DOMAIN
     allowed_domains = [domain]
+    base_url = f'https://{DOMAIN}'
+    parse_pool = None
+
+    def __init__(self, *args, base_url=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+            self.allowed_domains = [urlparse(self.base_url).hostname]
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.getbool('HTTPCACHE_OFFLINE'):
+            offline_settings(crawler.settings)
+        spider.parse_pool = ParsePool.from_settings(crawler.settings)
+        if spider.parse_pool is not None:
+            crawler.signals.connect(spider.parse_pool.close, signal=signals.spider_closed)
+        return spider
+
+    def url(self, path):
+        return f'{self.base_url}{path}'
+
+    async def extract(self, func, *args):
+        """Run the extraction step ``func(*args)``, in the parse pool if enabled.
+
+        ``func`` must be picklable and return plain data.
+
+        """
+        if self.parse_pool is None:
+            with timer(f'extract/{func.__qualname__}'):
+                return func(*args)
+        result, timings = await maybe_deferred_to_future(
+            self.parse_pool.run(timed_call, func, *args))
+        TIMINGS.merge(timings)
+        return result
+
+
+def _appending_feeds(feeds):
+    """Return ``feeds`` options which append to existing files without a header.
+
+    """
+    feeds = copy.deepcopy(feeds)
+    for uri, options in feeds.items():
+        options['overwrite'] = False
+        path = pathlib.Path(str(uri))
+        if path.exists() and path.stat().st_size:
+            options['item_export_kwargs'] = dict(
+                options.get('item_export_kwargs') or {}, include_headers_line=False)
+    return feeds
+
+
+class LinksFileSpider(LandwatchSpider):
+    """The spider which is used as a base for spiders crawling links of a links file.
+
+    With FRONTIER_ENABLED the links go through a Frontier, so an interrupted run
+    resumes with the links which are not done yet and appends to its feeds.
+    With INCREMENTAL_ENABLED the spider keeps fingerprints of the links in a
+    FingerprintStore and writes only what changed since the previous run.
+
+    Pass ``-a lines=START:STOP`` to crawl a range of the links file rows or
+    ``-a shard=I -a shards=N`` to crawl the links of one hash shard, which
+    then keeps its own frontier and fingerprints and writes its own feed
+    parts, see ``landcrawler.shards``.
+
+    """
+    links_file = None
+    frontier = None
+    fingerprints = None
+    feeder = None
+    # True when the frontier resumed an interrupted run.
+    resumed = False
+
+    def __init__(self, *args, lines=None, shard=None, shards=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lines = parse_lines(lines) if lines else None
+        self.shards = int(shards) if shards else None
+        self.shard = int(shard or 0)
+        if self.shards and not 0 <= self.shard < self.shards:
+            raise ValueError(f'shard must be within 0..{self.shards - 1}, got {self.shard}')
+
+    @property
+    def shard_suffix(self):
+        return shard_suffix(self.shard, self.shards) if self.shards else ''
+
+    def state_path(self, directory):
+        return pathlib.Path(directory) / f'{self.name}{self.shard_suffix}.sqlite'
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+        feeds = spider.output_feeds(settings.getdict('FEEDS'))
+        if spider.shards:
+            feeds = {part_path(uri, spider.shard, spider.shards): options
+                     for uri, options in feeds.items()}
+        if settings.getbool('FRONTIER_ENABLED'):
+            frontier_path = spider.state_path(settings.get('FRONTIER_DIR'))
+            if Frontier.resumable(frontier_path):
+                feeds = _appending_feeds(feeds)
+            spider.frontier = Frontier(frontier_path, flush=spider.checkpoint_feeds)
+        settings.set('FEEDS', feeds, priority=settings.getpriority('FEEDS'))
+        if settings.getbool('INCREMENTAL_ENABLED'):
+            spider.fingerprints = FingerprintStore(spider.state_path(settings.get('INCREMENTAL_DIR')))
+        if spider.frontier is not None or spider.fingerprints is not None:
+            # The scraped links are done once the feeds are closed.
+            crawler.signals.connect(
+                spider.close_state,
+                signal=signals.feed_exporter_closed if feeds else signals.spider_closed)
+        return spider
+
+    def output_feeds(self, feeds):
+        """Return the FEEDS of this spider run.
+
+        """
+        return feeds
+
+    def read_links(self):
+        """Yield the links of the links file part of this spider, each of them once.
+
+        """
+        seen = SeenIndex()
+        for link in read_links(self.links_file, self.lines, self.shard, self.shards):
+            if seen.add(link):
+                yield link
+            else:
+                self.crawler.stats.inc_value('dedup/links_file/skipped')
+
+    def start_requests(self):
+        if self.frontier is None:
+            links = self.read_links()
+        else:
+            resumed = self.resumed = self.frontier.start_run()
+            if resumed:
+                self.resume()
+            added = self.frontier.seed(self.links_file, self.read_links())
+            self.logger.info(
+                "%s run, %s new links, frontier state: %s",
+                'Resuming' if resumed else 'Starting', added, self.frontier.counts()
+            )
+            links = self.frontier.take()
+        requests = (request for link in links for request in self.link_requests(link))
+        watermark = self.settings.getint('START_REQUESTS_WATERMARK')
+        if watermark <= 0:
+            yield from requests
+        else:
+            self.feeder = RequestFeeder(self.crawler, requests, watermark)
+            self.feeder.feed()
+
+    def link_requests(self, link):
+        """Yield the first requests of ``link`` of the links file.
+
+        """
+        yield self.link_request(self.url(link), link)
+
+    def resume(self):
+        """Called before a run which resumes an interrupted one starts.
+
+        """
+
+    def link_request(self, url, link):
+        """Return a request for ``url`` which belongs to ``link`` of the links file.
+
+        """
+        return scrapy.Request(
+            url, callback=self.parse, errback=self.link_failed, meta={'frontier_link': link})
+
+    def link_done(self, response):
+        link = response.meta.get('frontier_link')
+        if link is None:
+            return
+        if self.frontier is not None:
+            self.frontier.mark(link, SCRAPED)
+        if self.fingerprints is not None:
+            # After the mark, whose commit may flush the feeds before the
+            # rows of ``link`` are exported.
+            self.fingerprints.write(link)
+
+    def checkpoint_feeds(self):
+        """Frontier ``flush``, return True if every item exported so far is on disk.
+
+        The fingerprints of the links done so far are then kept too.
+
+        """
+        if not self.flush_feeds():
+            return False
+        if self.fingerprints is not None:
+            self.fingerprints.commit()
+        return True
+
+    def flush_feeds(self):
+        """Flush the feed files, return True if every item exported so far is on disk.
+
+        Parquet rows are readable only once their file is closed.
+
+        """
+        for extension in self.crawler.extensions.middlewares:
+            if not isinstance(extension, FeedExporter):
+                continue
+            for slot in extension.slots:
+                if not slot.itemcount:
+                    continue
+                if isinstance(slot.exporter, ParquetItemExporter):
+                    return False
+                stream = getattr(slot.exporter, 'stream', None)
+                if stream is not None:
+                    stream.flush()
+                slot.file.flush()
+        return True
+
+    def link_failed(self, failure):
+        request = failure.request
+        self.logger.error("Request %s failed: %r", request.url, failure.value)
+        self.link_given_up(request.meta.get('frontier_link'))
+
+    def parse_failed(self, response):
+        """Called by ParseFailureMiddleware when the page of ``response`` is given up.
+
+        """
+        self.link_given_up(response.meta.get('frontier_link'))
+
+    def link_given_up(self, link):
+        if link is None:
+            return
+        if self.frontier is not None:
+            self.frontier.mark(link, FAILED)
+        if self.fingerprints is not None:
+            self.fingerprints.discard(link)
+
+    def changed(self, owner, link, values, response=None):
+        """Return True if ``values`` of ``link`` changed since the previous run.
+
+        The fingerprint and the HTTP validators of ``response`` are kept for
+        the next run once the rows of ``owner``, the links file link they
+        come from, are on disk.
+
+        """
+        etag = last_modified = None
+        if response is not None:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            etag = etag and etag.decode('latin-1')
+            last_modified = last_modified and last_modified.decode('latin-1')
+        changed = self.fingerprints.update(owner, link, fingerprint(values), etag, last_modified)
+        self.crawler.stats.inc_value(f'incremental/{"changed" if changed else "unchanged"}')
+        return changed
+
+    def close_state(self):
+        if self.fingerprints is not None:
+            self.fingerprints.close()
+        if self.frontier is not None:
+            self.frontier.checkpoint()
+            self.logger.info("Frontier state: %s", self.frontier.counts())
+            self.frontier.close()
+
+
+class ListingPagesSpider(LandwatchSpider):
+    """Spider which collects start urls for LandsForSaleSpider.
+
+    Filter pages are walked Region -> County -> City while a bucket has more
+    than ``page_cap`` listings. A bucket which is still too big and has no
+    finer filter section is split in price and acreage ranges by a RangePlan.
+
+    """
+    name = "listing-pages-spider"
     filter_order = {
         "Region": "County",
         "County": "City",
-        "City": "Price",
+    }
+    page_cap = PAGE_CAP
+    projection = {
+        'totalCount': None,
+        'filterSections': {
+            'section': None,
+            'filterLinks': {'relativeUrlPath': None, 'count': None},
+        },
     }
     custom_settings = {
         'FEEDS': {
@@ -67,126 +424,428 @@ class ListingPagesSpider(scrapy.Spider):
             }
         }
     }
-    start_urls = ['https://www.landwatch.com/land']
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.log_coverage, signal=signals.spider_closed)
+        return spider
+
+    def start_requests(self):
+        yield scrapy.Request(self.url('/land'), callback=self.parse, meta={'server_state': False})
 
     def parse(self, response, **kwargs):
-        state_urls = response.css('a.e6625').xpath('@href').getall()
+        with timer('selector/state_links'):
+            state_urls = response.css('a.e6625').xpath('@href').getall()
         for state_url in state_urls:
             yield scrapy.Request(
-                url=f'https://{self.domain}{state_url}',
+                url=self.url(state_url),
                 callback=self.parse_page,
                 meta={'filter_section_name': 'Region'}
             )
 
-    def parse_page(self, response):
-        page_url = response.url
-        filter_section_name = response.meta['filter_section_name']
-        next_filter_section_name = self.filter_order.get(filter_section_name)
-        script_text = response.xpath(
-            '//script[contains(text(), "filterSections")]/text()').get()
-        page_data_prep = _script_string_to_json_prep(script_text, page_url)
+    @classmethod
+    def extract_filters(cls, page, page_url):
+        """Return the filter sections and the listing count of a filter page.
+
+        """
         try:
-            filter_section = re.findall(
-                r'"filterSections":(.*?),"footer"', page_data_prep)[0]
-            filters = json.loads(filter_section)
-        except (IndexError, ValueError):
+            page_data = extract_server_state(page, cls.projection, page_url)
+            if page_data is None:
+                return None, None
+            return page_data.get('filterSections'), page_data.get('totalCount')
+        except ValueError:
             logging.error(
-                "Something is wrong with 'window.serverState' content of broker page %s.",
+                "Something is wrong with 'window.serverState' content of filter page %s.",
                 page_url
             )
-            filters = None
-        if not filters:
-            return
-        for filter_section in filters:
+            return None, None
+
+    def listing_item(self, start_link, count, root_page):
+        self.crawler.stats.inc_value('planner/planned', count)
+        return ListingPage(start_link=start_link, count=count, root_page=root_page)
+
+    def bucket_outputs(self, start_link, count, root_page):
+        """Yield the outputs of a planned bucket, its listing item.
+
+        """
+        yield self.listing_item(start_link, count, root_page)
+
+    async def parse_page(self, response):
+        filter_section_name = response.meta['filter_section_name']
+        next_filter_section_name = self.filter_order.get(filter_section_name)
+        filters, total = await self.extract(self.extract_filters, page_source(response), response.url)
+        for filter_section in filters or []:
             if filter_section.get("section") == filter_section_name:
                 region_filter = filter_section["filterLinks"]
+                if 'count' not in response.meta:
+                    # A state page, its regions add up to the listings of the state.
+                    if total is None:
+                        total = sum(region.get("count") or 0 for region in region_filter)
+                    self.crawler.stats.inc_value('planner/site_total', total)
                 for region in region_filter:
                     if not region.get("count"):
                         continue
-                    if region["count"] <= 10_000:
-                        yield {
-                            "start_link": region["relativeUrlPath"],
-                            "count": region["count"],
-                            "root_page": response.url,
-                        }
+                    if region["count"] <= self.page_cap:
+                        for output in self.bucket_outputs(
+                                region["relativeUrlPath"], region["count"], response.url):
+                            yield output
+                    elif next_filter_section_name:
+                        yield scrapy.Request(
+                            url=self.url(region["relativeUrlPath"]),
+                            callback=self.parse_page,
+                            meta={
+                                'filter_section_name': next_filter_section_name,
+                                'count': region["count"],
+                            }
+                        )
                     else:
-                        if next_filter_section_name:
-                            yield scrapy.Request(
-                                url=f'https://{self.domain}{region["relativeUrlPath"]}',
-                                callback=self.parse_page,
-                                meta={'filter_section_name': next_filter_section_name}
-                            )
+                        for request in self.plan_ranges(
+                                region["relativeUrlPath"], region["count"], response.url):
+                            yield request
                 break
+        else:
+            # An oversized bucket without the finer filter section.
+            if 'count' in response.meta:
+                for request in self.plan_ranges(
+                        urlparse(response.url).path, response.meta['count'], response.url):
+                    yield request
+
+    def plan_ranges(self, path, count, root_page):
+        """Yield the first requests splitting the bucket ``path`` in ranges.
 
+        """
+        plan = RangePlan(path, count, self.page_cap)
+        self.crawler.stats.inc_value('planner/split_buckets')
+        for ranges in plan.start():
+            yield self.range_request(plan, ranges, root_page)
 
-class LandsForSaleSpider(scrapy.Spider):
+    def range_request(self, plan, ranges, root_page):
+        return scrapy.Request(
+            url=self.url(range_path(plan.path, ranges)),
+            callback=self.parse_range,
+            errback=self.range_failed,
+            meta={'range_plan': plan, 'ranges': ranges, 'root_page': root_page},
+        )
+
+    async def parse_range(self, response):
+        plan = response.meta['range_plan']
+        filters, count = await self.extract(self.extract_filters, page_source(response), response.url)
+        if count is None and filters:
+            # Without the total the biggest filter section tells the count.
+            count = max(
+                sum(link.get("count") or 0 for link in section.get("filterLinks", []))
+                for section in filters
+            )
+        for ranges in plan.add(response.meta['ranges'], count):
+            yield self.range_request(plan, ranges, response.meta['root_page'])
+        for item in self.plan_items(plan, response.meta['root_page']):
+            yield item
+
+    def range_failed(self, failure):
+        request = failure.request
+        self.logger.error("Range request %s failed: %r", request.url, failure.value)
+        plan = request.meta['range_plan']
+        plan.fail(request.meta['ranges'])
+        yield from self.plan_items(plan, request.meta['root_page'])
+
+    def plan_items(self, plan, root_page):
+        """Yield the listing items of ``plan`` once all its ranges are fetched.
+
+        """
+        if not plan.done:
+            return
+        stats = self.crawler.stats
+        stats.inc_value('planner/truncated', plan.truncated)
+        stats.inc_value('planner/failed_ranges', plan.failed)
+        for path, count in plan.buckets():
+            yield from self.bucket_outputs(path, count, root_page)
+
+    def log_coverage(self):
+        stats = self.crawler.stats
+        site_total = stats.get_value('planner/site_total', 0)
+        planned = stats.get_value('planner/planned', 0)
+        self.logger.info(
+            "Planned %s of %s listings (%.1f%%), %s beyond the page cap, %s ranges failed.",
+            planned, site_total, 100 * planned / site_total if site_total else 0,
+            stats.get_value('planner/truncated', 0), stats.get_value('planner/failed_ranges', 0)
+        )
+
+
+class ListingLinksMixin:
+    """Writes every property and broker link of the listing pages once.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = {'link': SeenIndex(), 'profile_link': SeenIndex()}
+
+    def first_seen(self, field, link):
+        """Return ``link`` if it is seen for the first time in ``field``, else None.
+
+        """
+        if link is None or self.seen[field].add(link):
+            return link
+        self.crawler.stats.inc_value(f'dedup/{field}/skipped')
+        return None
+
+
+class LandsForSaleSpider(ListingLinksMixin, LinksFileSpider):
     """Spider which collects item and broker profile links for every listing.
 
+    The number of listing pages of a start link follows from its ``count``,
+    so all of them are requested at once instead of following the next page
+    links one by one. Pages of one start link share a priority which is
+    lower for every following start link, so started buckets are finished
+    before new ones are taken. A start link without a count, or whose last
+    planned page still has a next page, is followed page by page.
+
     """
     name = "landwatch-spider"
-    domain = DOMAIN
-    allowed_domains = [domain]
+    links_file = LISTING_LINKS_FILE
     custom_settings = {
         'FEEDS': {
             BROKER_LINKS_FILE: {
                 'format': 'csv',
                 'overwrite': True,
                 'fields': ['profile_link', 'root_page'],
+                'item_filter': 'landcrawler.dedup.RequiredFieldFilter',
+                'required_field': 'profile_link',
             },
             PROPERTY_LINKS_FILE: {
                 'format': 'csv',
                 'overwrite': True,
                 'fields': ['link', 'root_page'],
+                'item_filter': 'landcrawler.dedup.RequiredFieldFilter',
+                'required_field': 'link',
             },
         }
     }
 
-    def start_requests(self):
-        with open(LISTING_LINKS_FILE, 'r', encoding='utf-8') as links_file:
-            for index, row in enumerate(links_file):
-                if index == 0:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counts = None
+        self.pages_left = {}
+        self.started_links = 0
+
+    def resume(self):
+        # Links written before the interruption must not be written again.
+        for path, field in ((PROPERTY_LINKS_FILE, 'link'), (BROKER_LINKS_FILE, 'profile_link')):
+            if self.shards:
+                path = part_path(path, self.shard, self.shards)
+            if path.exists():
+                with open(path, 'r', encoding='utf-8', newline='') as links_file:
+                    for row in csv.DictReader(links_file):
+                        if row.get(field):
+                            self.seen[field].add(row[field])
+
+    def read_counts(self):
+        """Return listing counts of the start links of the links file.
+
+        """
+        counts = {}
+        with open(self.links_file, 'r', encoding='utf-8', newline='') as links_file:
+            for row in csv.DictReader(links_file):
+                count = row.get('count') or ''
+                if row.get('start_link') and count.isdigit():
+                    counts[row['start_link']] = int(count)
+        return counts
+
+    def link_requests(self, link):
+        if self.counts is None:
+            self.counts = self.read_counts()
+        priority = -self.started_links
+        self.started_links += 1
+        pages = listing_pages(self.counts.get(link))
+        self.pages_left[link] = pages
+        self.crawler.stats.inc_value('pagination/planned_pages', pages)
+        for page in range(1, pages + 1):
+            request = self.link_request(self.url(page_path(link, page)), link)
+            request.priority = priority
+            request.meta['last_page'] = page == pages
+            yield request
+
+    def page_done(self, response):
+        link = response.meta.get('frontier_link')
+        left = self.pages_left.get(link)
+        if left is None:
+            # The start link has failed already.
+            return
+        if left > 1:
+            self.pages_left[link] = left - 1
+        else:
+            del self.pages_left[link]
+            self.link_done(response)
+
+    def link_failed(self, failure):
+        link = failure.request.meta.get('frontier_link')
+        if self.pages_left.pop(link, None) is not None:
+            super().link_failed(failure)
+        else:
+            self.logger.error("Request %s failed: %r", failure.request.url, failure.value)
+
+    @staticmethod
+    def extract_cards(page):
+        """Return ``(link, profile_link, card text)`` of every listing card and the next page url.
+
+        The cards and their links come from one evaluation of CARD_NODES.
+
+        """
+        with timer('selector/build'):
+            root = html_root(page)
+        with timer('selector/cards'):
+            cards = []
+            card = None
+            for node in CARD_NODES(root):
+                if not isinstance(node, str):
+                    card = None
+                    if has_class(node, CARD_CLASS):
+                        card = [None, None, NORMALIZED_TEXT(node)]
+                        cards.append(card)
                     continue
-                row = row.replace("\n", "")
-                if row:
-                    url = row.split(',')[0]
-                    yield scrapy.Request(f'https://{self.domain}{url}', callback=self.parse)
+                if card is None:
+                    continue
+                # The href of a link, whose parent div tells which one.
+                div = node.getparent().getparent()
+                if has_class(div, PROPERTY_LINK_CLASS):
+                    field = 0
+                elif has_class(div, BROKER_LINK_CLASS):
+                    field = 1
+                else:
+                    continue
+                if card[field] is None:
+                    card[field] = str(node)
+            next_page_urls = NEXT_PAGE_URL(root)
+        next_page_url = str(next_page_urls[0]) if next_page_urls else None
+        return [tuple(card) for card in cards], next_page_url
 
-    def parse(self, response, **kwargs):
-        item_containers = response.css('div._51c43')
-        for item_container in item_containers:
-            yield {
-                "link": item_container.css('div._12a2b').xpath('a/@href').get(),
-                "profile_link": item_container.css('div.dc7c2').xpath('a/@href').get(),
-                "root_page": response.url,
-            }
-        next_page_url = response.css('a.d72c6:last-child').xpath('@href').get()
-        if next_page_url is not None:
-            yield scrapy.Request(url=f'https://{self.domain}{next_page_url}')
+    async def parse(self, response, **kwargs):
+        cards, next_page_url = await self.extract(self.extract_cards, page_source(response))
+        for link, profile_link, card_text in cards:
+            link = self.first_seen('link', link)
+            profile_link = self.first_seen('profile_link', profile_link)
+            if self.fingerprints is not None:
+                # A property is fetched again only if its listing card changed,
+                # a broker only if it is new.
+                owner = response.meta.get('frontier_link')
+                if link is not None and not self.changed(owner, link, [card_text]):
+                    link = None
+                if profile_link is not None and not self.changed(owner, profile_link, []):
+                    profile_link = None
+            if link is None and profile_link is None:
+                continue
+            yield ListingLinks(link=link, profile_link=profile_link, root_page=response.url)
+        if next_page_url is not None and response.meta.get('last_page', True):
+            link = response.meta.get('frontier_link')
+            if link in self.pages_left:
+                self.pages_left[link] += 1
+                self.crawler.stats.inc_value('pagination/followed_pages')
+            request = self.link_request(self.url(next_page_url), link)
+            request.priority = response.request.priority
+            yield request
+        self.page_done(response)
 
 
-class BaseDetailsSpider(scrapy.Spider):
+class BaseDetailsSpider(LinksFileSpider):
     """The spider which is used as a base for collecting broker and property details.
 
+    A link is scraped once its item is handed to the feeds, and done once
+    they are flushed. Pages whose serverState can not
+    be read raise ParseFailure, see ``landcrawler.failures``. With
+    DETAILS_FEED_FORMAT set to ``parquet`` the feeds are written as Parquet
+    typed by ``field_types``.
+
     """
-    domain = DOMAIN
-    allowed_domains = [domain]
-    links_file = None
+    field_types = {}
+    item_class = None
+    # Statuses of listings which are gone, other failed links still exist.
+    gone_statuses = {404, 410}
 
-    def start_requests(self):
-        with open(self.links_file, 'r', encoding='utf-8') as links_file:
-            for index, row in enumerate(links_file):
-                if index == 0:
-                    continue
-                row = row.replace("\n", "")
-                if row:
-                    url = row.split(',')[0]
-                    yield scrapy.Request(f'https://{self.domain}{url}', callback=self.parse)
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if spider.frontier is not None:
+            crawler.signals.connect(spider.item_written, signal=signals.item_scraped)
+            crawler.signals.connect(spider.item_written, signal=signals.item_dropped)
+        return spider
 
-    def parse(self, response, **kwargs):
-        """Implementation of 'parse' method should be specified in its child class.
+    def output_feeds(self, feeds):
+        if self.settings.get('DETAILS_FEED_FORMAT') == 'parquet':
+            return parquet_feeds(feeds, self.field_types)
+        return feeds
+
+    def item_written(self, item, response):
+        self.link_done(response)
+
+    def link_seen(self, link):
+        """Tell the change history that ``link`` still exists though it gave no item.
 
         """
-        raise NotImplementedError(f'{self.__class__.__name__}.parse callback is not defined')
+        self.crawler.signals.send_catch_log(link_seen, link=link, item_class=self.item_class)
+
+    def link_failed(self, failure):
+        super().link_failed(failure)
+        response = getattr(failure.value, 'response', None)
+        if response is None or response.status not in self.gone_statuses:
+            self.link_seen(original_url(failure.request))
+
+    def parse_failed(self, response):
+        super().parse_failed(response)
+        self.link_seen(original_url(response.request))
+
+    @classmethod
+    def extract_item(cls, page, page_url):
+        """Implementation of 'extract_item' method should be specified in its child class.
+
+        It builds the item from the page, see ``page_source``, and may run in
+        a parse pool worker.
+
+        """
+        raise NotImplementedError(f'{cls.__name__}.extract_item is not defined')
+
+    @classmethod
+    def server_state_member(cls, page, page_url, key):
+        """Return the ``key`` member of the ``projection`` of the page serverState.
+
+        Raises ParseFailure when serverState is missing, malformed or has no ``key``.
+
+        """
+        try:
+            page_data = extract_server_state(page, cls.projection, page_url)
+        except ValueError as error:
+            raise ParseFailure.of_page(page, f'malformed serverState: {error}') from None
+        if page_data is None:
+            raise ParseFailure.of_page(page, 'no serverState')
+        if key not in page_data:
+            raise ParseFailure.of_page(page, f'no {key} in serverState')
+        return page_data[key]
+
+    def link_request(self, url, link):
+        request = super().link_request(url, link)
+        if self.fingerprints is not None:
+            request.meta['handle_httpstatus_list'] = [304]
+            previous = self.fingerprints.get(link)
+            if previous is not None:
+                _, etag, last_modified = previous
+                if etag:
+                    request.headers['If-None-Match'] = etag
+                if last_modified:
+                    request.headers['If-Modified-Since'] = last_modified
+        return request
+
+    async def parse(self, response, **kwargs):
+        if response.status == 304:
+            self.crawler.stats.inc_value('incremental/not_modified')
+            self.link_done(response)
+            return
+        item = await self.extract(self.extract_item, page_source(response), response.url)
+        if self.fingerprints is not None:
+            values = [value for field, value in sorted(ItemAdapter(item).items()) if field != 'link']
+            link = response.meta['frontier_link']
+            if not self.changed(link, link, values, response):
+                self.link_done(response)
+                return
+        yield item
 
 
 class BrokerProfileSpider(BaseDetailsSpider):
@@ -195,57 +854,47 @@ class BrokerProfileSpider(BaseDetailsSpider):
     """
     name = "broker-details-spider"
     links_file = BROKER_LINKS_FILE
+    item_class = BrokerDetails
     address_fields = dict(zip(
         ADDRESS_FIELDS,
         ['companyAddress1', 'companyAddress2', 'companyCity', 'companyState', 'companyZip']
     ))
+    details_fields = {
+        'contactName': 'contactName',
+        'companyName': 'companyName',
+        'phoneCell': 'phoneCell',
+        'phoneOffice': 'phoneOffice',
+        'email': 'email',
+        'companyWebsite': 'url',
+    }
+    projection = {
+        'brokerDetails': dict.fromkeys(
+            list(details_fields.values()) + list(address_fields.values())),
+    }
     custom_settings = {
         'FEEDS': {
             BROKER_DETAILS_FILE: {
                 'format': 'csv',
                 'overwrite': True,
-                'fields': [
-                    'link', 'contactName', 'companyName', 'phoneCell',
-                    'phoneOffice', 'email', 'companyWebsite',
-                ] + ADDRESS_FIELDS,
+                'fields': ['link'] + list(details_fields) + ADDRESS_FIELDS,
             },
         }
     }
 
-    def parse(self, response, **kwargs):
-        page_url = response.url
-        item = {
+    @classmethod
+    def extract_item(cls, page, page_url):
+        values = {
             'link': page_url,
         }
-        script_text = response.xpath(
-            '//script[contains(text(), "brokerDetails")]/text()').get()
-        page_data_prep = _script_string_to_json_prep(script_text, page_url)
-        try:
-            broker_details = re.findall(
-                r'"breadCrumbSchema":.+?,"brokerDetails":(.*),"carouselCounts"', page_data_prep)[0]
-            broker_details = re.sub(
-                r'"description":((?:(?!"description":).)*?),"email"',
-                r'"description":"","email"',
-                broker_details
-            )
-            broker_details = json.loads(broker_details)
-            if broker_details:
-                item['contactName'] = broker_details.get('contactName', '')
-                item['companyName'] = broker_details.get('companyName', '')
-                item['phoneCell'] = broker_details.get('phoneCell', '')
-                item['phoneOffice'] = broker_details.get('phoneOffice', '')
-                item['email'] = broker_details.get('email', '')
-                item['companyWebsite'] = broker_details.get('url', '')
-                for item_field, field in self.address_fields.items():
-                    item[item_field] = broker_details.get(field, '')
-            else:
-                logging.info("Broker page %s is empty.", response.url)
-        except (IndexError, ValueError):
-            logging.error(
-                "Something is wrong with 'window.serverState' content of broker page %s.",
-                page_url
-            )
-        yield item
+        broker_details = cls.server_state_member(page, page_url, 'brokerDetails')
+        if broker_details:
+            for item_field, field in cls.details_fields.items():
+                values[item_field] = broker_details.get(field, '')
+            for item_field, field in cls.address_fields.items():
+                values[item_field] = broker_details.get(field, '')
+        else:
+            logging.info("Broker page %s is empty.", page_url)
+        return BrokerDetails(**values)
 
 
 class PropertyDetailsSpider(BaseDetailsSpider):
@@ -254,11 +903,18 @@ class PropertyDetailsSpider(BaseDetailsSpider):
     """
     name = "property-details-spider"
     links_file = PROPERTY_LINKS_FILE
+    item_class = PropertyDetails
     address_fields = dict(zip(
         ADDRESS_FIELDS,
         ['address1', 'address2', 'city', 'stateAbbreviation', 'zip']
     ))
     home_fields = ['homesqft', 'beds', 'baths', 'halfBaths']
+    field_types = {'price': 'int64', 'acres': 'float64'} | dict.fromkeys(home_fields, 'int64')
+    projection = {
+        'propertyData': dict.fromkeys(
+            ['status', 'title', 'price', 'acres', 'types', 'externalLink'] + home_fields
+        ) | {'address': dict.fromkeys(address_fields.values())},
+    }
     custom_settings = {
         'FEEDS': {
             PROPERTY_DETAILS_FILE: {
@@ -273,44 +929,128 @@ class PropertyDetailsSpider(BaseDetailsSpider):
         }
     }
 
-    def parse(self, response, **kwargs):
-        page_url = response.url
-        item = {
+    @classmethod
+    def extract_item(cls, page, page_url):
+        with timer('selector/broker_link'):
+            broker_link = tag_attribute(page, 'a', 'd51ec', 'href')
+        values = {
             'link': page_url,
-            'brokerLink': response.css('a.d51ec').xpath('@href').get(),
+            'brokerLink': broker_link,
         }
-        script_text = response.xpath(
-            '//script[contains(text(), "propertyDetailPage")]/text()').get()
-        page_data_prep = _script_string_to_json_prep(script_text, page_url)
-        try:
-            property_details = re.findall(
-                r'"propertyData":(.*),"propertyEvents"', page_data_prep)[0]
-            property_details = re.sub(
-                r'"description":((?:(?!"description":).)*?),"directions"',
-                r'"description":"","directions"',
-                property_details
-            )
-            property_details = re.sub(
-                r'"breadcrumbSchema.*smallMapUrl',
-                r'"smallMapUrl',
-                property_details
+        property_details = cls.server_state_member(page, page_url, 'propertyData')
+        if property_details:
+            values['status'] = property_details.get('status')
+            values['title'] = property_details.get('title', '')
+            values['price'] = property_details.get('price', '')
+            values['acres'] = property_details.get('acres', '')
+            if property_details.get('address'):
+                for item_field, field in cls.address_fields.items():
+                    values[item_field] = property_details['address'].get(field, '')
+            for field in cls.home_fields:
+                values[field] = property_details.get(field, '')
+            values['type'] = ', '.join(property_details.get('types', []))
+            values['propertyWebsite'] = property_details.get('externalLink', '')
+        return PropertyDetails(**values)
+
+
+def _feeds_of(spider_class, item_class):
+    """Return the FEEDS of ``spider_class`` restricted to items of ``item_class``.
+
+    """
+    return {uri: dict(options, item_classes=[item_class])
+            for uri, options in spider_class.custom_settings['FEEDS'].items()}
+
+
+class FusedLandSpider(ListingLinksMixin, ListingPagesSpider):
+    """Spider which runs the four stages in one crawl.
+
+    Filter pages are walked like ListingPagesSpider does, the listing pages
+    of a bucket are requested as soon as the bucket is planned and every
+    new property and broker link of a listing page is requested at once,
+    with ``details_priority``, so details are fetched while pagination goes
+    on. Listing pages of earlier buckets go first, like in
+    LandsForSaleSpider. The feeds of the four spiders are written as they
+    write them. Links go nowhere but to the feeds, so there is no frontier
+    and an interrupted run starts over.
+
+    """
+    name = "fused-spider"
+    details_priority = 100
+    custom_settings = {
+        'FEEDS': {
+            **_feeds_of(ListingPagesSpider, ListingPage),
+            **_feeds_of(LandsForSaleSpider, ListingLinks),
+            **_feeds_of(BrokerProfileSpider, BrokerDetails),
+            **_feeds_of(PropertyDetailsSpider, PropertyDetails),
+        }
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+        if settings.get('DETAILS_FEED_FORMAT') == 'parquet':
+            feeds = settings.getdict('FEEDS')
+            for spider_class in (BrokerProfileSpider, PropertyDetailsSpider):
+                details = {uri: feeds.pop(uri) for uri in spider_class.custom_settings['FEEDS']}
+                feeds.update(parquet_feeds(details, spider_class.field_types))
+            settings.set('FEEDS', feeds, priority=settings.getpriority('FEEDS'))
+        return spider
+
+    def bucket_outputs(self, start_link, count, root_page):
+        yield from super().bucket_outputs(start_link, count, root_page)
+        priority = -1 - self.buckets
+        self.buckets += 1
+        pages = listing_pages(count)
+        self.crawler.stats.inc_value('pagination/planned_pages', pages)
+        for page in range(1, pages + 1):
+            yield scrapy.Request(
+                url=self.url(page_path(start_link, page)),
+                callback=self.parse_listing,
+                errback=self.request_failed,
+                priority=priority,
+                meta={'last_page': page == pages},
             )
-            property_details = json.loads(property_details)
-            if property_details:
-                item['status'] = STATUSES.get(property_details.get('status', ''))
-                item['title'] = property_details.get('title', '')
-                item['price'] = property_details.get('price', '')
-                item['acres'] = property_details.get('acres', '')
-                if property_details.get('address'):
-                    for item_field, field in self.address_fields.items():
-                        item[item_field] = property_details['address'].get(field, '')
-                for field in self.home_fields:
-                    item[field] = property_details.get(field, '')
-                item['type'] = ', '.join(property_details.get('types', []))
-                item['propertyWebsite'] = property_details.get('externalLink', '')
-        except (IndexError, ValueError):
-            logging.error(
-                "Something is wrong with 'window.serverState' content of property page %s.",
-                page_url
+
+    def details_request(self, link, callback):
+        return scrapy.Request(
+            url=self.url(link),
+            callback=callback,
+            errback=self.request_failed,
+            priority=self.details_priority,
+        )
+
+    async def parse_listing(self, response):
+        cards, next_page_url = await self.extract(
+            LandsForSaleSpider.extract_cards, page_source(response))
+        for link, profile_link, _ in cards:
+            link = self.first_seen('link', link)
+            profile_link = self.first_seen('profile_link', profile_link)
+            if link is None and profile_link is None:
+                continue
+            yield ListingLinks(link=link, profile_link=profile_link, root_page=response.url)
+            if link is not None:
+                yield self.details_request(link, self.parse_property)
+            if profile_link is not None:
+                yield self.details_request(profile_link, self.parse_broker)
+        if next_page_url is not None and response.meta.get('last_page', True):
+            self.crawler.stats.inc_value('pagination/followed_pages')
+            yield scrapy.Request(
+                url=self.url(next_page_url),
+                callback=self.parse_listing,
+                errback=self.request_failed,
+                priority=response.request.priority,
             )
-        yield item
+
+    async def parse_property(self, response):
+        yield await self.extract(PropertyDetailsSpider.extract_item, page_source(response), response.url)
+
+    async def parse_broker(self, response):
+        yield await self.extract(BrokerProfileSpider.extract_item, page_source(response), response.url)
+
+    def request_failed(self, failure):
+        self.logger.error("Request %s failed: %r", failure.request.url, failure.value)
@@ -0,0 +1,96 @@
+import json
+
+from landcrawler.serverstate import extract_server_state, server_state_text
+
+
+def page(state):
+    """Return a page embedding ``state`` the way Landwatch serialises it."""
+    return f'<script>window.serverState = {json.dumps(json.dumps(state))};</script>'
+
+
+def test_top_level_keys():
+    state = {'propertyData': {'id': 7, 'description': 'long text'}, 'other': [1, 2]}
+    assert extract_server_state(page(state), ['propertyData']) == {
+        'propertyData': {'id': 7, 'description': ''},
+    }
+
+
+def test_missing_server_state():
+    assert extract_server_state('<html></html>', ['propertyData']) is None
+
+
+def test_missing_key():
+    assert extract_server_state(page({'other': 1}), ['propertyData']) == {}
+
+
+def test_projection():
+    state = {'propertyData': {'id': 7, 'price': 1000, 'broker': {'name': 'A', 'phone': '1'}}}
+    projection = {'propertyData': {'id': None, 'broker': {'name': None}}}
+    assert extract_server_state(page(state), projection) == {
+        'propertyData': {'id': 7, 'broker': {'name': 'A'}},
+    }
+
+
+def test_javascript_only_escapes():
+    script = ('window.serverState = "{\\"propertyData\\":'
+              '{\\"title\\":\\"It\\\'s \\x41\\u0042\\"}}";')
+    assert extract_server_state(script, ['propertyData']) == {
+        'propertyData': {'title': "It's AB"},
+    }
+
+
+def test_closing_sequence_inside_values():
+    state = {'propertyData': {'title': 'a";b', 'path': 'c:\\";'}, 'after': 'x";'}
+    text = page(state) + '\nvar next = "y";'
+    assert json.loads(server_state_text(text)) == state
+    assert extract_server_state(text, ['propertyData', 'after']) == state
+
+
+def test_nested_stringified_value():
+    state = {'propertyDetailPage': json.dumps({'propertyData': {'id': 7, 'description': 'x'}})}
+    assert extract_server_state(page(state), ['propertyData']) == {
+        'propertyData': {'id': 7, 'description': ''},
+    }
+    assert extract_server_state(page(state), {'propertyData': {'id': None}}) == {
+        'propertyData': {'id': 7},
+    }
+
+
+def test_doubly_nested_stringified_value():
+    inner = json.dumps({'propertyData': {'id': 7}})
+    state = {'page': json.dumps({'detail': inner}), 'other': 'propertyData'}
+    assert extract_server_state(page(state), ['propertyData']) == {'propertyData': {'id': 7}}
+
+
+def test_top_level_key_wins_over_nested_one():
+    state = {'nested': json.dumps({'propertyData': {'id': 1}}), 'propertyData': {'id': 2}}
+    assert extract_server_state(page(state), ['propertyData']) == {'propertyData': {'id': 2}}
+
+
+def test_stringified_member_is_decoded():
+    state = {'propertyData': {'broker': json.dumps({'name': 'A'})}}
+    assert extract_server_state(page(state), ['propertyData']) == {
+        'propertyData': {'broker': {'name': 'A'}},
+    }
+
+
+def test_bytes_input():
+    state = {'propertyData': {'title': 'Café ";', 'id': 7}}
+    assert extract_server_state(page(state).encode(), ['propertyData']) == state
+
+
+def test_bytes_input_with_javascript_only_escapes():
+    script = 'window.serverState = "{\\"propertyData\\":{\\"title\\":\\"Café \\x41\\"}}";'
+    assert extract_server_state(script.encode(), ['propertyData']) == {
+        'propertyData': {'title': 'Café A'},
+    }
+
+
+def test_malformed_member_raises():
+    script = 'window.serverState = "{\\"propertyData\\":{\\"id\\" 7}}";'
+    try:
+        extract_server_state(script, ['propertyData'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('ValueError not raised')